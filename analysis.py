@@ -0,0 +1,296 @@
+import argparse
+import glob
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+from columnar import load_columnar
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    environment TEXT NOT NULL,
+    algorithm TEXT NOT NULL,
+    seed_tag TEXT NOT NULL,
+    UNIQUE (environment, algorithm, seed_tag)
+);
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    run_id INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    offset INTEGER NOT NULL,
+    fingerprint TEXT
+);
+CREATE TABLE IF NOT EXISTS metrics (
+    run_id INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    step INTEGER NOT NULL,
+    key TEXT NOT NULL,
+    value REAL
+);
+CREATE INDEX IF NOT EXISTS metrics_lookup ON metrics (run_id, kind, key, step);
+"""
+
+EVAL_COLUMNS = [
+    ('episode_reward', 'Episode Reward'),
+    ('episode_reward_color_easy', 'Color Easy'),
+    ('episode_reward_color_hard', 'Color Hard'),
+    ('episode_reward_video_easy', 'Video Easy'),
+    ('episode_reward_video_hard', 'Video Hard'),
+]
+
+
+def connect(db_path):
+    conn = sqlite3.connect(db_path)
+    conn.executescript(SCHEMA)
+    columns = [row[1] for row in conn.execute('PRAGMA table_info(files)')]
+    if 'fingerprint' not in columns:
+        conn.execute('ALTER TABLE files ADD COLUMN fingerprint TEXT')
+    return conn
+
+
+def fingerprint(path):
+    """Inode and hash of the first line of a log, which change when the log is rewritten rather than appended to"""
+    with open(path, 'rb') as f:
+        first_line = f.readline(1 << 16)
+    return '%d:%s' % (os.stat(path).st_ino, hashlib.sha1(first_line).hexdigest())
+
+
+def _rows_from_records(records):
+    rows = []
+    for record in records:
+        step = record.get('step')
+        if step is None:
+            continue
+        for key, value in record.items():
+            if key == 'step' or value is None:
+                continue
+            value = float(value)
+            if np.isnan(value):
+                continue
+            rows.append((int(step), key, value))
+    return rows
+
+
+def parse_log(path, offset):
+    """Parses the complete lines of a JSON-lines log from a byte offset"""
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        raw = f.read()
+    end = raw.rfind(b'\n') + 1
+    records = [json.loads(line) for line in raw[:end].splitlines() if line.strip()]
+    return _rows_from_records(records), offset + end
+
+
+def parse_columnar(prefix, offset):
+    """Parses a columnar log, skipping the first `offset` rows"""
+    columns = load_columnar(prefix)
+    if 'step' not in columns:
+        return [], offset
+    n = len(columns['step'])
+    records = [
+        {key: col[i].item() for key, col in columns.items()}
+        for i in range(offset, n)
+    ]
+    return _rows_from_records(records), n
+
+
+def _parse(task):
+    path, fmt, offset = task
+    if fmt == 'json':
+        return parse_log(path, offset)
+    return parse_columnar(path, offset)
+
+
+def discover(log_root):
+    """Yields (environment, algorithm, seed_tag, kind, path, format) for every log under log_root"""
+    for run_dir in sorted(glob.glob(os.path.join(log_root, '*', '*', '*'))):
+        if not os.path.isdir(run_dir):
+            continue
+        rel = os.path.relpath(run_dir, log_root)
+        environment, algorithm, seed_tag = rel.split(os.sep)
+        for kind in ('train', 'eval'):
+            json_path = os.path.join(run_dir, kind + '.log')
+            col_prefix = os.path.join(run_dir, kind)
+            if os.path.exists(json_path):
+                yield environment, algorithm, seed_tag, kind, json_path, 'json'
+            elif os.path.exists(col_prefix + '.idx'):
+                yield environment, algorithm, seed_tag, kind, col_prefix, 'columnar'
+
+
+def _run_id(conn, environment, algorithm, seed_tag):
+    conn.execute(
+        'INSERT OR IGNORE INTO runs (environment, algorithm, seed_tag) VALUES (?, ?, ?)',
+        (environment, algorithm, seed_tag))
+    return conn.execute(
+        'SELECT id FROM runs WHERE environment=? AND algorithm=? AND seed_tag=?',
+        (environment, algorithm, seed_tag)).fetchone()[0]
+
+
+def ingest(conn, log_root, num_workers=None):
+    """Adds every record that is not yet in the database, returns the number of new rows"""
+    tasks, meta = [], []
+    for environment, algorithm, seed_tag, kind, path, fmt in discover(log_root):
+        run_id = _run_id(conn, environment, algorithm, seed_tag)
+        row = conn.execute('SELECT offset, fingerprint FROM files WHERE path=?', (path,)).fetchone()
+        offset = 0 if row is None else row[0]
+        # a rewritten log (e.g. an --overwrite rerun) is ingested again from the start
+        file_id = fingerprint(path if fmt == 'json' else path + '.idx')
+        if row is not None and (row[1] != file_id or (fmt == 'json' and os.path.getsize(path) < offset)):
+            conn.execute('DELETE FROM metrics WHERE run_id=? AND kind=?', (run_id, kind))
+            offset = 0
+        if fmt == 'json' and os.path.getsize(path) == offset:
+            continue
+        tasks.append((path, fmt, offset))
+        meta.append((run_id, kind, path, file_id))
+
+    if len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=num_workers) as pool:
+            results = list(pool.map(_parse, tasks, chunksize=4))
+    else:
+        results = [_parse(task) for task in tasks]
+
+    total = 0
+    for (run_id, kind, path, file_id), (rows, offset) in zip(meta, results):
+        conn.executemany(
+            'INSERT INTO metrics (run_id, kind, step, key, value) VALUES (?, ?, ?, ?, ?)',
+            [(run_id, kind, step, key, value) for step, key, value in rows])
+        conn.execute(
+            'INSERT OR REPLACE INTO files (path, run_id, kind, offset, fingerprint) VALUES (?, ?, ?, ?, ?)',
+            (path, run_id, kind, offset, file_id))
+        total += len(rows)
+    conn.commit()
+    return total
+
+
+def parse_group(spec):
+    """Parses NAME=ALGORITHM:SEED_TAG[,SEED_TAG...]"""
+    name, rest = spec.split('=', 1)
+    algorithm, seed_tags = rest.split(':', 1)
+    return name, algorithm, seed_tags.split(',')
+
+
+def _run_ids(conn, environment, algorithm, seed_tags):
+    marks = ','.join('?' * len(seed_tags))
+    rows = conn.execute(
+        f'SELECT id FROM runs WHERE environment=? AND algorithm=? AND seed_tag IN ({marks})',
+        (environment, algorithm, *seed_tags)).fetchall()
+    return [r[0] for r in rows]
+
+
+def curve(conn, run_ids, kind, key, bin_size, z=1.96):
+    """Mean and confidence band of a metric per step bin, over runs.
+
+    Records are first averaged per run within each bin, so every run counts
+    as one sample; bins covered by a single run get a zero-width band.
+    """
+    marks = ','.join('?' * len(run_ids))
+    rows = conn.execute(
+        f'SELECT bin, AVG(run_mean), AVG(run_mean * run_mean), COUNT(*) FROM ('
+        f'SELECT (step / ?) * ? AS bin, run_id, AVG(value) AS run_mean '
+        f'FROM metrics WHERE kind=? AND key=? AND run_id IN ({marks}) '
+        f'GROUP BY bin, run_id) '
+        f'GROUP BY bin ORDER BY bin',
+        (bin_size, bin_size, kind, key, *run_ids)).fetchall()
+    if len(rows) == 0:
+        return np.zeros(0), np.zeros(0), np.zeros(0)
+    steps, mean, sq_mean, count = (np.asarray(c, dtype=np.float64) for c in zip(*rows))
+    var = np.maximum(sq_mean - mean ** 2, 0) * count / np.maximum(count - 1, 1)
+    half_width = z * np.sqrt(var / count)
+    return steps, mean, half_width
+
+
+def values_at(conn, run_ids, kind, key, step):
+    marks = ','.join('?' * len(run_ids))
+    rows = conn.execute(
+        f'SELECT value FROM metrics WHERE kind=? AND key=? AND step=? AND run_id IN ({marks})',
+        (kind, key, step, *run_ids)).fetchall()
+    return np.asarray([r[0] for r in rows], dtype=np.float64)
+
+
+def plot_curves(conn, args, groups, kind, key, ylabel, out_path):
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    sns.set(style='darkgrid')
+    plt.figure(figsize=(10, 6))
+    palette = sns.color_palette(n_colors=len(groups))
+    for color, (name, algorithm, seed_tags) in zip(palette, groups):
+        run_ids = _run_ids(conn, args.environment, algorithm, seed_tags)
+        steps, mean, half_width = curve(conn, run_ids, kind, key, args.bin_size)
+        plt.plot(steps, mean, color=color, label=name)
+        plt.fill_between(steps, mean - half_width, mean + half_width, color=color, alpha=0.2)
+    plt.xlabel('Step')
+    plt.ylabel(ylabel)
+    plt.title(args.environment)
+    plt.legend(title='Algorithm')
+    plt.savefig(out_path)
+    plt.close()
+    print('Saved', out_path)
+
+
+def eval_table(conn, args, groups):
+    header = ['Algorithm']
+    for _, column in EVAL_COLUMNS[1:]:
+        header += [column, 'bound']
+    lines = [','.join(header)]
+    for name, algorithm, seed_tags in groups:
+        run_ids = _run_ids(conn, args.environment, algorithm, seed_tags)
+        row = [name]
+        for key, _ in EVAL_COLUMNS[1:]:
+            values = values_at(conn, run_ids, 'eval', key, args.final_step)
+            if len(values) == 0:
+                row += ['', '']
+            else:
+                row += [str(int(values.mean())), str(int(values.std()))]
+        lines.append(','.join(row))
+        print(' | '.join(row))
+    out_path = 'eval_{}.csv'.format(args.environment)
+    with open(out_path, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+    print('Saved', out_path)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('command', choices=['ingest', 'train', 'eval'])
+    parser.add_argument('--log_root', default='./logs')
+    parser.add_argument('--db', default=None, help='defaults to <log_root>/runs.sqlite')
+    parser.add_argument('--environment')
+    parser.add_argument('--group', action='append', default=[],
+                        help='NAME=ALGORITHM:SEED_TAG[,SEED_TAG...], may be repeated')
+    parser.add_argument('--bin_size', default=10000, type=int)
+    parser.add_argument('--final_step', default=500000, type=int)
+    parser.add_argument('--num_workers', default=None, type=int)
+    args = parser.parse_args()
+    if args.db is None:
+        args.db = os.path.join(args.log_root, 'runs.sqlite')
+    if args.command != 'ingest':
+        assert args.environment is not None, 'must provide an environment'
+        assert len(args.group) > 0, 'must provide at least one group'
+    return args
+
+
+def main(args):
+    conn = connect(args.db)
+    print('Ingested', ingest(conn, args.log_root, args.num_workers), 'new rows into', args.db)
+    groups = [parse_group(spec) for spec in args.group]
+    if args.command == 'train':
+        plot_curves(conn, args, groups, 'train', 'episode_reward', 'Episode Reward',
+                    '{}.png'.format(args.environment))
+    elif args.command == 'eval':
+        for key, column in EVAL_COLUMNS:
+            plot_curves(conn, args, groups, 'eval', key, column,
+                        'eval_{}_{}.png'.format(args.environment, key))
+        eval_table(conn, args, groups)
+    conn.close()
+
+
+if __name__ == '__main__':
+    main(parse_args())
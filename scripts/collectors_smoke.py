@@ -0,0 +1,83 @@
+"""Runs the collector-fed learner loop on the synthetic environment and checks its counters.
+
+    python scripts/collectors_smoke.py
+    python scripts/collectors_smoke.py --num_collectors 3 --train_steps 1000 --algorithm drq
+
+Any src/arguments.py flag can be passed; the defaults below keep the run to
+a few hundred steps of a small agent on the cpu. Exits with status 1 when a
+check fails.
+"""
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+
+DEFAULTS = [
+    '--domain_name', 'synthetic', '--algorithm', 'sac', '--num_collectors', '2',
+    '--train_steps', '400', '--init_steps', '100', '--episode_length', '200', '--action_repeat', '4',
+    '--batch_size', '16', '--hidden_dim', '64', '--eval_mode', 'none', '--device', 'cpu',
+    '--max_updates_per_iter', '4', '--collector_sync_freq', '20'
+]
+
+
+def main():
+    sys.argv = sys.argv[:1] + DEFAULTS + sys.argv[1:]
+    import utils
+    import checkpoint
+    from arguments import parse_args
+    from envs import make_env
+    from algorithms.factory import make_agent
+    from logger import Logger
+    from train import train_with_collectors
+
+    args = parse_args()
+    utils.set_seed_everywhere(args.seed)
+    utils.setup_device(args)
+    env = make_env(
+        domain_name=args.domain_name,
+        task_name=args.task_name,
+        seed=args.seed,
+        episode_length=args.episode_length,
+        action_repeat=args.action_repeat,
+        image_size=args.image_size,
+        mode='train'
+    )
+    replay_buffer = utils.ReplayBuffer(
+        obs_shape=env.observation_space.shape,
+        action_shape=env.action_space.shape,
+        capacity=args.train_steps + 1024,
+        batch_size=args.batch_size,
+        args=args
+    )
+    agent = make_agent(
+        obs_shape=(3*args.frame_stack, args.image_crop_size, args.image_crop_size),
+        action_shape=env.action_space.shape,
+        args=args
+    )
+    with tempfile.TemporaryDirectory() as work_dir:
+        L = Logger(work_dir, log_format='json', async_write=False)
+        checkpointer = checkpoint.Checkpointer(utils.make_dir(os.path.join(work_dir, 'model')))
+        _, counters = train_with_collectors(args, env, agent, replay_buffer, None, {}, None, L, work_dir, checkpointer)
+        checkpointer.close()
+        L.close()
+
+    target_updates = int((counters['env_steps'] - args.init_steps) * args.utd_ratio)
+    episode_steps = args.episode_length // args.action_repeat
+    checks = {
+        'reached train_steps': counters['env_steps'] >= args.train_steps,
+        'every drained step is in the replay buffer': replay_buffer.num_added == counters['env_steps'],
+        'collectors stepped at least the drained steps': counters['collected_steps'] >= counters['env_steps'],
+        'learner updated': 0 < counters['num_updates'] <= target_updates,
+        'finished episodes were reported': counters['episode'] >= counters['env_steps'] // episode_steps - args.num_collectors,
+    }
+    print(counters)
+    for name, passed in checks.items():
+        print('%-48s %s' % (name, 'ok' if passed else 'FAILED'))
+    if not all(checks.values()):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +0,0 @@
-CUDA_VISIBLE_DEVICES=0 python3 src/train.py \
-	--algorithm curl \
-	--aux_update_freq 1 \
-	--seed 0
\ No newline at end of file
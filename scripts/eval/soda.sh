@@ -1,4 +0,0 @@
-CUDA_VISIBLE_DEVICES=0 python3 src/eval.py \
-	--algorithm soda \
-	--eval_episodes 100 \
-	--seed 0
\ No newline at end of file
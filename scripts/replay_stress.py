@@ -0,0 +1,270 @@
+"""Stress test and throughput benchmark of the shared-memory replay buffer (src/shm_replay.py).
+
+    python scripts/replay_stress.py stress --writers 4 --samplers 4 --capacity 256
+    python scripts/replay_stress.py throughput --writers 1,2,4 --samplers 0,2 --out replay_throughput.json
+
+stress: writers add transitions whose frames, action and reward all encode
+(writer, step), in a small buffer so that writers lap each other, while
+samplers check that every sampled transition is one that was written, in
+one piece, and that the id reported for it is its own: a transition keeps
+one id, and a writer's later steps have larger ids. Every other sampler
+draws through prefetch(--prefetch batches) instead of one batch at a time.
+At the end the buffer must hold the last `capacity` transitions
+of the run, each writer's in the order it added them, and the counters
+must match.
+
+throughput: transitions added per second by the writers and transitions
+sampled per second by the samplers for each combination of writer and
+sampler counts, next to a single-process utils.ReplayBuffer.
+"""
+import argparse
+import json
+import multiprocessing as mp
+import os
+import sys
+import time
+from argparse import Namespace
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+import utils
+from shm_replay import ShmReplayBuffer
+
+
+def frame_value(writer, step):
+    return (writer * 97 + step) % 256
+
+
+def make_transition(writer, step, frame_stack, frame_size):
+    frames = [np.full((3, frame_size, frame_size), frame_value(writer, step + j), dtype=np.uint8)
+              for j in range(frame_stack + 1)]
+    obs = np.concatenate(frames[:-1])
+    next_obs = np.concatenate(frames[1:])
+    action = np.array([writer, step], dtype=np.float32)
+    return obs, action, float(step), next_obs, step % 10 == 9
+
+
+def check_batch(batch, ids, frame_stack):
+    """Number of transitions in a batch that are not a transition that was written"""
+    obs, actions, rewards, next_obs, not_dones = [x.numpy() for x in batch]
+    writer, step = actions[:, 0].astype(np.int64), actions[:, 1].astype(np.int64)
+    expected = np.stack([frame_value(writer, step + j) for j in range(frame_stack + 1)], axis=1)
+    frames = np.concatenate([obs, next_obs[:, -3:]], axis=1).reshape(len(obs), frame_stack + 1, -1)
+    torn = (frames.min(axis=2) != expected) | (frames.max(axis=2) != expected)
+    torn = torn.any(axis=1) | (rewards[:, 0] != step) | (not_dones[:, 0] != (step % 10 != 9)) | (ids < 0)
+    return int(torn.sum())
+
+
+def check_ids(batch, ids, seen):
+    """Number of transitions in a batch whose id is not the one reported before or out of order with its writer's"""
+    actions = batch[1].numpy().astype(np.int64)
+    writer, step = actions[:, 0], actions[:, 1]
+    bad = np.array([seen.setdefault((w, s), i) != i for w, s, i in zip(writer.tolist(), step.tolist(), ids.tolist())])
+    order = np.lexsort((ids, writer))
+    same_writer = writer[order][1:] == writer[order][:-1]
+    ordered = np.sign(np.diff(step[order])) == np.sign(np.diff(ids[order]))
+    bad[order[1:][same_writer & ~ordered]] = True
+    return int(bad.sum())
+
+
+def _writer(buffer, writer, num_steps, frame_stack, frame_size, start):
+    start.wait()
+    for step in range(num_steps):
+        buffer.add(*make_transition(writer, step, frame_stack, frame_size))
+
+
+def _sampler(buffer, frame_stack, prefetch, stop, start, results):
+    start.wait()
+    while len(buffer) == 0:
+        time.sleep(0)
+    num_batches, num_sampled, num_bad, num_bad_ids, seen = 0, 0, 0, 0, {}
+    source = buffer
+    while not stop.is_set():
+        if prefetch > 0 and num_batches % prefetch == 0:
+            source = buffer.prefetch(prefetch)
+        batch = source._take()
+        num_bad += check_batch(batch, source.last_ids, frame_stack)
+        num_bad_ids += check_ids(batch, source.last_ids, seen)
+        num_batches += 1
+        num_sampled += len(batch[0])
+    results.put({'batches': num_batches, 'sampled': num_sampled, 'bad': num_bad, 'bad_ids': num_bad_ids,
+                 'retries': buffer.retries, 'prefetch': prefetch})
+
+
+def stress(args):
+    buffer = ShmReplayBuffer(
+        obs_shape=(3*args.frame_stack, args.frame_size, args.frame_size),
+        action_shape=(2,),
+        capacity=args.capacity,
+        batch_size=args.batch_size,
+        args=Namespace(device='cpu')
+    )
+    start, stop, results = mp.Event(), mp.Event(), mp.Queue()
+    writers = [mp.Process(target=_writer, args=(buffer, w, args.steps, args.frame_stack, args.frame_size, start))
+               for w in range(args.writers)]
+    samplers = [mp.Process(target=_sampler, args=(buffer, args.frame_stack, args.prefetch if s % 2 else 0, stop, start, results))
+                for s in range(args.samplers)]
+    for p in writers + samplers:
+        p.start()
+    start.set()
+    for p in writers:
+        p.join()
+    stop.set()
+    sampler_results = [results.get() for _ in samplers]
+    for p in samplers:
+        p.join()
+
+    # the buffer holds the last capacity transitions, in one piece, and each writer's in the order it added them
+    num_added = args.writers * args.steps
+    batch, ids = buffer._gather(np.arange(min(num_added, args.capacity)))
+    actions = batch[1].numpy().astype(np.int64)
+    final_bad = check_batch(batch, ids, args.frame_stack)
+    by_id = actions[np.argsort(ids)]
+    in_order = all(np.all(np.diff(by_id[by_id[:, 0] == w, 1]) > 0) for w in range(args.writers))
+    report = {
+        'writers': args.writers,
+        'samplers': args.samplers,
+        'capacity': args.capacity,
+        'num_added': buffer.num_added,
+        'cursor': int(buffer.header[0]),
+        'sampled': sum(r['sampled'] for r in sampler_results),
+        'retries': sum(r['retries'] for r in sampler_results),
+        'prefetch_samplers': sum(r['prefetch'] > 0 for r in sampler_results),
+        'bad_samples': sum(r['bad'] for r in sampler_results),
+        'bad_ids': sum(r['bad_ids'] for r in sampler_results),
+        'bad_final': final_bad,
+        'ids_cover_last_capacity': sorted(ids.tolist()) == list(range(max(0, num_added - args.capacity), num_added)),
+        'writers_in_order': bool(in_order)
+    }
+    buffer.close()
+    report['passed'] = (report['num_added'] == report['cursor'] == num_added and report['bad_samples'] == report['bad_ids'] == 0
+                        and report['bad_final'] == 0 and report['ids_cover_last_capacity'] and report['writers_in_order'])
+    return report
+
+
+def _throughput_writer(buffer, writer, num_steps, frame_stack, frame_size, start, results):
+    transitions = [make_transition(writer, step, frame_stack, frame_size) for step in range(16)]
+    start.wait()
+    start_time = time.perf_counter()
+    for step in range(num_steps):
+        buffer.add(*transitions[step % 16])
+    results.put(('writer', num_steps, time.perf_counter() - start_time))
+
+
+def _throughput_sampler(buffer, stop, start, results):
+    start.wait()
+    while len(buffer) < buffer.batch_size:
+        time.sleep(0)
+    num_sampled, start_time = 0, time.perf_counter()
+    while not stop.is_set():
+        num_sampled += len(buffer._take()[0])
+    results.put(('sampler', num_sampled, time.perf_counter() - start_time))
+
+
+def throughput(args, num_writers, num_samplers):
+    buffer = ShmReplayBuffer(
+        obs_shape=(3*args.frame_stack, args.frame_size, args.frame_size),
+        action_shape=(2,),
+        capacity=args.capacity,
+        batch_size=args.batch_size,
+        args=Namespace(device='cpu')
+    )
+    # the clock starts once every process is up
+    start, stop, results = mp.Barrier(num_writers + num_samplers + 1), mp.Event(), mp.Queue()
+    writers = [mp.Process(target=_throughput_writer, args=(buffer, w, args.steps, args.frame_stack, args.frame_size, start, results))
+               for w in range(num_writers)]
+    samplers = [mp.Process(target=_throughput_sampler, args=(buffer, stop, start, results)) for _ in range(num_samplers)]
+    for p in writers + samplers:
+        p.start()
+    start.wait()
+    start_time = time.perf_counter()
+    for p in writers:
+        p.join()
+    elapsed = time.perf_counter() - start_time
+    stop.set()
+    measured = [results.get() for _ in writers + samplers]
+    for p in samplers:
+        p.join()
+    buffer.close()
+    sampled = [(n, s) for kind, n, s in measured if kind == 'sampler']
+    return {
+        'writers': num_writers,
+        'samplers': num_samplers,
+        'adds_per_second': num_writers * args.steps / elapsed,
+        'samples_per_second': sum(n / s for n, s in sampled if s > 0)
+    }
+
+
+def baseline(args):
+    """Adds and samples per second of utils.ReplayBuffer in this process"""
+    buffer = utils.ReplayBuffer(
+        obs_shape=(3*args.frame_stack, args.frame_size, args.frame_size),
+        action_shape=(2,),
+        capacity=args.capacity,
+        batch_size=args.batch_size,
+        args=Namespace(device='cpu')
+    )
+    transitions = [make_transition(0, step, args.frame_stack, args.frame_size) for step in range(16)]
+    start_time = time.perf_counter()
+    for step in range(args.steps):
+        buffer.add(*transitions[step % 16])
+    adds_per_second = args.steps / (time.perf_counter() - start_time)
+    num_batches = max(1, args.steps // args.batch_size)
+    start_time = time.perf_counter()
+    for _ in range(num_batches):
+        buffer._take()
+    return {
+        'adds_per_second': adds_per_second,
+        'samples_per_second': num_batches * args.batch_size / (time.perf_counter() - start_time)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('mode', choices=['stress', 'throughput'])
+    parser.add_argument('--writers', default=None, type=str)
+    parser.add_argument('--samplers', default=None, type=str)
+    parser.add_argument('--steps', default=None, type=int)
+    parser.add_argument('--capacity', default=None, type=int)
+    parser.add_argument('--batch_size', default=128, type=int)
+    parser.add_argument('--frame_stack', default=3, type=int)
+    parser.add_argument('--frame_size', default=None, type=int)
+    parser.add_argument('--prefetch', default=4, type=int)
+    parser.add_argument('--start_method', default='spawn', type=str)
+    parser.add_argument('--out', default=None, type=str)
+    args = parser.parse_args()
+    mp.set_start_method(args.start_method)
+
+    if args.mode == 'stress':
+        defaults = {'writers': '4', 'samplers': '4', 'steps': 5000, 'capacity': 256, 'frame_size': 8}
+    else:
+        defaults = {'writers': '1,2,4', 'samplers': '0,2', 'steps': 2000, 'capacity': 10000, 'frame_size': 84}
+    for key, value in defaults.items():
+        if getattr(args, key) is None:
+            setattr(args, key, value)
+
+    if args.mode == 'stress':
+        args.writers, args.samplers = int(args.writers), int(args.samplers)
+        results = stress(args)
+        print(json.dumps(results, indent=4))
+    else:
+        results = {'baseline': baseline(args), 'shared': []}
+        print('baseline (utils.ReplayBuffer) | adds/s: %.0f | samples/s: %.0f' % (
+            results['baseline']['adds_per_second'], results['baseline']['samples_per_second']))
+        for num_writers in [int(x) for x in args.writers.split(',')]:
+            for num_samplers in [int(x) for x in args.samplers.split(',')]:
+                result = throughput(args, num_writers, num_samplers)
+                results['shared'].append(result)
+                print('writers: %d | samplers: %d | adds/s: %.0f | samples/s: %.0f' % (
+                    num_writers, num_samplers, result['adds_per_second'], result['samples_per_second']))
+    if args.out is not None:
+        with open(args.out, 'w') as f:
+            json.dump(results, f, indent=4)
+        print('Saved results to', args.out)
+    if args.mode == 'stress' and not results['passed']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,3 +0,0 @@
-CUDA_VISIBLE_DEVICES=0 python3 src/train.py \
-	--algorithm sac \
-	--seed 0
\ No newline at end of file
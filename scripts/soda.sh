@@ -1,4 +0,0 @@
-CUDA_VISIBLE_DEVICES=0 python3 src/train.py \
-	--algorithm soda \
-	--aux_lr 3e-4 \
-	--seed 0
\ No newline at end of file
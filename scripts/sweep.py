@@ -0,0 +1,248 @@
+"""Runs a grid of train.py / eval.py runs on one machine under core, memory and GPU budgets.
+
+    python scripts/sweep.py scripts/grids/mix_spectrum.json --cores 32 --memory_gb 120
+    python scripts/sweep.py scripts/grids/baselines.json --grid seed=0,1,2 --set domain_name=cartpole
+
+A grid file holds the script to run, fixed `args`, the `grid` to expand and
+optional per-run budgets. Each run gets `cores_per_run` dedicated cores and
+matching torch thread settings. The state of the sweep is kept in
+`<sweep_dir>/sweep.json`, so a sweep that is started again skips finished runs.
+Failed runs are restarted up to --max_retries times (train.py runs with --resume).
+"""
+import argparse
+import itertools
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# grid keys that are already part of the work dir (<domain_task>/<algorithm>/<seed>_<tag>)
+WORK_DIR_KEYS = {'domain_name', 'task_name', 'algorithm', 'seed', 'tag'}
+
+
+def parse_value(value):
+    try:
+        return json.loads(value)
+    except ValueError:
+        return value
+
+
+def load_sweep(args):
+    with open(args.config) as f:
+        config = json.load(f)
+    config.setdefault('script', 'src/train.py')
+    config.setdefault('args', {})
+    config.setdefault('grid', {})
+    for item in args.set:
+        key, value = item.split('=', 1)
+        config['args'][key] = parse_value(value)
+    for item in args.grid:
+        key, values = item.split('=', 1)
+        config['grid'][key] = [parse_value(v) for v in values.split(',')]
+    return config
+
+
+def expand_grid(config):
+    """(name, arguments) for every point of the grid"""
+    keys = list(config['grid'])
+    runs = []
+    for values in itertools.product(*[config['grid'][k] for k in keys]):
+        run_args = dict(config['args'])
+        run_args.update(zip(keys, values))
+        # runs that only differ in keys outside the work dir need their own tag
+        suffix = [f'{k}-{v}' for k, v in zip(keys, values) if k not in WORK_DIR_KEYS]
+        if len(suffix) > 0 and config['script'].endswith('train.py'):
+            run_args['tag'] = '_'.join([str(run_args.get('tag', 'default'))] + suffix)
+        name = '_'.join(f'{k}-{v}' for k, v in zip(keys, values)).replace('/', '-') or 'run'
+        runs.append((name, run_args))
+    return runs
+
+
+def to_argv(run_args):
+    argv = []
+    for key, value in run_args.items():
+        if value is True:
+            argv.append(f'--{key}')
+        elif value is not False and value is not None:
+            argv += [f'--{key}', str(value)]
+    return argv
+
+
+def meminfo():
+    """Total and available memory in GB"""
+    info = {}
+    with open('/proc/meminfo') as f:
+        for line in f:
+            key, value = line.split(':')
+            info[key] = int(value.split()[0]) / 1024**2
+    return info['MemTotal'], info['MemAvailable']
+
+
+class Scheduler(object):
+    def __init__(self, config, args):
+        self.config = config
+        self.args = args
+        self.cores_per_run = config.get('cores_per_run', args.cores_per_run)
+        self.memory_per_run = config.get('memory_gb_per_run', args.memory_gb_per_run)
+        available_cores = sorted(os.sched_getaffinity(0))
+        self.free_cores = available_cores[:args.cores or len(available_cores)]
+        self.memory_budget = args.memory_gb or 0.9 * meminfo()[0]
+        self.gpus = {int(g): 0 for g in args.gpus.split(',')} if args.gpus else {}
+        assert self.cores_per_run <= len(self.free_cores), 'cores_per_run exceeds the core budget'
+        assert self.memory_per_run <= self.memory_budget, 'memory_gb_per_run exceeds the memory budget'
+
+        self.sweep_dir = args.sweep_dir
+        os.makedirs(self.sweep_dir, exist_ok=True)
+        self.state_fp = os.path.join(self.sweep_dir, 'sweep.json')
+        state = {}
+        if os.path.exists(self.state_fp):
+            with open(self.state_fp) as f:
+                state = json.load(f)
+        self.runs = {}
+        for name, run_args in expand_grid(config):
+            run = state.get(name, {'status': 'pending', 'attempts': 0})
+            if run['status'] == 'failed':
+                run['attempts'] = 0
+            if run['status'] != 'done':
+                run['status'] = 'pending'
+            run['args'] = run_args
+            self.runs[name] = run
+        self.running = {}
+
+    def save_state(self):
+        with open(self.state_fp + '.tmp', 'w') as f:
+            json.dump(self.runs, f, indent=4)
+        os.replace(self.state_fp + '.tmp', self.state_fp)
+
+    def command(self, run):
+        run_args = dict(run['args'])
+        if self.config['script'].endswith('train.py'):
+            resumable = run_args.get('num_collectors', 0) == 0 and run_args.get('num_envs', 1) == 1
+            if run['attempts'] > 0 and resumable:
+                run_args['resume'] = True
+            else:
+                run_args['overwrite'] = True
+        run_args.setdefault('cpu_threads', self.cores_per_run)
+        run_args.setdefault('cpu_interop_threads', 1)
+        return [sys.executable, os.path.join(ROOT, self.config['script'])] + to_argv(run_args)
+
+    def can_launch(self):
+        if len(self.free_cores) < self.cores_per_run:
+            return False
+        reserved = self.memory_per_run * (len(self.running) + 1)
+        if reserved > self.memory_budget or meminfo()[1] < self.memory_per_run:
+            return False
+        if self.gpus and min(self.gpus.values()) >= self.args.runs_per_gpu:
+            return False
+        return True
+
+    def launch(self, name):
+        run = self.runs[name]
+        cores = self.free_cores[:self.cores_per_run]
+        self.free_cores = self.free_cores[self.cores_per_run:]
+        threads = str(self.cores_per_run)
+        env = dict(os.environ, OMP_NUM_THREADS=threads, MKL_NUM_THREADS=threads, OPENBLAS_NUM_THREADS=threads)
+        gpu = None
+        if self.gpus:
+            gpu = min(self.gpus, key=self.gpus.get)
+            self.gpus[gpu] += 1
+            env['CUDA_VISIBLE_DEVICES'] = str(gpu)
+        cmd = self.command(run)
+        log = open(os.path.join(self.sweep_dir, name + '.log'), 'a')
+        log.write(f'\n# attempt {run["attempts"] + 1}: {" ".join(cmd)}\n')
+        log.flush()
+        proc = subprocess.Popen(
+            cmd, cwd=ROOT, env=env, stdin=subprocess.DEVNULL, stdout=log, stderr=subprocess.STDOUT,
+            preexec_fn=lambda: os.sched_setaffinity(0, cores)
+        )
+        run['status'] = 'running'
+        run['attempts'] += 1
+        self.running[name] = (proc, cores, gpu, log)
+        print(f'[{time.strftime("%H:%M:%S")}] started {name} on cores {cores}' + (f', gpu {gpu}' if gpu is not None else ''))
+
+    def reap(self):
+        for name, (proc, cores, gpu, log) in list(self.running.items()):
+            returncode = proc.poll()
+            if returncode is None:
+                continue
+            log.close()
+            self.free_cores = sorted(self.free_cores + cores)
+            if gpu is not None:
+                self.gpus[gpu] -= 1
+            del self.running[name]
+            run = self.runs[name]
+            if returncode == 0:
+                run['status'] = 'done'
+            elif run['attempts'] <= self.args.max_retries:
+                run['status'] = 'pending'
+            else:
+                run['status'] = 'failed'
+            print(f'[{time.strftime("%H:%M:%S")}] {name} exited with {returncode} ({run["status"]})')
+            self.save_state()
+
+    def terminate(self):
+        for proc, _, _, _ in self.running.values():
+            proc.terminate()
+        for name, (proc, _, _, log) in self.running.items():
+            proc.wait()
+            log.close()
+            self.runs[name]['status'] = 'pending'
+        self.save_state()
+
+    def run(self):
+        pending = [name for name, run in self.runs.items() if run['status'] == 'pending']
+        print(f'{len(self.runs)} runs, {len(pending)} to do, {len(self.free_cores)} cores, {self.memory_budget:.0f} GB')
+        while True:
+            self.reap()
+            pending = [name for name, run in self.runs.items() if run['status'] == 'pending']
+            if len(pending) == 0 and len(self.running) == 0:
+                break
+            while len(pending) > 0 and self.can_launch():
+                self.launch(pending.pop(0))
+            self.save_state()
+            time.sleep(self.args.poll_interval)
+        failed = [name for name, run in self.runs.items() if run['status'] == 'failed']
+        print(f'Finished: {len(self.runs) - len(failed)} done, {len(failed)} failed')
+        return len(failed) == 0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('config', type=str)
+    parser.add_argument('--grid', default=[], action='append', type=str)
+    parser.add_argument('--set', default=[], action='append', type=str)
+    parser.add_argument('--cores', default=0, type=int)
+    parser.add_argument('--cores_per_run', default=2, type=int)
+    parser.add_argument('--memory_gb', default=0, type=float)
+    parser.add_argument('--memory_gb_per_run', default=8, type=float)
+    parser.add_argument('--gpus', default=None, type=str)
+    parser.add_argument('--runs_per_gpu', default=1, type=int)
+    parser.add_argument('--max_retries', default=2, type=int)
+    parser.add_argument('--poll_interval', default=5, type=float)
+    parser.add_argument('--sweep_dir', default=None, type=str)
+    parser.add_argument('--dry_run', default=False, action='store_true')
+    args = parser.parse_args()
+    if args.sweep_dir is None:
+        args.sweep_dir = os.path.join(ROOT, 'logs', 'sweeps', os.path.splitext(os.path.basename(args.config))[0])
+
+    config = load_sweep(args)
+    if args.dry_run:
+        for _, run_args in expand_grid(config):
+            print(' '.join([config['script']] + to_argv(run_args)))
+        return
+
+    scheduler = Scheduler(config, args)
+    def handler(signum, frame):
+        scheduler.terminate()
+        sys.exit(1)
+    signal.signal(signal.SIGINT, handler)
+    signal.signal(signal.SIGTERM, handler)
+    sys.exit(0 if scheduler.run() else 1)
+
+
+if __name__ == '__main__':
+    main()
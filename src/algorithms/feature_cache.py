@@ -0,0 +1,80 @@
+import time
+import torch
+
+
+class TargetFeatureCache(object):
+	"""Target-encoder features of replayed next observations, keyed by transition.
+
+	A direct-mapped table on the device: transition t lives in slot
+	t % size, tagged with t and with the number of target updates at the
+	time it was computed. A lookup hits when the slot still holds t and the
+	entry is at most max_staleness target updates old. Transition ids count
+	every transition ever added to the replay buffer, so a ring slot that is
+	overwritten gets a new id and its old entry can no longer hit.
+
+	A transition is only looked up again if it is replayed within
+	max_staleness target updates, so the hit rate is about
+	max_staleness * critic_target_update_freq * batch_size / len(buffer):
+	near zero for a large, full buffer unless max_staleness is large too.
+
+	Every check_freq lookups the encoder pass is timed, to log the compute
+	saved by hits, and the hits are recomputed, to log how far the cached
+	features are from the current target encoder.
+	"""
+	def __init__(self, feature_dim, max_mb, max_staleness, device, check_freq=100):
+		self.size = max(1, int(max_mb * 2**20) // (4*feature_dim + 16))
+		self.max_staleness = max_staleness
+		self.check_freq = check_freq
+		self.device = device
+		self.features = torch.zeros((self.size, feature_dim), device=device)
+		self.ids = torch.full((self.size,), -1, dtype=torch.int64, device=device)
+		self.versions = torch.zeros(self.size, dtype=torch.int64, device=device)
+		self.version = 0
+		self.num_lookups = 0
+		self.seconds_per_sample = None
+
+	def clear(self):
+		self.ids.fill_(-1)
+
+	def target_updated(self):
+		self.version += 1
+
+	def _encode(self, encoder, obs):
+		if self.device.type == 'cuda':
+			torch.cuda.synchronize()
+		start_time = time.perf_counter()
+		features = encoder(obs)
+		if self.device.type == 'cuda':
+			torch.cuda.synchronize()
+		self.seconds_per_sample = (time.perf_counter() - start_time) / len(obs)
+		return features
+
+	@torch.no_grad()
+	def lookup(self, ids, obs, encoder, L=None, step=None):
+		"""Features of obs under encoder, computed only for the transitions that miss"""
+		ids = torch.as_tensor(ids, device=self.device)
+		slots = ids % self.size
+		hit = (self.ids[slots] == ids) & (self.version - self.versions[slots] <= self.max_staleness)
+		self.num_lookups += 1
+
+		# sizing the encoder batch is the one device-to-host sync, the hit count comes with it
+		features = self.features[slots]
+		miss = (~hit).nonzero().squeeze(1)
+		num_hits = len(ids) - len(miss)
+		if len(miss) > 0:
+			# time the encoder now and then to estimate the compute saved by hits
+			timed = self.num_lookups % self.check_freq == 1
+			features[miss] = self._encode(encoder, obs[miss]) if timed else encoder(obs[miss])
+			self.features[slots[miss]] = features[miss]
+			self.ids[slots[miss]] = ids[miss]
+			self.versions[slots[miss]] = self.version
+
+		if L is not None:
+			L.log('train/target_cache_hit_rate', num_hits / len(ids), step)
+			if num_hits > 0 and self.num_lookups % self.check_freq == 0:
+				exact = self._encode(encoder, obs[hit])
+				deviation = (features[hit] - exact).norm(dim=1) / exact.norm(dim=1).clamp(min=1e-8)
+				L.log('train/target_cache_deviation', deviation.mean(), step)
+			if self.seconds_per_sample is not None:
+				L.log('train/target_cache_saved_s', num_hits * self.seconds_per_sample, step)
+		return features
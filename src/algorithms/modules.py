@@ -4,6 +4,7 @@ import torch.nn as nn
 import torch.nn.functional as F
 import math
 from functools import partial
+import augmentations
 
 
 def _get_out_shape_cuda(in_shape, layers):
@@ -81,11 +82,12 @@ class CenterCrop(nn.Module):
 
 
 class NormalizeImg(nn.Module):
+	"""uint8 observations (acting) to [0,1], sampled batches arrive normalized already"""
 	def __init__(self):
 		super().__init__()
 
 	def forward(self, x):
-		return x/255.
+		return augmentations.to_unit_range(x)
 
 
 class Flatten(nn.Module):
@@ -93,7 +95,7 @@ class Flatten(nn.Module):
 		super().__init__()
 		
 	def forward(self, x):
-		return x.view(x.size(0), -1)
+		return x.reshape(x.size(0), -1)
 
 
 class RLProjection(nn.Module):
@@ -143,8 +145,16 @@ class SharedCNN(nn.Module):
 		self.layers = nn.Sequential(*self.layers)
 		self.out_shape = _get_out_shape(obs_shape, self.layers)
 		self.apply(weight_init)
+		self.memory_format = None
+
+	def channels_last(self):
+		"""Switches weights and inputs to NHWC, the layout oneDNN convolutions prefer on cpu"""
+		self.memory_format = torch.channels_last
+		return self.to(memory_format=torch.channels_last)
 
 	def forward(self, x):
+		if self.memory_format is not None:
+			x = x.contiguous(memory_format=self.memory_format)
 		return self.layers(x)
 
 
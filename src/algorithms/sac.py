@@ -5,11 +5,12 @@ import torch.nn.functional as F
 from copy import deepcopy
 import utils
 import algorithms.modules as m
+from algorithms.feature_cache import TargetFeatureCache
 
 
 class SAC(object):
 	def __init__(self, obs_shape, action_shape, args):
-		self.device=torch.device("cuda:{}".format(args.gpu))
+		self.device = utils.get_device(args)
 		self.discount = args.discount
 		self.critic_tau = args.critic_tau
 		self.encoder_tau = args.encoder_tau
@@ -17,6 +18,8 @@ class SAC(object):
 		self.critic_target_update_freq = args.critic_target_update_freq
 		self.args=args
 		shared_cnn = m.SharedCNN(obs_shape, args.num_shared_layers, args.num_filters).to(self.device)
+		if utils.use_channels_last(args):
+			shared_cnn.channels_last()
 		head_cnn = m.HeadCNN(shared_cnn.out_shape, args.num_head_layers, args.num_filters).to(self.device)
 		actor_encoder = m.Encoder(
 			shared_cnn,
@@ -32,6 +35,11 @@ class SAC(object):
 		self.actor = m.Actor(actor_encoder, action_shape, args.hidden_dim, args.actor_log_std_min, args.actor_log_std_max).to(self.device)
 		self.critic = m.Critic(critic_encoder, action_shape, args.hidden_dim).to(self.device)
 		self.critic_target = deepcopy(self.critic)
+		self.target_cache = None
+		if args.target_cache_mb > 0:
+			self.target_cache = TargetFeatureCache(
+				self.critic.encoder.out_dim, args.target_cache_mb, args.target_cache_staleness, self.device
+			)
 
 		self.log_alpha = torch.tensor(np.log(args.init_temperature)).to(self.device)
 		self.log_alpha.requires_grad = True
@@ -61,13 +69,36 @@ class SAC(object):
 	@property
 	def alpha(self):
 		return self.log_alpha.exp()
+
+	def state_dict(self):
+		return {
+			'actor': self.actor.state_dict(),
+			'critic': self.critic.state_dict(),
+			'critic_target': self.critic_target.state_dict(),
+			'log_alpha': self.log_alpha.detach(),
+			'actor_optimizer': self.actor_optimizer.state_dict(),
+			'critic_optimizer': self.critic_optimizer.state_dict(),
+			'log_alpha_optimizer': self.log_alpha_optimizer.state_dict()
+		}
+
+	def load_state_dict(self, state_dict):
+		self.actor.load_state_dict(state_dict['actor'])
+		self.critic.load_state_dict(state_dict['critic'])
+		self.critic_target.load_state_dict(state_dict['critic_target'])
+		if self.target_cache is not None:
+			self.target_cache.clear()
+		with torch.no_grad():
+			self.log_alpha.copy_(state_dict['log_alpha'])
+		self.actor_optimizer.load_state_dict(state_dict['actor_optimizer'])
+		self.critic_optimizer.load_state_dict(state_dict['critic_optimizer'])
+		self.log_alpha_optimizer.load_state_dict(state_dict['log_alpha_optimizer'])
 		
 	def _obs_to_input(self, obs):
+		# obs stays uint8 until the encoder normalizes it, ring-backed LazyFrames are read without a host copy
 		if isinstance(obs, utils.LazyFrames):
-			_obs = np.array(obs)
+			_obs = obs.tensor(self.device)
 		else:
-			_obs = obs
-		_obs = torch.FloatTensor(_obs).to(self.device)
+			_obs = torch.as_tensor(np.asarray(obs), device=self.device)
 		_obs = _obs.unsqueeze(0)
 		return _obs
 
@@ -77,16 +108,35 @@ class SAC(object):
 			mu, _, _, _ = self.actor(_obs, compute_pi=False, compute_log_pi=False)
 		return mu.cpu().data.numpy().flatten()
 
+	def select_actions(self, obses):
+		_obs = torch.as_tensor(np.stack([np.asarray(obs) for obs in obses]), device=self.device)
+		with torch.no_grad():
+			mu, _, _, _ = self.actor(_obs, compute_pi=False, compute_log_pi=False)
+		return mu.cpu().data.numpy()
+
 	def sample_action(self, obs):
 		_obs = self._obs_to_input(obs)
 		with torch.no_grad():
 			mu, pi, _, _ = self.actor(_obs, compute_log_pi=False)
 		return pi.cpu().data.numpy().flatten()
 
-	def update_critic(self, obs, action, reward, next_obs, not_done, L=None, step=None):
+	def sample_actions(self, obses):
+		_obs = torch.as_tensor(np.stack([np.asarray(obs) for obs in obses]), device=self.device)
+		with torch.no_grad():
+			mu, pi, _, _ = self.actor(_obs, compute_log_pi=False)
+		return pi.cpu().data.numpy()
+
+	def target_Q(self, next_obs, action, ids=None, L=None, step=None):
+		"""critic_target(next_obs, action), with the encoder features of cached transitions taken from the cache"""
+		if self.target_cache is None or ids is None:
+			return self.critic_target(next_obs, action)
+		x = self.target_cache.lookup(ids, next_obs, self.critic_target.encoder, L, step)
+		return self.critic_target.Q1(x, action), self.critic_target.Q2(x, action)
+
+	def update_critic(self, obs, action, reward, next_obs, not_done, L=None, step=None, ids=None):
 		with torch.no_grad():
 			_, policy_action, log_pi, _ = self.actor(next_obs)
-			target_Q1, target_Q2 = self.critic_target(next_obs, policy_action)
+			target_Q1, target_Q2 = self.target_Q(next_obs, policy_action, ids, L, step)
 			target_V = torch.min(target_Q1,
 								 target_Q2) - self.alpha.detach() * log_pi
 			target_Q = reward + (not_done * self.discount * target_V)
@@ -139,11 +189,15 @@ class SAC(object):
 			self.critic.encoder, self.critic_target.encoder,
 			self.encoder_tau
 		)
+		if self.target_cache is not None:
+			self.target_cache.target_updated()
 
 	def update(self, replay_buffer, L, step):
 		obs, action, reward, next_obs, not_done = replay_buffer.sample_sac()
 
-		self.update_critic(obs, action, reward, next_obs, not_done, L, step)
+		# next_obs is not augmented, so its target features can be cached
+		ids = replay_buffer.last_ids if self.target_cache is not None else None
+		self.update_critic(obs, action, reward, next_obs, not_done, L, step, ids)
 
 		if step % self.actor_update_freq == 0:
 			self.update_actor_and_alpha(obs, L, step)
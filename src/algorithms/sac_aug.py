@@ -10,7 +10,7 @@ from augmentations import *
 
 class SAC_AUG(object):
 	def __init__(self, obs_shape, action_shape, args):
-		self.device = torch.device("cuda:{}".format(args.gpu))
+		self.device = utils.get_device(args)
 		self.discount = args.discount
 		self.critic_tau = args.critic_tau
 		self.encoder_tau = args.encoder_tau
@@ -21,6 +21,8 @@ class SAC_AUG(object):
 		self.aug_func = globals()[args.augmentation.rstrip()]
 
 		shared_cnn = m.SharedCNN(obs_shape, args.num_shared_layers, args.num_filters).to(self.device)
+		if utils.use_channels_last(args):
+			shared_cnn.channels_last()
 		head_cnn = m.HeadCNN(shared_cnn.out_shape, args.num_head_layers, args.num_filters).to(self.device)
 		actor_encoder = m.Encoder(
 			shared_cnn,
@@ -65,13 +67,34 @@ class SAC_AUG(object):
 	@property
 	def alpha(self):
 		return self.log_alpha.exp()
+
+	def state_dict(self):
+		return {
+			'actor': self.actor.state_dict(),
+			'critic': self.critic.state_dict(),
+			'critic_target': self.critic_target.state_dict(),
+			'log_alpha': self.log_alpha.detach(),
+			'actor_optimizer': self.actor_optimizer.state_dict(),
+			'critic_optimizer': self.critic_optimizer.state_dict(),
+			'log_alpha_optimizer': self.log_alpha_optimizer.state_dict()
+		}
+
+	def load_state_dict(self, state_dict):
+		self.actor.load_state_dict(state_dict['actor'])
+		self.critic.load_state_dict(state_dict['critic'])
+		self.critic_target.load_state_dict(state_dict['critic_target'])
+		with torch.no_grad():
+			self.log_alpha.copy_(state_dict['log_alpha'])
+		self.actor_optimizer.load_state_dict(state_dict['actor_optimizer'])
+		self.critic_optimizer.load_state_dict(state_dict['critic_optimizer'])
+		self.log_alpha_optimizer.load_state_dict(state_dict['log_alpha_optimizer'])
 		
 	def _obs_to_input(self, obs):
+		# obs stays uint8 until the encoder normalizes it, ring-backed LazyFrames are read without a host copy
 		if isinstance(obs, utils.LazyFrames):
-			_obs = np.array(obs)
+			_obs = obs.tensor(self.device)
 		else:
-			_obs = obs
-		_obs = torch.FloatTensor(_obs).to(self.device)
+			_obs = torch.as_tensor(np.asarray(obs), device=self.device)
 		_obs = _obs.unsqueeze(0)
 		return _obs
 
@@ -81,12 +104,24 @@ class SAC_AUG(object):
 			mu, _, _, _ = self.actor(_obs, compute_pi=False, compute_log_pi=False)
 		return mu.cpu().data.numpy().flatten()
 
+	def select_actions(self, obses):
+		_obs = torch.as_tensor(np.stack([np.asarray(obs) for obs in obses]), device=self.device)
+		with torch.no_grad():
+			mu, _, _, _ = self.actor(_obs, compute_pi=False, compute_log_pi=False)
+		return mu.cpu().data.numpy()
+
 	def sample_action(self, obs):
 		_obs = self._obs_to_input(obs)
 		with torch.no_grad():
 			mu, pi, _, _ = self.actor(_obs, compute_log_pi=False)
 		return pi.cpu().data.numpy().flatten()
 
+	def sample_actions(self, obses):
+		_obs = torch.as_tensor(np.stack([np.asarray(obs) for obs in obses]), device=self.device)
+		with torch.no_grad():
+			mu, pi, _, _ = self.actor(_obs, compute_log_pi=False)
+		return pi.cpu().data.numpy()
+
 	def update_critic(self, obs, action, reward, next_obs, not_done, L=None, step=None):
 		with torch.no_grad():
 			_, policy_action, log_pi, _ = self.actor(next_obs)
@@ -37,6 +37,19 @@ class SODA(SAC):
 		if hasattr(self, 'soda_predictor'):
 			self.soda_predictor.train(training)
 
+	def state_dict(self):
+		state_dict = super().state_dict()
+		state_dict['predictor'] = self.predictor.state_dict()
+		state_dict['predictor_target'] = self.predictor_target.state_dict()
+		state_dict['soda_optimizer'] = self.soda_optimizer.state_dict()
+		return state_dict
+
+	def load_state_dict(self, state_dict):
+		super().load_state_dict(state_dict)
+		self.predictor.load_state_dict(state_dict['predictor'])
+		self.predictor_target.load_state_dict(state_dict['predictor_target'])
+		self.soda_optimizer.load_state_dict(state_dict['soda_optimizer'])
+
 	def compute_soda_loss(self, x0, x1):
 		h0 = self.predictor(x0)
 		with torch.no_grad():
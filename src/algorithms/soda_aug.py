@@ -39,6 +39,19 @@ class SODA_AUG(SAC):
 		if hasattr(self, 'soda_predictor'):
 			self.soda_predictor.train(training)
 
+	def state_dict(self):
+		state_dict = super().state_dict()
+		state_dict['predictor'] = self.predictor.state_dict()
+		state_dict['predictor_target'] = self.predictor_target.state_dict()
+		state_dict['soda_optimizer'] = self.soda_optimizer.state_dict()
+		return state_dict
+
+	def load_state_dict(self, state_dict):
+		super().load_state_dict(state_dict)
+		self.predictor.load_state_dict(state_dict['predictor'])
+		self.predictor_target.load_state_dict(state_dict['predictor_target'])
+		self.soda_optimizer.load_state_dict(state_dict['soda_optimizer'])
+
 	def compute_soda_loss(self, x0, x1):
 		h0 = self.predictor(x0)
 		with torch.no_grad():
@@ -81,7 +94,7 @@ class SODA_AUG(SAC):
 		if self.args.augmentation in ["mix_freq","mix_freq2_1","mix_freq2_2","mix_freq2_3",
 									  "mix_freq2_4","mix_freq2_5","mix_freq3"]:
 
-			obs2, action2, reward2, next_obs2, not_done2 = replay_buffer.sample_sac()
+			obs2, action2, reward2, next_obs2, not_done2 = replay_buffer.sample()
 			obs=self.aug_func(obs,obs2,self.args)
 			next_obs=self.aug_func(next_obs,next_obs2,self.args)
 
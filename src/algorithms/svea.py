@@ -15,10 +15,10 @@ class SVEA(SAC):
 		self.svea_alpha = args.svea_alpha
 		self.svea_beta = args.svea_beta
 		self.args=args
-	def update_critic(self, obs, action, reward, next_obs, not_done, L=None, step=None):
+	def update_critic(self, obs, action, reward, next_obs, not_done, L=None, step=None, ids=None):
 		with torch.no_grad():
 			_, policy_action, log_pi, _ = self.actor(next_obs)
-			target_Q1, target_Q2 = self.critic_target(next_obs, policy_action)
+			target_Q1, target_Q2 = self.target_Q(next_obs, policy_action, ids, L, step)
 			target_V = torch.min(target_Q1,
 								 target_Q2) - self.alpha.detach() * log_pi
 			target_Q = reward + (not_done * self.discount * target_V)
@@ -51,7 +51,9 @@ class SVEA(SAC):
 	def update(self, replay_buffer, L, step):
 		obs, action, reward, next_obs, not_done = replay_buffer.sample_svea()
 
-		self.update_critic(obs, action, reward, next_obs, not_done, L, step)
+		# only obs is augmented, so the target features of next_obs can be cached
+		ids = replay_buffer.last_ids if self.target_cache is not None else None
+		self.update_critic(obs, action, reward, next_obs, not_done, L, step, ids)
 
 		if step % self.actor_update_freq == 0:
 			self.update_actor_and_alpha(obs, L, step)
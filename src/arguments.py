@@ -20,6 +20,20 @@ def parse_args():
 	parser.add_argument('--init_steps', default=1000, type=int)
 	parser.add_argument('--batch_size', default=128, type=int)
 	parser.add_argument('--hidden_dim', default=1024, type=int)
+	parser.add_argument('--utd_ratio', default=1.0, type=float)
+	parser.add_argument('--update_chunk', default=16, type=int)
+	parser.add_argument('--replay_budget', default=None, type=str)
+
+	parser.add_argument('--overlap_env_step', default=False, action='store_true')
+	parser.add_argument('--policy_lag', default=False, action='store_true')
+
+	# collectors
+	parser.add_argument('--num_envs', default=1, type=int)
+	parser.add_argument('--num_collectors', default=0, type=int)
+	parser.add_argument('--collector_sync_freq', default=100, type=int)
+	parser.add_argument('--max_updates_per_iter', default=16, type=int)
+	parser.add_argument('--num_learners', default=1, type=int)
+	parser.add_argument('--dist_port', default=29500, type=int)
 
 	# actor
 	parser.add_argument('--actor_lr', default=1e-3, type=float)
@@ -40,6 +54,12 @@ def parse_args():
 	parser.add_argument('--num_filters', default=32, type=int)
 	parser.add_argument('--projection_dim', default=100, type=int)
 	parser.add_argument('--encoder_tau', default=0.05, type=float)
+	parser.add_argument('--target_cache_mb', default=0, type=float,
+						help='device memory for cached target-encoder features of next_obs, 0 to disable')
+	parser.add_argument('--target_cache_staleness', default=1, type=int,
+						help='target updates a cached feature stays valid for; a transition must be replayed within '
+							 'that window to hit, so the hit rate is about staleness * critic_target_update_freq * '
+							 'batch_size / len(replay buffer), close to 0 for a full buffer at the default of 1')
 	
 	# entropy maximization
 	parser.add_argument('--init_temperature', default=0.1, type=float)
@@ -61,15 +81,58 @@ def parse_args():
 
 	# eval
 	parser.add_argument('--save_freq', default='100k', type=str)
+	parser.add_argument('--keep_checkpoints', default=0, type=int)
+	parser.add_argument('--resume', default=False, action='store_true')
+	parser.add_argument('--overwrite', default=False, action='store_true')
 	parser.add_argument('--eval_freq', default='100k', type=str)
 	parser.add_argument('--eval_episodes', default=30, type=int)
+	parser.add_argument('--eval_tolerance', default=0., type=float)
+	parser.add_argument('--eval_min_episodes', default=10, type=int)
+	parser.add_argument('--eval_ci', default='t', type=str)
+	parser.add_argument('--eval_confidence', default=0.95, type=float)
+	parser.add_argument('--eval_envs', default=1, type=int)
+	parser.add_argument('--parallel_eval', default=False, action='store_true')
+	parser.add_argument('--async_eval', default=False, action='store_true')
+	parser.add_argument('--eval_max_pending', default=2, type=int)
+	parser.add_argument('--eval_queue_policy', default='drop_oldest', type=str)
 	parser.add_argument('--distracting_cs_intensity', default=0., type=float)
 
+	# checkpoint sweeps (eval.py)
+	parser.add_argument('--sweep_runs', default=None, type=str)
+	parser.add_argument('--sweep_steps', default='all', type=str)
+	parser.add_argument('--sweep_modes', default='color_hard,video_easy,video_hard', type=str)
+	parser.add_argument('--sweep_intensities', default='0.1,0.2,0.3', type=str)
+	parser.add_argument('--sweep_workers', default=4, type=int)
+	parser.add_argument('--sweep_cache', default='logs/eval_cache', type=str)
+	parser.add_argument('--sweep_out', default='sweep_results.json', type=str)
+
+	# profiling
+	parser.add_argument('--no_phase_timers', default=False, action='store_true')
+	parser.add_argument('--profile_sync', default=False, action='store_true')
+	parser.add_argument('--trace_steps', default=None, type=str)
+	parser.add_argument('--trace_format', default='chrome', type=str)
+	parser.add_argument('--param_stats_freq', default=0, type=int)
+	parser.add_argument('--track_memory', default=False, action='store_true')
+	parser.add_argument('--dry_run', default=False, action='store_true')
+
+	# benchmark (benchmark.py)
+	parser.add_argument('--bench_updates', default=200, type=int)
+	parser.add_argument('--bench_steps', default=200, type=int)
+	parser.add_argument('--bench_out', default=None, type=str)
+	parser.add_argument('--bench_learners', default=None, type=str)
+	parser.add_argument('--bench_suite', default=False, action='store_true')
+	parser.add_argument('--bench_algorithms', default=None, type=str)
+	parser.add_argument('--bench_augmentations', default=None, type=str)
+
 	# misc
 	parser.add_argument('--seed', default=123, type=int)
 	parser.add_argument('--log_dir', default='logs', type=str)
 	parser.add_argument('--save_video', default=True, action='store_true')
+	parser.add_argument('--video_size', default=448, type=int)
+	parser.add_argument('--video_stride', default=1, type=int)
 	parser.add_argument('--tag', default='default', type=str)
+	parser.add_argument('--log_format', default='both', type=str)
+	parser.add_argument('--sync_log', default=False, action='store_true')
 	parser.add_argument('--fan_angle', default=-1, type=int)
 	parser.add_argument('--augmentation', default='random_mask_freq_v1', type=str)
 
@@ -82,11 +145,23 @@ def parse_args():
 	parser.add_argument('--exponential_moving_average', default=0.0, type=float)
 
 	parser.add_argument('--gpu',default=0,type=int)
+	parser.add_argument('--device', default='auto', type=str)
+	parser.add_argument('--cpu_threads', default=0, type=int)
+	parser.add_argument('--cpu_interop_threads', default=0, type=int)
+	parser.add_argument('--channels_last', default='auto', type=str)
 	args = parser.parse_args()
 
 	assert args.algorithm in {'sac','sac_aug', 'soda','soda_aug', 'drq','drq_aug','svea','svea_aug'}, f'specified algorithm "{args.algorithm}" is not supported'
 
 	assert args.eval_mode in {'train', 'color_easy', 'color_hard', 'video_easy', 'video_hard', 'distracting_cs', 'none'}, f'specified mode "{args.eval_mode}" is not supported'
+	assert args.log_format in {'json', 'columnar', 'both'}, f'specified log format "{args.log_format}" is not supported'
+	assert args.eval_queue_policy in {'drop_oldest', 'drop_newest', 'coalesce'}, f'specified eval queue policy "{args.eval_queue_policy}" is not supported'
+	assert args.device in {'auto', 'cuda', 'cpu'} or args.device.startswith('cuda:'), f'specified device "{args.device}" is not supported'
+	assert args.channels_last in {'auto', 'on', 'off'}, f'specified channels_last mode "{args.channels_last}" is not supported'
+	assert args.target_cache_mb == 0 or args.algorithm in {'sac', 'svea'}, 'the target feature cache needs an agent that does not augment next_obs (sac, svea)'
+	assert args.eval_ci in {'t', 'bootstrap'}, f'specified confidence interval "{args.eval_ci}" is not supported'
+	assert args.eval_min_episodes >= 2, 'eval_min_episodes must be at least 2, the confidence interval needs two episodes'
+	assert args.trace_format in {'chrome', 'torch'}, f'specified trace format "{args.trace_format}" is not supported'
 	assert args.seed is not None, 'must provide seed for experiment'
 	assert args.log_dir is not None, 'must provide a log directory for experiment'
 
@@ -96,15 +171,36 @@ def parse_args():
 	args.train_steps = int(args.train_steps.replace('k', '000'))
 	args.save_freq = int(args.save_freq.replace('k', '000'))
 	args.eval_freq = int(args.eval_freq.replace('k', '000'))
+	if args.replay_budget is not None:
+		args.replay_budget = parse_bytes(args.replay_budget)
+	if args.trace_steps is not None:
+		args.trace_steps = tuple(int(x.replace('k', '000')) for x in args.trace_steps.split(':'))
+		assert len(args.trace_steps) == 2 and args.trace_steps[0] < args.trace_steps[1], 'trace_steps must be given as start:end'
 
 	if args.eval_mode == 'none':
 		args.eval_mode = None
 
-	if args.algorithm in {'rad', 'curl', 'pad', 'soda'}:
+	set_image_size(args)
+
+	return args
+
+
+def parse_bytes(size):
+	"""'512M', '20G' or a plain number of bytes"""
+	units = {'K': 2**10, 'M': 2**20, 'G': 2**30, 'T': 2**40}
+	size = size.upper().rstrip('B')
+	if size[-1] in units:
+		return int(float(size[:-1]) * units[size[-1]])
+	return int(size)
+
+
+def set_image_size(args):
+	"""SODA samples 100x100 frames for its random crops, all other agents use 84x84"""
+	# soda_aug runs SODA's auxiliary task on random crops too, so it gets the same 100x100
+	# frames; it used to get 84x84 frames, on which those crops were no-ops
+	if args.algorithm in {'rad', 'curl', 'pad', 'soda', 'soda_aug'}:
 		args.image_size = 100
 		args.image_crop_size = 84
 	else:
 		args.image_size = 84
 		args.image_crop_size = 84
-	
-	return args
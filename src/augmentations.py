@@ -43,7 +43,7 @@ def _load_places(batch_size=256, image_size=84, num_workers=16, use_val=False):
 	print('Loaded dataset from', data_dir)
 
 
-def _get_places_batch(batch_size):
+def _get_places_batch(batch_size, device):
 	global places_iter
 	try:
 		imgs, _ = next(places_iter)
@@ -53,34 +53,42 @@ def _get_places_batch(batch_size):
 	except StopIteration:
 		places_iter = iter(places_dataloader)
 		imgs, _ = next(places_iter)
-	return imgs.cuda()
+	return imgs.to(device)
 
 
-def random_overlay(x,args, dataset='places365_standard'):
-	"""Randomly overlay an image from Places"""
+def to_unit_range(x, args=None):
+	"""uint8 observations in [0,255] as float in [0,1], float observations are taken to be in [0,1] already"""
+	if x.dtype == torch.uint8:
+		return x.float().div_(255.)
+	return x
+
+
+def random_overlay(x,args=None, dataset='places365_standard', value_range=1.):
+	"""Randomly overlay an image from Places, x in [0,value_range]"""
 	global places_iter
 	alpha = 0.5
 
 	if dataset == 'places365_standard':
 		if places_dataloader is None:
 			_load_places(batch_size=x.size(0), image_size=x.size(-1))
-		imgs = _get_places_batch(batch_size=x.size(0)).repeat(1, x.size(1)//3, 1, 1)
+		imgs = _get_places_batch(batch_size=x.size(0), device=x.device).repeat(1, x.size(1)//3, 1, 1)
 	else:
 		raise NotImplementedError(f'overlay has not been implemented for dataset "{dataset}"')
 
-	return ((1-alpha)*(x/255.) + (alpha)*imgs)*255.
+	return (1-alpha)*x + (alpha*value_range)*imgs
 
 
-def random_conv(x,args=None):
-	"""Applies a random conv2d, deviates slightly from https://arxiv.org/abs/1910.05396"""
+def random_conv(x,args=None, value_range=1.):
+	"""Applies a random conv2d, deviates slightly from https://arxiv.org/abs/1910.05396, x in [0,value_range]"""
 	n, c, h, w = x.shape
+	outs = []
 	for i in range(n):
-		weights = torch.randn(3, 3, 3, 3).to(x.device)
-		temp_x = x[i:i+1].reshape(-1, 3, h, w)/255.
-		temp_x = F.pad(temp_x, pad=[1]*4, mode='replicate')
-		out = torch.sigmoid(F.conv2d(temp_x, weights))*255.
-		total_out = out if i == 0 else torch.cat([total_out, out], axis=0)
-	return total_out.reshape(n, c, h, w)
+		# the conv has no bias, so scaling its weights maps x to [0,1] without touching x
+		weights = torch.randn(3, 3, 3, 3, device=x.device) / value_range
+		temp_x = F.pad(x[i:i+1].reshape(-1, 3, h, w), pad=[1]*4, mode='replicate')
+		outs.append(torch.sigmoid(F.conv2d(temp_x, weights)))
+	out = torch.cat(outs, axis=0).reshape(n, c, h, w)
+	return out if value_range == 1. else out * value_range
 
 
 def batch_from_obs(obs, args=None,batch_size=32):
@@ -97,11 +105,12 @@ def batch_from_obs(obs, args=None,batch_size=32):
 
 def prepare_pad_batch(obs, next_obs, action, args=None,batch_size=32):
 	"""Prepare batch for self-supervised policy adaptation at test-time"""
-	batch_obs = batch_from_obs(torch.from_numpy(obs).cuda(), batch_size)
-	batch_next_obs = batch_from_obs(torch.from_numpy(next_obs).cuda(), batch_size)
-	batch_action = torch.from_numpy(action).cuda().unsqueeze(0).repeat(batch_size, 1)
+	device = utils.get_device(args)
+	batch_obs = batch_from_obs(torch.from_numpy(obs).to(device), batch_size=batch_size)
+	batch_next_obs = batch_from_obs(torch.from_numpy(next_obs).to(device), batch_size=batch_size)
+	batch_action = torch.from_numpy(action).to(device).unsqueeze(0).repeat(batch_size, 1)
 
-	return random_crop_cuda(batch_obs), random_crop_cuda(batch_next_obs), batch_action
+	return random_crop(batch_obs), random_crop(batch_next_obs), batch_action
 
 
 def identity(x,args=None):
@@ -116,11 +125,11 @@ def random_shift(imgs,args=None, pad=4):
 
 
 def random_crop(x,args=None, size=84, w1=None, h1=None, return_w1_h1=False):
-	"""Vectorized CUDA implementation of random crop, imgs: (B,C,H,W), size: output size"""
+	"""Vectorized random crop, imgs: (B,C,H,W), size: output size"""
 	assert (w1 is None and h1 is None) or (w1 is not None and h1 is not None), \
 		'must either specify both w1 and h1 or neither of them'
-	assert isinstance(x, torch.Tensor) and x.is_cuda, \
-		'input must be CUDA tensor'
+	assert isinstance(x, torch.Tensor), \
+		'input must be a tensor'
 	
 	n = x.shape[0]
 	img_size = x.shape[-1]
@@ -213,9 +222,9 @@ def mix_freq(x,x2,args):
 	rand_indices=np.random.permutation(B)
 
 	srm_out=torch.zeros_like(x)
-	coeff=torch.FloatTensor(coeff).to(torch.device("cuda:{}".format(args.gpu)))
-	seq_indices=torch.IntTensor(seq_indices).to(torch.device("cuda:{}".format(args.gpu)))
-	rand_indices=torch.IntTensor(rand_indices).to(torch.device("cuda:{}".format(args.gpu)))
+	coeff=torch.FloatTensor(coeff).to(x.device)
+	seq_indices=torch.IntTensor(seq_indices).to(x.device)
+	rand_indices=torch.IntTensor(rand_indices).to(x.device)
 	x_C1 = torch.index_select(x, 0, seq_indices)
 	x_C2 = torch.index_select(x, 0, rand_indices)
 
@@ -241,9 +250,9 @@ def mix_freq(x,x2,args):
 	B,C,H,W=x.shape
 
 	coeff = np.random.uniform(0.0, args.freq_alpha, size=(B,))
-	coeff=torch.FloatTensor(coeff).to(torch.device("cuda:{}".format(args.gpu)))
+	coeff=torch.FloatTensor(coeff).to(x.device)
 
-	srm_out=torch.zeros_like(x).to(torch.device("cuda:{}".format(args.gpu)))
+	srm_out=torch.zeros_like(x)
 
 	x_C1 = x
 	x_C2 = x2
@@ -272,8 +281,8 @@ def mix_freq2_1(x,x2,args):
 	B,C,H,W=x.shape
 
 	coeff = np.random.uniform(0.0, 0.2, size=(B,))
-	coeff=torch.FloatTensor(coeff).to(torch.device("cuda:{}".format(args.gpu)))
-	srm_out=torch.zeros_like(x).to(torch.device("cuda:{}".format(args.gpu)))
+	coeff=torch.FloatTensor(coeff).to(x.device)
+	srm_out=torch.zeros_like(x)
 
 	x_C1 = x
 	x_C2 = x2
@@ -301,8 +310,8 @@ def mix_freq2_2(x,x2,args):
 	B,C,H,W=x.shape
 
 	coeff = np.random.uniform(0.2, 0.4, size=(B,))
-	coeff=torch.FloatTensor(coeff).to(torch.device("cuda:{}".format(args.gpu)))
-	srm_out=torch.zeros_like(x).to(torch.device("cuda:{}".format(args.gpu)))
+	coeff=torch.FloatTensor(coeff).to(x.device)
+	srm_out=torch.zeros_like(x)
 
 	x_C1 = x
 	x_C2 = x2
@@ -330,8 +339,8 @@ def mix_freq2_3(x,x2,args):
 	B,C,H,W=x.shape
 
 	coeff = np.random.uniform(0.4, 0.6, size=(B,))
-	coeff=torch.FloatTensor(coeff).to(torch.device("cuda:{}".format(args.gpu)))
-	srm_out=torch.zeros_like(x).to(torch.device("cuda:{}".format(args.gpu)))
+	coeff=torch.FloatTensor(coeff).to(x.device)
+	srm_out=torch.zeros_like(x)
 
 	x_C1 = x
 	x_C2 = x2
@@ -358,8 +367,8 @@ def mix_freq2_4(x,x2,args):
 	B,C,H,W=x.shape
 
 	coeff = np.random.uniform(0.6, 0.8, size=(B,))
-	coeff=torch.FloatTensor(coeff).to(torch.device("cuda:{}".format(args.gpu)))
-	srm_out=torch.zeros_like(x).to(torch.device("cuda:{}".format(args.gpu)))
+	coeff=torch.FloatTensor(coeff).to(x.device)
+	srm_out=torch.zeros_like(x)
 
 	x_C1 = x
 	x_C2 = x2
@@ -386,8 +395,8 @@ def mix_freq2_5(x,x2,args):
 	B,C,H,W=x.shape
 
 	coeff = np.random.uniform(0.8, 1.0, size=(B,))
-	coeff=torch.FloatTensor(coeff).to(torch.device("cuda:{}".format(args.gpu)))
-	srm_out=torch.zeros_like(x).to(torch.device("cuda:{}".format(args.gpu)))
+	coeff=torch.FloatTensor(coeff).to(x.device)
+	srm_out=torch.zeros_like(x)
 
 	x_C1 = x
 	x_C2 = x2
@@ -414,7 +423,7 @@ def mix_freq3(x,x2,args):
 	B,C,H,W=x.shape
 
 
-	srm_out=torch.zeros_like(x).to(torch.device("cuda:{}".format(args.gpu)))
+	srm_out=torch.zeros_like(x)
 
 	x_C1 = x
 	x_C2 = x2
@@ -0,0 +1,223 @@
+import json
+import os
+import resource
+import subprocess
+import time
+from copy import deepcopy
+from datetime import datetime
+import numpy as np
+import torch
+import torch.multiprocessing as mp
+import gym
+import utils
+from arguments import parse_args, set_image_size
+from envs import make_env
+from algorithms import factory
+from algorithms.factory import make_agent
+from shared_replay import SharedReplayBuffer
+import distributed
+import profiling
+
+
+AUGMENTATIONS = [
+	'random_mask_freq_v1', 'random_mask_freq_v2', 'mix_freq', 'mix_freq2_1', 'mix_freq2_2',
+	'mix_freq2_3', 'mix_freq2_4', 'mix_freq2_5', 'mix_freq3'
+]
+
+
+def _make_env(args):
+	gym.logger.set_level(40)
+	return make_env(
+		domain_name=args.domain_name,
+		task_name=args.task_name,
+		seed=args.seed,
+		episode_length=args.episode_length,
+		action_repeat=args.action_repeat,
+		image_size=args.image_size,
+		mode='train'
+	)
+
+
+def benchmark(args):
+	"""Measures env, update and end-to-end training throughput on the configured device"""
+	utils.set_seed_everywhere(args.seed)
+	device = utils.setup_device(args)
+
+	env = _make_env(args)
+	replay_buffer = utils.ReplayBuffer(
+		obs_shape=env.observation_space.shape,
+		action_shape=env.action_space.shape,
+		capacity=args.init_steps + args.bench_steps,
+		batch_size=args.batch_size,
+		args=args
+	)
+	agent = make_agent(
+		obs_shape=(3*args.frame_stack, args.image_crop_size, args.image_crop_size),
+		action_shape=env.action_space.shape,
+		args=args
+	)
+
+	profiling.timer.configure(enabled=not args.no_phase_timers)
+	profiling.instrument(agent, replay_buffer)
+
+	def step_env(obs, action):
+		with profiling.phase('env_step'):
+			next_obs, reward, done, _ = env.step(action)
+		with profiling.phase('replay_add'):
+			replay_buffer.add(obs, action, reward, next_obs, float(done))
+		return env.reset() if done else next_obs
+
+	# Environment only
+	obs = env.reset()
+	start_time = time.time()
+	for _ in range(args.init_steps):
+		obs = step_env(obs, env.action_space.sample())
+	env_sps = args.init_steps / (time.time() - start_time)
+
+	# Updates only, after a few warmup updates
+	for step in range(min(10, args.bench_updates)):
+		agent.update(replay_buffer, None, step)
+	if device.type == 'cuda':
+		torch.cuda.synchronize()
+	latencies = []
+	start_time = time.time()
+	for step in range(args.bench_updates):
+		update_start_time = time.perf_counter()
+		agent.update(replay_buffer, None, step)
+		if device.type == 'cuda':
+			torch.cuda.synchronize()
+		latencies.append(time.perf_counter() - update_start_time)
+	updates_per_second = args.bench_updates / (time.time() - start_time)
+
+	# End-to-end: act, step and update once per step
+	profiling.timer._totals.clear()
+	start_time = time.time()
+	for step in range(args.bench_steps):
+		with utils.eval_mode(agent), profiling.phase('act'):
+			action = agent.sample_action(obs)
+		obs = step_env(obs, action)
+		agent.update(replay_buffer, None, step)
+	if device.type == 'cuda':
+		torch.cuda.synchronize()
+	sps = args.bench_steps / (time.time() - start_time)
+
+	return {
+		'algorithm': args.algorithm,
+		'augmentation': args.augmentation if args.algorithm.endswith('_aug') else None,
+		'domain': f'{args.domain_name}_{args.task_name}',
+		'obs_shape': list(env.observation_space.shape),
+		'device': str(device),
+		'threads': torch.get_num_threads(),
+		'interop_threads': torch.get_num_interop_threads(),
+		'channels_last': utils.use_channels_last(args),
+		'batch_size': args.batch_size,
+		'env_sps': env_sps,
+		'updates_per_second': updates_per_second,
+		'update_latency_ms': {
+			'mean': float(np.mean(latencies) * 1e3),
+			'p50': float(np.percentile(latencies, 50) * 1e3),
+			'p90': float(np.percentile(latencies, 90) * 1e3),
+			'p99': float(np.percentile(latencies, 99) * 1e3)
+		},
+		'sps': sps,
+		'peak_cuda_mb': torch.cuda.max_memory_allocated() / 2**20 if device.type == 'cuda' else None,
+		'phase_timers': not args.no_phase_timers,
+		'phase_timer_overhead_us': profiling.measure_overhead() * 1e6,
+		'phase_seconds': dict(profiling.timer._totals)
+	}
+
+
+def benchmark_scaling(args):
+	"""Scaling of the data-parallel learner over --bench_learners processes"""
+	utils.set_seed_everywhere(args.seed)
+	env = _make_env(args)
+	replay_buffer = SharedReplayBuffer(
+		obs_shape=env.observation_space.shape,
+		action_shape=env.action_space.shape,
+		capacity=args.init_steps,
+		batch_size=args.batch_size,
+		args=args
+	)
+	obs = env.reset()
+	for _ in range(args.init_steps):
+		action = env.action_space.sample()
+		next_obs, reward, done, _ = env.step(action)
+		replay_buffer.add(obs, action, reward, next_obs, float(done))
+		obs = env.reset() if done else next_obs
+	world_sizes = [int(x) for x in args.bench_learners.split(',')]
+	return {
+		'algorithm': args.algorithm,
+		'domain': f'{args.domain_name}_{args.task_name}',
+		'device': str(utils.get_device(args)),
+		'cpu_count': os.cpu_count(),
+		'batch_size': args.batch_size,
+		'scaling': distributed.scaling_report(args, env, replay_buffer, world_sizes)
+	}
+
+
+def _suite_worker(args):
+	try:
+		results = benchmark(args)
+	except Exception as e:
+		results = {
+			'algorithm': args.algorithm,
+			'augmentation': args.augmentation if args.algorithm.endswith('_aug') else None,
+			'error': repr(e)
+		}
+	results['peak_rss_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+	return results
+
+
+def benchmark_suite(args):
+	"""Benchmarks every registered algorithm (and augmentation for the _aug agents) in a fresh process each, on the synthetic env"""
+	algorithms = args.bench_algorithms.split(',') if args.bench_algorithms else list(factory.algorithm)
+	augmentations = args.bench_augmentations.split(',') if args.bench_augmentations else AUGMENTATIONS
+	configs = []
+	for algorithm in algorithms:
+		for augmentation in (augmentations if algorithm.endswith('_aug') else [args.augmentation]):
+			config = deepcopy(args)
+			config.algorithm, config.augmentation = algorithm, augmentation
+			config.domain_name = 'synthetic'
+			set_image_size(config)
+			configs.append(config)
+
+	results = []
+	with mp.get_context('spawn').Pool(1, maxtasksperchild=1) as pool:
+		for config in configs:
+			result = pool.apply(_suite_worker, (config,))
+			results.append(result)
+			if 'error' in result:
+				print('%s | %s | error: %s' % (result['algorithm'], result['augmentation'], result['error']))
+			else:
+				print('%s | %s | updates/s: %.2f | p50: %.1f ms | p99: %.1f ms | steps/s: %.2f | peak rss: %.0f MB' % (
+					result['algorithm'], result['augmentation'], result['updates_per_second'],
+					result['update_latency_ms']['p50'], result['update_latency_ms']['p99'], result['sps'], result['peak_rss_mb']))
+	try:
+		commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL).strip().decode()
+	except (OSError, subprocess.CalledProcessError):
+		commit = None
+	return {
+		'commit': commit,
+		'timestamp': str(datetime.now()),
+		'torch': torch.__version__,
+		'cpu_count': os.cpu_count(),
+		'bench_updates': args.bench_updates,
+		'bench_steps': args.bench_steps,
+		'domain': 'synthetic',
+		'results': results
+	}
+
+
+if __name__ == '__main__':
+	args = parse_args()
+	if args.bench_suite:
+		results = benchmark_suite(args)
+	elif args.bench_learners is not None:
+		results = benchmark_scaling(args)
+	else:
+		results = benchmark(args)
+	print(json.dumps(results, indent=4))
+	if args.bench_out is not None:
+		with open(args.bench_out, 'w') as f:
+			json.dump(results, f, indent=4)
+		print('Saved results to', args.bench_out)
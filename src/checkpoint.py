@@ -0,0 +1,172 @@
+import json
+import os
+import queue
+import random
+import signal
+import threading
+import numpy as np
+import torch
+
+
+MANIFEST = 'checkpoints.json'
+
+
+def _to_host(obj):
+	"""Recursively copies all tensors in a state tree to host memory"""
+	if isinstance(obj, torch.Tensor):
+		if obj.is_cuda:
+			out = torch.empty(obj.shape, dtype=obj.dtype, pin_memory=True)
+			return out.copy_(obj.detach(), non_blocking=True)
+		return obj.detach().clone()
+	if isinstance(obj, dict):
+		return {k: _to_host(v) for k, v in obj.items()}
+	if isinstance(obj, (list, tuple)):
+		return type(obj)(_to_host(v) for v in obj)
+	return obj
+
+
+def get_rng_state():
+	state = {
+		'python': random.getstate(),
+		'numpy': np.random.get_state(),
+		'torch': torch.get_rng_state()
+	}
+	if torch.cuda.is_available():
+		state['cuda'] = torch.cuda.get_rng_state_all()
+	return state
+
+
+def set_rng_state(state):
+	random.setstate(state['python'])
+	np.random.set_state(state['numpy'])
+	torch.set_rng_state(state['torch'])
+	if 'cuda' in state and torch.cuda.is_available():
+		torch.cuda.set_rng_state_all(state['cuda'])
+
+
+def load_checkpoint(path, map_location='cpu', mmap=True):
+	"""Loads a checkpoint, memory-mapping the file when torch supports it"""
+	if mmap:
+		try:
+			return torch.load(path, map_location=map_location, mmap=True, weights_only=False)
+		except (TypeError, RuntimeError):
+			pass
+	return torch.load(path, map_location=map_location)
+
+
+def load_agent(agent, path, map_location=None):
+	"""Restores agent weights from a checkpoint, or returns a legacy pickled agent as is"""
+	data = load_checkpoint(path, map_location=map_location if map_location is not None else 'cpu')
+	if isinstance(data, dict) and 'agent' in data:
+		agent.load_state_dict(data['agent'])
+		return agent
+	return data
+
+
+class Checkpointer(object):
+	"""Writes resumable checkpoints from a background thread.
+
+	save() takes a fast device-to-host snapshot of the agent state on the
+	calling thread and hands it to a writer thread, which writes it to
+	`<model_dir>/<step>.pt` via a temporary file and updates a small manifest.
+	When `keep` > 0 only the `keep` best checkpoints (by score, or by step
+	when no score is given) are kept, plus always the most recent one. An
+	error in the writer thread is raised by the next save() or wait().
+	"""
+	def __init__(self, model_dir, keep=0):
+		self.model_dir = model_dir
+		self.keep = keep
+		self.preempted = False
+		self._error = None
+		self._queue = queue.Queue(maxsize=2)
+		self._thread = threading.Thread(target=self._run, daemon=True)
+		self._thread.start()
+
+	def install_sigterm_handler(self):
+		"""Sets `preempted` on SIGTERM, the training loop then saves and exits"""
+		def handler(signum, frame):
+			self.preempted = True
+		signal.signal(signal.SIGTERM, handler)
+
+	def _raise_error(self):
+		if self._error is not None:
+			error, self._error = self._error, None
+			raise RuntimeError('writing a checkpoint failed') from error
+
+	def save(self, agent, step, counters=None, score=None, args=None):
+		self._raise_error()
+		state = {
+			'step': step,
+			'score': float(score) if score is not None else None,
+			'counters': counters or {},
+			'args': vars(args) if args is not None else None,
+			'agent': _to_host(agent.state_dict()),
+			'rng': get_rng_state()
+		}
+		if torch.cuda.is_available():
+			torch.cuda.synchronize()
+		self._queue.put(state)
+
+	def _run(self):
+		while True:
+			state = self._queue.get()
+			if state is None:
+				return
+			try:
+				path = os.path.join(self.model_dir, f'{state["step"]}.pt')
+				torch.save(state, path + '.tmp')
+				os.replace(path + '.tmp', path)
+				self._update_manifest(state['step'], state['score'])
+			except Exception as e:
+				self._error = e
+			finally:
+				self._queue.task_done()
+
+	def _read_manifest(self):
+		path = os.path.join(self.model_dir, MANIFEST)
+		if not os.path.exists(path):
+			return []
+		with open(path) as f:
+			return json.load(f)
+
+	def _update_manifest(self, step, score):
+		entries = [e for e in self._read_manifest() if e['step'] != step]
+		entries.append({'step': step, 'score': score})
+		if self.keep > 0 and len(entries) > self.keep:
+			latest = max(e['step'] for e in entries)
+			ranked = sorted(
+				entries,
+				key=lambda e: (e['score'] if e['score'] is not None else float('-inf'), e['step']),
+				reverse=True
+			)
+			kept = ranked[:self.keep]
+			if latest not in [e['step'] for e in kept]:
+				kept = ranked[:self.keep-1] + [e for e in entries if e['step'] == latest]
+			for e in entries:
+				if e not in kept:
+					path = os.path.join(self.model_dir, f'{e["step"]}.pt')
+					if os.path.exists(path):
+						os.remove(path)
+			entries = kept
+		path = os.path.join(self.model_dir, MANIFEST)
+		with open(path + '.tmp', 'w') as f:
+			json.dump(sorted(entries, key=lambda e: e['step']), f)
+		os.replace(path + '.tmp', path)
+
+	def latest(self):
+		"""Path of the most recent checkpoint in model_dir, or None"""
+		entries = self._read_manifest()
+		if len(entries) == 0:
+			return None
+		return os.path.join(self.model_dir, f'{max(e["step"] for e in entries)}.pt')
+
+	def wait(self):
+		self._queue.join()
+		self._raise_error()
+
+	def close(self):
+		try:
+			self.wait()
+		finally:
+			self._queue.put(None)
+			self._thread.join()
@@ -0,0 +1,200 @@
+import queue
+import time
+import numpy as np
+import torch
+import torch.multiprocessing as mp
+from copy import deepcopy
+import utils
+from envs import make_env
+
+
+class TransitionQueue(object):
+	"""Fixed pool of transition slots in shared memory.
+
+	Producers take a free slot index, write the transition into the shared
+	tensors and pass the index on through `filled`; the consumer copies the
+	slot out and hands the index back through `free`. Only slot indices go
+	through the (pickling) multiprocessing queues. A slot index of -1 on
+	`free` tells the producer that takes it to stop.
+
+	A slot carries the new frame of next_obs, and the whole obs only for the
+	first transition of an episode. The consumer keeps the frames of every
+	producer's current episode and adds LazyFrames over them to replay, so
+	consecutive transitions share frames and each stores one new frame, as in
+	the serial loop.
+	"""
+	def __init__(self, ctx, num_slots, obs_shape, action_shape):
+		self.frame_stack = obs_shape[0] // 3
+		self.obs = torch.zeros((num_slots, *obs_shape), dtype=torch.uint8).share_memory_()
+		self.frame = torch.zeros((num_slots, 3, *obs_shape[1:]), dtype=torch.uint8).share_memory_()
+		self.action = torch.zeros((num_slots, *action_shape), dtype=torch.float32).share_memory_()
+		self.reward = torch.zeros(num_slots, dtype=torch.float32).share_memory_()
+		self.done = torch.zeros(num_slots, dtype=torch.float32).share_memory_()
+		self.producer = torch.zeros(num_slots, dtype=torch.int64).share_memory_()
+		self.first = torch.zeros(num_slots, dtype=torch.bool).share_memory_()
+		self._frames = {}
+		self.free = ctx.Queue()
+		self.filled = ctx.Queue()
+		for i in range(num_slots):
+			self.free.put(i)
+
+	def put(self, producer, obs, action, reward, next_obs, done, first):
+		"""Writes a transition of producer into a free slot, returns False when told to stop instead.
+		first marks the first transition of an episode, the only one whose obs is sent."""
+		i = self.free.get()
+		if i < 0:
+			return False
+		if first:
+			self.obs[i].numpy()[:] = np.asarray(obs)
+		self.frame[i].numpy()[:] = np.asarray(next_obs)[-3:]
+		self.action[i].numpy()[:] = action
+		self.reward[i] = reward
+		self.done[i] = done
+		self.producer[i] = producer
+		self.first[i] = first
+		self.filled.put(i)
+		return True
+
+	def drain(self, replay_buffer, max_items=None):
+		"""Moves ready transitions into the replay buffer, returns how many were moved"""
+		n = 0
+		while max_items is None or n < max_items:
+			try:
+				i = self.filled.get_nowait()
+			except queue.Empty:
+				break
+			producer = self.producer[i].item()
+			if self.first[i].item() or producer not in self._frames:
+				self._frames[producer] = utils.split_frames(self.obs[i].numpy(), self.frame_stack)
+			frames = self._frames[producer]
+			next_frames = frames[1:] + [self.frame[i].numpy().copy()]
+			replay_buffer.add(
+				utils.LazyFrames(frames),
+				self.action[i].numpy().copy(),
+				self.reward[i].item(),
+				utils.LazyFrames(next_frames),
+				self.done[i].item()
+			)
+			self._frames[producer] = next_frames
+			self.free.put(i)
+			n += 1
+		return n
+
+
+def _collector_worker(args, index, shared_actor, version, lock, transitions, episodes, steps, stop):
+	torch.set_num_threads(1)
+	np.random.seed(args.seed + 10000*(index+1))
+	torch.manual_seed(args.seed + 10000*(index+1))
+	env = make_env(
+		domain_name=args.domain_name,
+		task_name=args.task_name,
+		seed=args.seed + 10000*(index+1),
+		episode_length=args.episode_length,
+		action_repeat=args.action_repeat,
+		image_size=args.image_size,
+		mode='train'
+	)
+	actor = deepcopy(shared_actor)
+	actor.train(False)
+	local_version = -1
+	init_steps = args.init_steps // args.num_collectors
+
+	obs, episode_reward, episode_step = env.reset(), 0, 0
+	while not stop.is_set():
+		if local_version != version.item():
+			with lock:
+				actor.load_state_dict(shared_actor.state_dict())
+				local_version = version.item()
+
+		if steps[index].item() < init_steps:
+			action = env.action_space.sample()
+		else:
+			with torch.no_grad():
+				_obs = torch.as_tensor(np.asarray(obs)).unsqueeze(0)
+				_, pi, _, _ = actor(_obs, compute_log_pi=False)
+			action = pi.numpy().flatten()
+
+		next_obs, reward, done, _ = env.step(action)
+		done_bool = 0 if episode_step + 1 == env._max_episode_steps else float(done)
+		if not transitions.put(index, obs, action, reward, next_obs, done_bool, episode_step == 0):
+			break
+		steps[index] += 1
+		episode_reward += reward
+		episode_step += 1
+		obs = next_obs
+
+		if done:
+			episodes.put(episode_reward)
+			obs, episode_reward, episode_step = env.reset(), 0, 0
+
+
+class CollectorPool(object):
+	"""Collector processes that step their own environments with a periodically refreshed actor"""
+	def __init__(self, args, actor, obs_shape, action_shape, num_slots=1024):
+		ctx = mp.get_context('spawn')
+		self.num_collectors = args.num_collectors
+		self.actor = deepcopy(actor).cpu()
+		self.actor.share_memory()
+		self.version = torch.zeros(1, dtype=torch.int64).share_memory_()
+		self.steps = torch.zeros(args.num_collectors, dtype=torch.int64).share_memory_()
+		self.lock = ctx.Lock()
+		self.stop = ctx.Event()
+		self.transitions = TransitionQueue(ctx, num_slots, obs_shape, action_shape)
+		self.episodes = ctx.Queue()
+		self._procs = []
+		for i in range(args.num_collectors):
+			proc = ctx.Process(
+				target=_collector_worker,
+				args=(args, i, self.actor, self.version, self.lock, self.transitions, self.episodes, self.steps, self.stop),
+				daemon=True
+			)
+			proc.start()
+			self._procs.append(proc)
+
+	def sync(self, actor):
+		with self.lock, torch.no_grad():
+			shared = self.actor.state_dict()
+			for key, value in actor.state_dict().items():
+				shared[key].copy_(value)
+			self.version += 1
+
+	def drain(self, replay_buffer, max_items=None):
+		return self.transitions.drain(replay_buffer, max_items)
+
+	def finished_episodes(self):
+		rewards = []
+		while True:
+			try:
+				rewards.append(self.episodes.get_nowait())
+			except queue.Empty:
+				return rewards
+
+	@property
+	def total_steps(self):
+		return int(self.steps.sum().item())
+
+	def close(self):
+		self.stop.set()
+		# unblock collectors waiting for a free slot, without handing out a slot that is in use
+		for _ in range(self.num_collectors):
+			self.transitions.free.put(-1)
+		for proc in self._procs:
+			proc.join(timeout=10)
+			if proc.is_alive():
+				proc.terminate()
+
+
+class ThroughputMeter(object):
+	"""Counts events per second between calls to rate()"""
+	def __init__(self):
+		self._count = 0
+		self._time = time.time()
+
+	def update(self, n=1):
+		self._count += n
+
+	def rate(self):
+		now = time.time()
+		rate = self._count / max(now - self._time, 1e-8)
+		self._count, self._time = 0, now
+		return rate
@@ -0,0 +1,175 @@
+import json
+import os
+import queue
+import threading
+import numpy as np
+
+
+DATA_EXT = '.bin'
+INDEX_EXT = '.idx'
+
+
+class JsonLinesWriter(object):
+    """Appends one JSON line per record (legacy train.log/eval.log format)"""
+    def __init__(self, file_name):
+        self._file_name = file_name
+
+    def write(self, data):
+        with open(self._file_name, 'a') as f:
+            f.write(json.dumps(data) + '\n')
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class ColumnarWriter(object):
+    """Buffers records and appends them as typed column chunks.
+
+    Each chunk is written to `<prefix>.bin` as one contiguous array per key,
+    followed by a single JSON line in `<prefix>.idx` holding the number of
+    rows and the dtype, offset and size of every column. The index line is
+    only written once the data is on disk, so a crash never leaves an index
+    entry pointing at missing bytes.
+    """
+    def __init__(self, prefix, chunk_size=256):
+        self._data_path = prefix + DATA_EXT
+        self._index_path = prefix + INDEX_EXT
+        self._chunk_size = chunk_size
+        self._records = []
+
+    def write(self, data):
+        self._records.append(data)
+        if len(self._records) >= self._chunk_size:
+            self.flush()
+
+    def _columns(self):
+        keys = []
+        for record in self._records:
+            for key in record:
+                if key not in keys:
+                    keys.append(key)
+        columns = {}
+        for key in keys:
+            values = [record.get(key) for record in self._records]
+            is_int = all(isinstance(v, (int, np.integer)) for v in values)
+            if is_int:
+                columns[key] = np.asarray(values, dtype=np.int64)
+            else:
+                columns[key] = np.asarray(
+                    [np.nan if v is None else v for v in values], dtype=np.float64)
+        return columns
+
+    def flush(self):
+        if len(self._records) == 0:
+            return
+        columns = self._columns()
+        entry = {'rows': len(self._records), 'columns': {}}
+        with open(self._data_path, 'ab') as f:
+            offset = f.tell()
+            for key, array in columns.items():
+                buf = array.tobytes()
+                f.write(buf)
+                entry['columns'][key] = [array.dtype.str, offset, len(buf)]
+                offset += len(buf)
+        with open(self._index_path, 'a') as f:
+            f.write(json.dumps(entry) + '\n')
+        self._records = []
+
+    def close(self):
+        self.flush()
+
+
+class AsyncWriter(object):
+    """Forwards records to a set of writers from a background thread.
+
+    An error in a writer is kept and raised from the next write, flush or
+    close; the thread keeps draining the queue meanwhile (dropping records)
+    so that the training loop never blocks on it.
+    """
+    def __init__(self, writers, max_queue=1024, flush_interval=10.):
+        self._writers = writers
+        self._flush_interval = flush_interval
+        self._error = None
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                item = self._queue.get(timeout=self._flush_interval)
+            except queue.Empty:
+                item = ('flush', None)
+            cmd, data = item
+            if self._error is None:
+                try:
+                    for writer in self._writers:
+                        if cmd == 'write':
+                            writer.write(data)
+                        else:
+                            writer.flush()
+                except Exception as e:
+                    self._error = e
+            if cmd == 'close':
+                for writer in self._writers:
+                    try:
+                        writer.close()
+                    except Exception as e:
+                        self._error = self._error or e
+                return
+
+    def _raise_error(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise RuntimeError('writing metrics failed') from error
+
+    def write(self, data):
+        self._raise_error()
+        self._queue.put(('write', dict(data)))
+
+    def flush(self):
+        self._raise_error()
+        self._queue.put(('flush', None))
+
+    def close(self):
+        if self._thread.is_alive():
+            self._queue.put(('close', None))
+            self._thread.join()
+        self._raise_error()
+
+
+def load_columnar(prefix):
+    """Loads all chunks written by ColumnarWriter as one array per key"""
+    data_path, index_path = prefix + DATA_EXT, prefix + INDEX_EXT
+    if not os.path.exists(index_path):
+        return {}
+    with open(index_path) as f:
+        entries = [json.loads(line) for line in f if line.strip()]
+    if len(entries) == 0:
+        return {}
+    raw = np.fromfile(data_path, dtype=np.uint8)
+
+    keys = []
+    for entry in entries:
+        for key in entry['columns']:
+            if key not in keys:
+                keys.append(key)
+
+    out = {}
+    for key in keys:
+        parts, dtypes = [], set()
+        for entry in entries:
+            col = entry['columns'].get(key)
+            if col is None:
+                parts.append(np.full(entry['rows'], np.nan))
+                dtypes.add(np.dtype(np.float64))
+                continue
+            dtype, offset, nbytes = col
+            parts.append(np.frombuffer(raw[offset:offset+nbytes], dtype=np.dtype(dtype)))
+            dtypes.add(np.dtype(dtype))
+        dtype = np.result_type(*dtypes)
+        out[key] = np.concatenate([p.astype(dtype, copy=False) for p in parts])
+    return out
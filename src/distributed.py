@@ -0,0 +1,209 @@
+import os
+import time
+from copy import deepcopy
+import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
+import utils
+from algorithms.factory import make_agent
+
+
+_STOP = -1
+_SYNC = -2
+
+
+def shard_args(args, world_size):
+	"""Copy of args with the batch sizes divided between world_size learners"""
+	args = deepcopy(args)
+	args.batch_size = max(args.batch_size // world_size, 1)
+	args.soda_batch_size = max(args.soda_batch_size // world_size, 1)
+	return args
+
+
+def init_process(rank, world_size, args, port=None):
+	"""Joins the gloo process group and splits the cpu cores between learners"""
+	dist.init_process_group(
+		'gloo',
+		init_method=f'tcp://127.0.0.1:{port or args.dist_port}',
+		rank=rank,
+		world_size=world_size
+	)
+	if utils.get_device(args).type == 'cpu' and args.cpu_threads == 0:
+		torch.set_num_threads(max(1, (os.cpu_count() or 1) // world_size))
+
+
+def _allreduce_grads(params, world_size):
+	"""Averages the gradients of params over all learners in one flat buffer"""
+	grads = [p.grad for p in params if p.grad is not None]
+	if len(grads) == 0:
+		return
+	flat = torch.cat([g.reshape(-1) for g in grads])
+	dist.all_reduce(flat)
+	flat /= world_size
+	offset = 0
+	for g in grads:
+		g.copy_(flat[offset:offset+g.numel()].view_as(g))
+		offset += g.numel()
+
+
+def _allreduce_before_step(optimizer, world_size):
+	params = [p for group in optimizer.param_groups for p in group['params']]
+	step = optimizer.step
+	def allreduce_step(*args, **kwargs):
+		_allreduce_grads(params, world_size)
+		return step(*args, **kwargs)
+	optimizer.step = allreduce_step
+
+
+def broadcast_state(agent, rank):
+	"""Loads the agent state (weights, targets, log_alpha and optimizers) of rank 0 on every learner"""
+	state = [agent.state_dict() if rank == 0 else None]
+	dist.broadcast_object_list(state, src=0)
+	if rank != 0:
+		agent.load_state_dict(state[0])
+
+
+def state_checksum(agent):
+	"""Sum of every parameter of the agent, equal on all learners while they are in sync"""
+	with torch.no_grad():
+		total = 0.
+		for value in vars(agent).values():
+			if isinstance(value, torch.nn.Module):
+				total += sum(p.double().sum().item() for p in value.parameters())
+			elif isinstance(value, torch.Tensor):
+				total += value.double().sum().item()
+	return total
+
+
+def make_learner(rank, world_size, args, obs_shape, action_shape):
+	"""Builds an agent whose optimizers average gradients over all learners before stepping.
+
+	Every learner starts from the state of rank 0 and applies the same averaged
+	gradients, so weights, target networks and log_alpha stay identical without
+	further communication.
+	"""
+	utils.set_seed_everywhere(args.seed + rank)
+	agent = make_agent(obs_shape=obs_shape, action_shape=action_shape, args=args)
+	broadcast_state(agent, rank)
+	for value in vars(agent).values():
+		if isinstance(value, torch.optim.Optimizer):
+			_allreduce_before_step(value, world_size)
+	return agent
+
+
+def _learner_worker(rank, world_size, args, obs_shape, action_shape, replay_buffer):
+	"""Repeats every update announced by rank 0 on its own shard of the batch"""
+	init_process(rank, world_size, args)
+	agent = make_learner(rank, world_size, args, obs_shape, action_shape)
+	cmd = torch.zeros(1, dtype=torch.int64)
+	while True:
+		dist.broadcast(cmd, 0)
+		step = cmd.item()
+		if step == _STOP:
+			break
+		elif step == _SYNC:
+			broadcast_state(agent, rank)
+		else:
+			agent.update(replay_buffer, None, step)
+	dist.destroy_process_group()
+
+
+class DataParallelLearner(object):
+	"""Rank 0 of a data-parallel learner, used in place of the agent by train.py.
+
+	Starts args.num_learners - 1 helper processes that build the same agent and
+	sample their own shard of every batch from the shared replay buffer. Each
+	update() is announced to the helpers, which then run the same update in
+	lockstep. Everything else is forwarded to the rank 0 agent.
+	"""
+	def __init__(self, args, obs_shape, action_shape, replay_buffer):
+		world_size = args.num_learners
+		ctx = mp.get_context('spawn')
+		self._procs = []
+		for rank in range(1, world_size):
+			proc = ctx.Process(
+				target=_learner_worker,
+				args=(rank, world_size, args, obs_shape, action_shape, replay_buffer),
+				daemon=True
+			)
+			proc.start()
+			self._procs.append(proc)
+		init_process(0, world_size, args)
+		self.agent = make_learner(0, world_size, args, obs_shape, action_shape)
+		self._cmd = torch.zeros(1, dtype=torch.int64)
+
+	def __getattr__(self, name):
+		if name == 'agent':
+			raise AttributeError(name)
+		return getattr(self.agent, name)
+
+	def _send(self, cmd):
+		self._cmd[0] = cmd
+		dist.broadcast(self._cmd, 0)
+
+	def update(self, replay_buffer, L, step):
+		self._send(step)
+		self.agent.update(replay_buffer, L, step)
+
+	def load_state_dict(self, state_dict):
+		self.agent.load_state_dict(state_dict)
+		self._send(_SYNC)
+		broadcast_state(self.agent, 0)
+
+	def close(self):
+		self._send(_STOP)
+		for proc in self._procs:
+			proc.join()
+		dist.destroy_process_group()
+
+
+def _scaling_worker(rank, world_size, args, obs_shape, action_shape, replay_buffer, port, results):
+	init_process(rank, world_size, args, port)
+	agent = make_learner(rank, world_size, args, obs_shape, action_shape)
+	replay_buffer.batch_size = args.batch_size
+	for step in range(5):
+		agent.update(replay_buffer, None, step)
+	dist.barrier()
+	start_time = time.time()
+	for step in range(args.bench_updates):
+		agent.update(replay_buffer, None, step)
+	dist.barrier()
+	elapsed = time.time() - start_time
+	checksums = [None] * world_size
+	dist.all_gather_object(checksums, state_checksum(agent))
+	if rank == 0:
+		results.put((elapsed, len(set(checksums)) == 1))
+	dist.destroy_process_group()
+
+
+def scaling_report(args, env, replay_buffer, world_sizes):
+	"""Times the same number of updates with a fixed global batch on 1..N learners"""
+	obs_shape = (3*args.frame_stack, args.image_crop_size, args.image_crop_size)
+	ctx = mp.get_context('spawn')
+	report = []
+	for world_size in world_sizes:
+		learner_args = shard_args(args, world_size)
+		results = ctx.Queue()
+		procs = [ctx.Process(
+			target=_scaling_worker,
+			args=(rank, world_size, learner_args, obs_shape, env.action_space.shape, replay_buffer, args.dist_port + world_size, results)
+		) for rank in range(world_size)]
+		for proc in procs:
+			proc.start()
+		elapsed, in_sync = results.get()
+		for proc in procs:
+			proc.join()
+		updates_per_second = args.bench_updates / elapsed
+		report.append({
+			'learners': world_size,
+			'batch_size_per_learner': learner_args.batch_size,
+			'updates_per_second': updates_per_second,
+			'samples_per_second': updates_per_second * learner_args.batch_size * world_size,
+			'in_sync': in_sync
+		})
+	for row in report:
+		row['speedup'] = row['updates_per_second'] / report[0]['updates_per_second'] * report[0]['learners']
+		row['efficiency'] = row['speedup'] / row['learners']
+		print('learners: %d | updates/s: %.2f | samples/s: %.0f | speedup: %.2f | efficiency: %.2f | in sync: %s' % (
+			row['learners'], row['updates_per_second'], row['samples_per_second'], row['speedup'], row['efficiency'], row['in_sync']))
+	return report
@@ -0,0 +1,52 @@
+import numpy as np
+import gym
+import utils
+
+
+class SyntheticEnv(gym.Env):
+	"""Cheap pixel environment with the observation and action spaces of the DMC tasks.
+
+	Frames are random uint8 images and the reward is a fixed quadratic of the
+	action, so it exercises the full data path (frame stacking, replay, agent
+	updates) without dm_control or rendering.
+	"""
+	def __init__(self, seed=0, episode_length=1000, frame_stack=3, action_repeat=4, image_size=84, action_dim=6, **kwargs):
+		self._rng = np.random.RandomState(seed)
+		self._frame_stack = frame_stack
+		self._image_size = image_size
+		self._ring = utils.FrameStackRing((3, image_size, image_size), frame_stack)
+		self._max_episode_steps = (episode_length + action_repeat - 1) // action_repeat
+		self._target = self._rng.uniform(-1, 1, size=action_dim).astype(np.float32)
+		self.observation_space = gym.spaces.Box(
+			low=0, high=255, shape=(3*frame_stack, image_size, image_size), dtype=np.uint8
+		)
+		self.action_space = gym.spaces.Box(low=-1, high=1, shape=(action_dim,), dtype=np.float32)
+		self.action_space.seed(seed)
+
+	def _frame(self):
+		return self._rng.randint(0, 256, size=(3, self._image_size, self._image_size), dtype=np.uint8)
+
+	def reset(self):
+		self._step = 0
+		return self._ring.reset(self._frame())
+
+	def step(self, action):
+		self._step += 1
+		obs = self._ring.push(self._frame())
+		reward = float(1 - np.mean((np.asarray(action) - self._target) ** 2))
+		done = self._step >= self._max_episode_steps
+		return obs, reward, done, {}
+
+	def render(self, mode='rgb_array', height=None, width=None, camera_id=0):
+		frame = self._ring.stack[-3:].transpose(1, 2, 0)
+		if height is not None and width is not None:
+			frame = np.repeat(np.repeat(frame, max(1, height // frame.shape[0]), axis=0), max(1, width // frame.shape[1]), axis=1)
+		return frame
+
+
+def make_env(domain_name, task_name, **kwargs):
+	"""Creates a DMC environment, or a SyntheticEnv when domain_name is 'synthetic'"""
+	if domain_name == 'synthetic':
+		return SyntheticEnv(**kwargs)
+	from env.wrappers import make_env as make_dmc_env
+	return make_dmc_env(domain_name=domain_name, task_name=task_name, **kwargs)
@@ -1,21 +1,32 @@
 import torch
 import torchvision
 import os
+import glob
+import hashlib
+import json
+import argparse
 import numpy as np
 import gym
 import utils
 from copy import deepcopy
 from tqdm import tqdm
 from arguments import parse_args
-from env.wrappers import make_env
+from envs import make_env
 from algorithms.factory import make_agent
 from video import VideoRecorder
 import augmentations
+import checkpoint
+import evaluation
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import multiprocessing as mp
 
 
-def evaluate(env, agent, video, num_episodes, eval_mode, adapt=False):
+def evaluate(args, env, agent, video, num_episodes, eval_mode, adapt=False):
+	"""Episode rewards of up to num_episodes episodes, fewer when --eval_tolerance is reached first"""
 	episode_rewards = []
-	for i in tqdm(range(num_episodes)):
+	progress = tqdm(total=num_episodes)
+	while not evaluation.evaluation_done(episode_rewards, args, num_episodes):
+		i = len(episode_rewards)
 		if adapt:
 			ep_agent = deepcopy(agent)
 			ep_agent.init_pad_optimizer()
@@ -37,8 +48,143 @@ def evaluate(env, agent, video, num_episodes, eval_mode, adapt=False):
 
 		video.save(f'eval_{eval_mode}_{i}.mp4')
 		episode_rewards.append(episode_reward)
+		progress.update()
+	progress.close()
 
-	return np.mean(episode_rewards)
+	return episode_rewards
+
+
+def file_hash(path, index):
+	"""sha256 of a checkpoint file, memoized in `index` by path, size and mtime"""
+	st = os.stat(path)
+	memo_key = f'{os.path.abspath(path)}:{st.st_size}:{st.st_mtime_ns}'
+	if memo_key not in index:
+		h = hashlib.sha256()
+		with open(path, 'rb') as f:
+			for block in iter(lambda: f.read(1 << 20), b''):
+				h.update(block)
+		index[memo_key] = h.hexdigest()
+	return index[memo_key]
+
+
+def cache_path(cache_dir, ckpt_hash, mode, intensity, seed, num_episodes, num_envs):
+	"""Content-addressed location of one evaluation result"""
+	# the number of envs decides which env seeds the episodes come from
+	key = f'{ckpt_hash}|{mode}|{intensity}|{seed}|{num_episodes}|{num_envs}'
+	digest = hashlib.sha256(key.encode()).hexdigest()
+	return os.path.join(cache_dir, digest[:2], digest + '.json')
+
+
+def _load_sweep_agent(path):
+	"""Loads a checkpoint once, returns the agent and the args it was trained with"""
+	data = checkpoint.load_checkpoint(path, map_location=None)
+	if isinstance(data, dict) and 'agent' in data:
+		run_args = argparse.Namespace(**data['args'])
+		env = make_env(
+			domain_name=run_args.domain_name,
+			task_name=run_args.task_name,
+			seed=run_args.seed,
+			episode_length=run_args.episode_length,
+			action_repeat=run_args.action_repeat,
+			image_size=run_args.image_size,
+			mode='train'
+		)
+		agent = make_agent(
+			obs_shape=(3*run_args.frame_stack, run_args.image_crop_size, run_args.image_crop_size),
+			action_shape=env.action_space.shape,
+			args=run_args
+		)
+		agent.load_state_dict(data['agent'])
+	else:
+		agent, run_args = data, data.args
+	agent.train(False)
+	return agent, run_args
+
+
+def _sweep_worker(path, jobs, num_envs):
+	"""Evaluates one checkpoint on a list of (mode, intensity, seed, num_episodes) jobs.
+
+	Every job gets freshly created and seeded envs, so its result only
+	depends on its cache key and not on what the worker ran before.
+	"""
+	agent, run_args = _load_sweep_agent(path)
+	results = []
+	for mode, intensity, seed, num_episodes in jobs:
+		utils.set_seed_everywhere(seed)
+		envs = [make_env(
+			domain_name=run_args.domain_name,
+			task_name=run_args.task_name,
+			seed=seed+42+1000*i,
+			episode_length=run_args.episode_length,
+			action_repeat=run_args.action_repeat,
+			image_size=run_args.image_size,
+			mode=mode,
+			intensity=intensity
+		) for i in range(num_envs)]
+		episode_rewards = evaluation.evaluate_batched(envs, agent, num_episodes)
+		for env in envs:
+			env.close()
+		results.append((mode, intensity, seed, num_episodes, episode_rewards))
+	return results
+
+
+def sweep(args):
+	"""Evaluates every checkpoint of every run matching --sweep_runs, reusing cached results"""
+	cache_dir = utils.make_dir(args.sweep_cache)
+	index_fp = os.path.join(cache_dir, 'hashes.json')
+	hash_index = {}
+	if os.path.exists(index_fp):
+		with open(index_fp) as f:
+			hash_index = json.load(f)
+
+	modes = args.sweep_modes.split(',')
+	intensities = [float(x) for x in args.sweep_intensities.split(',')]
+	steps = None if args.sweep_steps == 'all' else {int(x.replace('k', '000')) for x in args.sweep_steps.split(',')}
+
+	# Collect the jobs that are not in the cache yet, grouped by checkpoint
+	rows, tasks = [], {}
+	for run_dir in sorted(glob.glob(args.sweep_runs)):
+		for path in sorted(glob.glob(os.path.join(run_dir, 'model', '*.pt'))):
+			step = os.path.splitext(os.path.basename(path))[0]
+			if not step.isdigit() or (steps is not None and int(step) not in steps):
+				continue
+			ckpt_hash = file_hash(path, hash_index)
+			seed_tag = os.path.basename(run_dir).split('_')[0]
+			seed = int(seed_tag) if seed_tag.isdigit() else args.seed
+			for mode in modes:
+				for intensity in (intensities if mode == 'distracting_cs' else [0.]):
+					fp = cache_path(cache_dir, ckpt_hash, mode, intensity, seed, args.eval_episodes, args.eval_envs)
+					rows.append((run_dir, int(step), mode, intensity, fp))
+					if not os.path.exists(fp):
+						tasks.setdefault(path, []).append((mode, intensity, seed, args.eval_episodes, fp))
+	with open(index_fp, 'w') as f:
+		json.dump(hash_index, f)
+	print(f'{len(rows)} evaluations, {sum(len(v) for v in tasks.values())} not cached, {len(tasks)} checkpoints to load')
+
+	# Evaluate each checkpoint once in a long-lived process pool
+	if len(tasks) > 0:
+		with ProcessPoolExecutor(max_workers=args.sweep_workers, mp_context=mp.get_context('spawn')) as pool:
+			futures = {
+				pool.submit(_sweep_worker, path, [job[:4] for job in jobs], args.eval_envs): jobs
+				for path, jobs in tasks.items()
+			}
+			for future in as_completed(futures):
+				for job, (mode, intensity, seed, num_episodes, episode_rewards) in zip(futures[future], future.result()):
+					utils.make_dir(os.path.dirname(job[4]))
+					with open(job[4] + '.tmp', 'w') as f:
+						json.dump({'mode': mode, 'intensity': intensity, 'seed': seed, 'episode_rewards': episode_rewards}, f)
+					os.replace(job[4] + '.tmp', job[4])
+
+	# Report
+	results = []
+	for run_dir, step, mode, intensity, fp in rows:
+		with open(fp) as f:
+			episode_rewards = json.load(f)['episode_rewards']
+		results.append({'run': run_dir, 'step': step, 'mode': mode, 'intensity': intensity, 'reward': float(np.mean(episode_rewards))})
+		print(f'{run_dir} | {step} | {mode} | {intensity} | {int(results[-1]["reward"])}')
+	with open(args.sweep_out, 'w') as f:
+		json.dump(results, f, indent=4)
+	print('Saved results to', args.sweep_out)
 
 
 def main(args):
@@ -59,12 +205,12 @@ def main(args):
 	)
 
 	# Set working directory
-	work_dir = os.path.join(args.log_dir, args.domain_name+'_'+args.task_name, args.algorithm, str(args.seed))
+	work_dir = os.path.join(args.log_dir, args.domain_name+'_'+args.task_name, args.algorithm, str(args.seed)+'_'+args.tag)
 	print('Working directory:', work_dir)
 	assert os.path.exists(work_dir), 'specified working directory does not exist'
 	model_dir = utils.make_dir(os.path.join(work_dir, 'model'))
 	video_dir = utils.make_dir(os.path.join(work_dir, 'video'))
-	video = VideoRecorder(video_dir if args.save_video else None, height=448, width=448)
+	video = VideoRecorder(video_dir if args.save_video else None, height=args.video_size, width=args.video_size, stride=args.video_stride)
 
 	# Check if evaluation has already been run
 	if args.eval_mode == 'distracting_cs':
@@ -74,7 +220,7 @@ def main(args):
 	assert not os.path.exists(results_fp), f'{args.eval_mode} results already exist for {work_dir}'
 
 	# Prepare agent
-	assert torch.cuda.is_available(), 'must have cuda enabled'
+	utils.setup_device(args)
 	cropped_obs_shape = (3*args.frame_stack, args.image_crop_size, args.image_crop_size)
 	print('Observations:', env.observation_space.shape)
 	print('Cropped observations:', cropped_obs_shape)
@@ -83,12 +229,14 @@ def main(args):
 		action_shape=env.action_space.shape,
 		args=args
 	)
-	agent = torch.load(os.path.join(model_dir, str(args.train_steps)+'.pt'))
+	agent = checkpoint.load_agent(agent, os.path.join(model_dir, str(args.train_steps)+'.pt'), map_location=agent.device)
 	agent.train(False)
 
 	print(f'\nEvaluating {work_dir} for {args.eval_episodes} episodes (mode: {args.eval_mode})')
-	reward = evaluate(env, agent, video, args.eval_episodes, args.eval_mode)
-	print('Reward:', int(reward))
+	episode_rewards = evaluate(args, env, agent, video, args.eval_episodes, args.eval_mode)
+	reward = np.mean(episode_rewards)
+	ci = evaluation.confidence_half_width(episode_rewards, args.eval_ci, args.eval_confidence)
+	print('Reward: %d +- %.1f (%d episodes)' % (reward, ci, len(episode_rewards)))
 
 	adapt_reward = None
 	if args.algorithm == 'pad':
@@ -100,13 +248,16 @@ def main(args):
 			action_repeat=args.action_repeat,
 			mode=args.eval_mode
 		)
-		adapt_reward = evaluate(env, agent, video, args.eval_episodes, args.eval_mode, adapt=True)
+		adapt_reward = np.mean(evaluate(args, env, agent, video, args.eval_episodes, args.eval_mode, adapt=True))
 		print('Adapt reward:', int(adapt_reward))
+	video.close()
 
 	# Save results
 	torch.save({
 		'args': args,
 		'reward': reward,
+		'episodes': len(episode_rewards),
+		'ci': ci,
 		'adapt_reward': adapt_reward
 	}, results_fp)
 	print('Saved results to', results_fp)
@@ -114,4 +265,7 @@ def main(args):
 
 if __name__ == '__main__':
 	args = parse_args()
-	main(args)
+	if args.sweep_runs is not None:
+		sweep(args)
+	else:
+		main(args)
@@ -0,0 +1,296 @@
+import math
+import queue
+import threading
+import time
+import numpy as np
+import torch
+import torch.multiprocessing as mp
+from collections import deque
+from copy import deepcopy
+import utils
+from envs import make_env
+
+
+# eval modes in logging order, with the seed offset of their environments
+EVAL_MODES = [
+	('train', 0),
+	('color_easy', 42),
+	('color_hard', 84),
+	('video_easy', 126),
+	('video_hard', 168)
+]
+
+
+def make_eval_env(args, mode, index=0):
+	"""Creates copy `index` of the environment used to evaluate `mode`"""
+	seed = args.seed + dict(EVAL_MODES)[mode] + 1000*index
+	kwargs = dict(
+		domain_name=args.domain_name,
+		task_name=args.task_name,
+		seed=seed,
+		episode_length=args.episode_length,
+		action_repeat=args.action_repeat,
+		image_size=args.image_size,
+		mode=mode
+	)
+	if mode != 'train':
+		kwargs['intensity'] = args.distracting_cs_intensity
+	return make_env(**kwargs)
+
+
+def eval_modes(args):
+	if args.eval_mode is None:
+		return ['train']
+	return [mode for mode, _ in EVAL_MODES]
+
+
+def make_eval_envs(args, train_env=None):
+	"""Creates `args.eval_envs` copies of the environment of every eval mode"""
+	envs = {}
+	for mode in eval_modes(args):
+		envs[mode] = [
+			train_env if (mode == 'train' and i == 0 and train_env is not None) else make_eval_env(args, mode, i)
+			for i in range(args.eval_envs)
+		]
+	return envs
+
+
+def evaluate_batched(envs, agent, num_episodes):
+	"""Runs `num_episodes` episodes over the environment copies in lockstep.
+
+	Each round resets up to len(envs) environments and steps them together,
+	with a single actor forward pass per step for all environments that are
+	still running. Environments whose episode has ended are masked out until
+	the round is over.
+	"""
+	episode_rewards = []
+	while len(episode_rewards) < num_episodes:
+		n = min(len(envs), num_episodes - len(episode_rewards))
+		obs = [env.reset() for env in envs[:n]]
+		rewards = np.zeros(n)
+		running = np.ones(n, dtype=bool)
+		while running.any():
+			idxs = np.flatnonzero(running)
+			with utils.eval_mode(agent):
+				actions = agent.select_actions([obs[i] for i in idxs])
+			for i, action in zip(idxs, actions):
+				obs[i], reward, done, _ = envs[i].step(action)
+				rewards[i] += reward
+				running[i] = not done
+		episode_rewards.extend(rewards.tolist())
+	return episode_rewards
+
+
+def confidence_half_width(episode_rewards, method='t', confidence=0.95, num_resamples=1000):
+	"""Half-width of the confidence interval of the mean return, from a t-interval or a percentile bootstrap"""
+	x = np.asarray(episode_rewards, dtype=np.float64)
+	n = len(x)
+	if n < 2:
+		return float('inf')
+	if method == 'bootstrap':
+		rng = np.random.RandomState(n)
+		means = x[rng.randint(0, n, size=(num_resamples, n))].mean(axis=1)
+		low, high = np.percentile(means, [50*(1 - confidence), 50*(1 + confidence)])
+		return float(high - low) / 2
+	return float(t_quantile(confidence, n - 1) * x.std(ddof=1) / np.sqrt(n))
+
+
+def _t_central_mass(t, dof):
+	"""P(|T| <= t) for Student's t with an integer number of degrees of freedom (Abramowitz & Stegun 26.7.3-4)"""
+	theta = math.atan(t / math.sqrt(dof))
+	c2 = math.cos(theta)**2
+	if dof % 2 == 0:
+		term = total = 1.
+		for k in range(2, dof, 2):
+			term *= c2 * (k - 1) / k
+			total += term
+		return math.sin(theta) * total
+	total = 0.
+	if dof > 1:
+		term = total = 1.
+		for k in range(3, dof, 2):
+			term *= c2 * (k - 1) / k
+			total += term
+	return 2 / math.pi * (theta + math.sin(theta) * math.cos(theta) * total)
+
+
+def t_quantile(confidence, dof):
+	"""Half-width in standard errors of the central confidence interval of Student's t with dof degrees of freedom"""
+	low, high = 0., 1.
+	while _t_central_mass(high, dof) < confidence:
+		low, high = high, 2*high
+	for _ in range(60):
+		mid = (low + high) / 2
+		if _t_central_mass(mid, dof) < confidence:
+			low = mid
+		else:
+			high = mid
+	return (low + high) / 2
+
+
+def evaluation_done(episode_rewards, args, max_episodes=None):
+	"""Whether enough episodes have run: max_episodes (eval_episodes by default), or with --eval_tolerance
+	as soon as the confidence interval of the mean return is narrow enough and eval_min_episodes have run"""
+	n = len(episode_rewards)
+	if n >= (max_episodes or args.eval_episodes):
+		return True
+	if args.eval_tolerance <= 0 or n < args.eval_min_episodes:
+		return False
+	return confidence_half_width(episode_rewards, args.eval_ci, args.eval_confidence) <= args.eval_tolerance
+
+
+def evaluate_episodes(args, envs, agent, max_episodes=None):
+	"""Runs rounds of len(envs) episodes until evaluation_done"""
+	max_episodes = max_episodes or args.eval_episodes
+	if args.eval_tolerance <= 0:
+		return evaluate_batched(envs, agent, max_episodes)
+	episode_rewards = []
+	while not evaluation_done(episode_rewards, args, max_episodes):
+		episode_rewards += evaluate_batched(envs, agent, min(len(envs), max_episodes - len(episode_rewards)))
+	return episode_rewards
+
+
+class ActorPolicy(object):
+	"""Minimal agent interface around a CPU actor, used by eval workers"""
+	def __init__(self, actor):
+		self.actor = actor
+		self.training = False
+
+	def train(self, training=True):
+		self.training = training
+		self.actor.train(training)
+
+	def select_actions(self, obses):
+		_obs = torch.as_tensor(np.stack([np.asarray(obs) for obs in obses]))
+		with torch.no_grad():
+			mu, _, _, _ = self.actor(_obs, compute_pi=False, compute_log_pi=False)
+		return mu.numpy()
+
+
+def _eval_worker(args, mode, actor, conn):
+	torch.set_num_threads(1)
+	envs = [make_eval_env(args, mode, i) for i in range(args.eval_envs)]
+	policy = ActorPolicy(actor)
+	while True:
+		cmd, data = conn.recv()
+		if cmd == 'close':
+			break
+		conn.send(evaluate_episodes(args, envs, policy, data))
+	conn.close()
+
+
+class ParallelEvaluator(object):
+	"""Evaluates all modes concurrently with one persistent worker process per mode.
+
+	Workers read a CPU copy of the actor whose tensors live in shared memory;
+	the learner copies its current weights into it before each evaluation.
+	"""
+	def __init__(self, args, actor, modes=None):
+		self.modes = modes if modes is not None else eval_modes(args)
+		self.actor = deepcopy(actor).cpu()
+		self.actor.share_memory()
+		ctx = mp.get_context('spawn')
+		self._conns, self._procs = [], []
+		for mode in self.modes:
+			conn, child_conn = ctx.Pipe()
+			proc = ctx.Process(target=_eval_worker, args=(args, mode, self.actor, child_conn), daemon=True)
+			proc.start()
+			self._conns.append(conn)
+			self._procs.append(proc)
+
+	def sync(self, state_dict):
+		with torch.no_grad():
+			shared = self.actor.state_dict()
+			for key, value in state_dict.items():
+				shared[key].copy_(value)
+
+	def evaluate(self, actor, num_episodes):
+		"""Returns a dict of episode rewards per mode"""
+		return self.evaluate_state(actor.state_dict(), num_episodes)
+
+	def evaluate_state(self, state_dict, num_episodes):
+		self.sync(state_dict)
+		for conn in self._conns:
+			conn.send(('eval', num_episodes))
+		return {mode: conn.recv() for mode, conn in zip(self.modes, self._conns)}
+
+	def close(self):
+		for conn, proc in zip(self._conns, self._procs):
+			if proc.is_alive():
+				conn.send(('close', None))
+			proc.join()
+
+
+class AsyncEvaluator(object):
+	"""Evaluates actor snapshots in the background while training continues.
+
+	submit() copies the actor weights to host memory and queues them; a
+	dispatcher thread feeds queued snapshots to a ParallelEvaluator one at a
+	time. When more than `max_pending` snapshots are waiting, `policy` decides
+	which one is discarded:
+		drop_oldest: discard the oldest waiting snapshot
+		drop_newest: discard the incoming snapshot
+		coalesce: the incoming snapshot replaces the newest waiting one
+	Finished evaluations are returned by poll() together with the step the
+	weights were taken at.
+	"""
+	def __init__(self, args, actor, num_episodes, max_pending=2, policy='drop_oldest'):
+		assert policy in {'drop_oldest', 'drop_newest', 'coalesce'}, f'invalid policy: {policy}'
+		self.num_episodes = num_episodes
+		self.max_pending = max_pending
+		self.policy = policy
+		self.dropped = 0
+		self._evaluator = ParallelEvaluator(args, actor)
+		self._pending = deque()
+		self._results = queue.Queue()
+		self._cond = threading.Condition()
+		self._closed = False
+		self._thread = threading.Thread(target=self._run, daemon=True)
+		self._thread.start()
+
+	def submit(self, step, actor, info=None):
+		"""Queues a snapshot of the actor, returns False if it was dropped"""
+		state_dict = {k: v.detach().to('cpu', copy=True) for k, v in actor.state_dict().items()}
+		item = (step, state_dict, info)
+		with self._cond:
+			if len(self._pending) >= self.max_pending:
+				self.dropped += 1
+				if self.policy == 'drop_newest':
+					return False
+				elif self.policy == 'drop_oldest':
+					self._pending.popleft()
+				else:
+					self._pending.pop()
+			self._pending.append(item)
+			self._cond.notify()
+		return True
+
+	def _run(self):
+		while True:
+			with self._cond:
+				while len(self._pending) == 0 and not self._closed:
+					self._cond.wait()
+				if len(self._pending) == 0:
+					return
+				step, state_dict, info = self._pending.popleft()
+			start_time = time.time()
+			results = self._evaluator.evaluate_state(state_dict, self.num_episodes)
+			self._results.put((step, info, results, time.time() - start_time))
+
+	def poll(self):
+		"""Returns all finished evaluations as (step, info, results, duration)"""
+		finished = []
+		while True:
+			try:
+				finished.append(self._results.get_nowait())
+			except queue.Empty:
+				return finished
+
+	def close(self):
+		"""Waits for all queued snapshots and returns their results"""
+		with self._cond:
+			self._closed = True
+			self._cond.notify()
+		self._thread.join()
+		self._evaluator.close()
+		return self.poll()
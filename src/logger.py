@@ -1,8 +1,10 @@
 from collections import defaultdict
-import json
+import atexit
 import os
 import torch
 from termcolor import colored
+from columnar import JsonLinesWriter, ColumnarWriter, AsyncWriter
+from param_stats import histogram
 
 FORMAT_CONFIG = {
     'rl': {
@@ -31,10 +33,19 @@ class AverageMeter(object):
 
 
 class MetersGroup(object):
-    def __init__(self, file_name, formating):
+    def __init__(self, file_name, formating, log_format='json', async_write=False):
+        assert log_format in {'json', 'columnar', 'both'}, f'invalid log format: {log_format}'
         self._file_name = file_name
         self._formating = formating
         self._meters = defaultdict(AverageMeter)
+        writers = []
+        if log_format in {'json', 'both'}:
+            writers.append(JsonLinesWriter(file_name))
+        if log_format in {'columnar', 'both'}:
+            writers.append(ColumnarWriter(os.path.splitext(file_name)[0]))
+        if async_write:
+            writers = [AsyncWriter(writers)]
+        self._writers = writers
 
     def log(self, key, value, n=1):
         self._meters[key].update(value, n)
@@ -51,8 +62,8 @@ class MetersGroup(object):
         return data
 
     def _dump_to_file(self, data):
-        with open(self._file_name, 'a') as f:
-            f.write(json.dumps(data) + '\n')
+        for writer in self._writers:
+            writer.write(data)
 
     def _format(self, key, value, ty):
         template = '%s: '
@@ -83,18 +94,29 @@ class MetersGroup(object):
         self._dump_to_console(data, prefix)
         self._meters.clear()
 
+    def close(self):
+        for writer in self._writers:
+            writer.close()
+
 
 class Logger(object):
-    def __init__(self, log_dir, config='rl'):
+    def __init__(self, log_dir, config='rl', log_format='json', async_write=False):
         self._log_dir = log_dir
         self._train_mg = MetersGroup(
             os.path.join(log_dir, 'train.log'),
-            formating=FORMAT_CONFIG[config]['train']
+            formating=FORMAT_CONFIG[config]['train'],
+            log_format=log_format,
+            async_write=async_write
         )
         self._eval_mg = MetersGroup(
             os.path.join(log_dir, 'eval.log'),
-            formating=FORMAT_CONFIG[config]['eval']
+            formating=FORMAT_CONFIG[config]['eval'],
+            log_format=log_format,
+            async_write=async_write
         )
+        self._async_write = async_write
+        self._params_writer = None
+        atexit.register(self.close)
 
     def log(self, key, value, step, n=1):
         assert key.startswith('train') or key.startswith('eval')
@@ -103,15 +125,46 @@ class Logger(object):
         mg = self._train_mg if key.startswith('train') else self._eval_mg
         mg.log(key, value, n)
 
+    def _write_params(self, data):
+        """Parameter statistics and histograms go to params.log, one JSON line per record"""
+        if self._params_writer is None:
+            writer = JsonLinesWriter(os.path.join(self._log_dir, 'params.log'))
+            self._params_writer = AsyncWriter([writer]) if self._async_write else writer
+        self._params_writer.write(data)
+
+    def log_histogram(self, key, values, step):
+        counts, low, high = histogram(values)
+        self._write_params({'step': step, 'key': key, 'histogram': {'counts': counts, 'low': low, 'high': high}})
+
     def log_param(self, key, param, step):
         self.log_histogram(key + '_w', param.weight.data, step)
         if hasattr(param.weight, 'grad') and param.weight.grad is not None:
             self.log_histogram(key + '_w_g', param.weight.grad.data, step)
-        if hasattr(param, 'bias'):
+        if getattr(param, 'bias', None) is not None:
             self.log_histogram(key + '_b', param.bias.data, step)
-            if hasattr(param.bias, 'grad') and param.bias.grad is not None:
+            if param.bias.grad is not None:
                 self.log_histogram(key + '_b_g', param.bias.grad.data, step)
 
+    def log_param_stats(self, stats, step):
+        """Writes the output of ParamStatsSampler.sample, and the global norms as train/<kind>_norm_<network>"""
+        for network, kinds in stats.items():
+            for kind, data in kinds.items():
+                self.log(f'train/{kind}_norm_{network}', data['global_norm'], step)
+                self._write_params(dict(data, step=step, key=f'{network}/{kind}'))
+
     def dump(self, step):
         self._train_mg.dump(step, 'train')
         self._eval_mg.dump(step, 'eval')
+
+    def dump_eval(self, step):
+        self._eval_mg.dump(step, 'eval')
+
+    def close(self):
+        try:
+            self._train_mg.close()
+        finally:
+            try:
+                self._eval_mg.close()
+            finally:
+                if self._params_writer is not None:
+                    self._params_writer.close()
@@ -0,0 +1,185 @@
+import json
+import math
+import resource
+import numpy as np
+import torch
+import torch.nn as nn
+import utils
+from algorithms.factory import make_agent
+
+
+MB = 2**20
+
+
+def rss_mb():
+	"""Current resident set size of this process in MB"""
+	try:
+		with open('/proc/self/status') as f:
+			for line in f:
+				if line.startswith('VmRSS:'):
+					return int(line.split()[1]) / 1024
+	except OSError:
+		pass
+	return peak_rss_mb()
+
+
+def peak_rss_mb():
+	return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def log(L, step):
+	L.log('train/rss_mb', rss_mb(), step)
+	L.log('train/peak_rss_mb', peak_rss_mb(), step)
+
+
+def _frames_of(entry):
+	if isinstance(entry, tuple):
+		for lazy in entry:
+			yield from _frames_of(lazy)
+	elif isinstance(entry, utils.LazyFrames):
+		yield from (entry.frames if entry.frames is not None else [entry._out])
+	else:
+		yield entry
+
+
+def replay_report(replay_buffer):
+	"""Bytes held by each column of a replay buffer, frames shared between stacks are counted once"""
+	columns = {}
+	if hasattr(replay_buffer, '_frames'):
+		for name in ['frames', 'obs_frames', 'next_obs_frames']:
+			columns[name] = getattr(replay_buffer, name).nbytes
+	else:
+		seen, nbytes = set(), 0
+		for entry in replay_buffer._obses:
+			for frame in _frames_of(entry):
+				if id(frame) not in seen:
+					seen.add(id(frame))
+					nbytes += frame.nbytes
+		columns['obs'] = nbytes
+	for name in ['actions', 'rewards', 'not_dones']:
+		columns[name] = getattr(replay_buffer, name).nbytes
+	return columns
+
+
+def projected_replay_report(obs_shape, action_shape, capacity, episode_steps):
+	"""Bytes of a full list-of-LazyFrames ReplayBuffer.
+
+	Each step adds one new frame and each episode one more (the reset frame,
+	which is repeated to fill the stack). The Python objects around every
+	transition are measured on one sample transition.
+	"""
+	frame = np.zeros((3, *obs_shape[1:]), dtype=np.uint8)
+	num_frames = capacity + math.ceil(capacity / episode_steps)
+	overhead = utils.lazy_frames_overhead(obs_shape[0] // 3)
+	return {
+		'obs': num_frames * frame.nbytes,
+		'obs_objects': capacity * overhead,
+		'actions': capacity * int(np.prod(action_shape)) * 4,
+		'rewards': capacity * 4,
+		'not_dones': capacity * 4
+	}
+
+
+def _tensor_bytes(tensors, seen=None):
+	seen = set() if seen is None else seen
+	nbytes = 0
+	for t in tensors:
+		if t is not None and t.data_ptr() not in seen:
+			seen.add(t.data_ptr())
+			nbytes += t.numel() * t.element_size()
+	return nbytes
+
+
+def network_report(agent, projected=False):
+	"""Parameter, gradient and optimizer-state bytes of each network and optimizer of an agent.
+
+	Networks that share modules (the encoder is shared by actor and critic)
+	list the shared part under each of them; `total` counts it once. With
+	projected=True gradients and Adam moments are computed from the trainable
+	parameters instead of read from the current state.
+	"""
+	agent = getattr(agent, 'agent', agent)
+	# only the parameters that an optimizer steps get gradients (the targets are updated by EMA)
+	optimized = set(p.data_ptr() for value in vars(agent).values() if isinstance(value, torch.optim.Optimizer)
+		for group in value.param_groups for p in group['params'])
+	report, seen_params, seen_grads = {}, set(), set()
+	total = {'params': 0, 'grads': 0, 'optimizer_state': 0}
+	for name, value in vars(agent).items():
+		if isinstance(value, nn.Module):
+			params = list(value.parameters()) + list(value.buffers())
+			trainable = [p for p in value.parameters() if p.data_ptr() in optimized]
+			grads = trainable if projected else [p.grad for p in value.parameters()]
+			report[name] = {'params': _tensor_bytes(params), 'grads': _tensor_bytes(grads)}
+			total['params'] += _tensor_bytes(params, seen_params)
+			total['grads'] += _tensor_bytes(grads, seen_grads)
+		elif isinstance(value, torch.Tensor):
+			report[name] = {'params': _tensor_bytes([value]), 'grads': _tensor_bytes([value] if projected else [value.grad])}
+			total['params'] += _tensor_bytes([value], seen_params)
+			total['grads'] += _tensor_bytes([value] if projected else [value.grad], seen_grads)
+	for name, value in vars(agent).items():
+		if isinstance(value, torch.optim.Optimizer):
+			params = [p for group in value.param_groups for p in group['params']]
+			if projected:
+				# Adam keeps exp_avg and exp_avg_sq per parameter
+				nbytes = 2 * _tensor_bytes(params)
+			else:
+				nbytes = _tensor_bytes([t for state in value.state.values() for t in state.values() if isinstance(t, torch.Tensor)])
+			report[name] = {'optimizer_state': nbytes}
+			total['optimizer_state'] += nbytes
+	report['total'] = total
+	return report
+
+
+def format_report(report):
+	lines = []
+	for section, columns in report.items():
+		if not isinstance(columns, dict):
+			lines.append('%-28s %s' % (section, columns))
+			continue
+		lines.append(section)
+		for name, value in columns.items():
+			if isinstance(value, dict):
+				value = ', '.join('%s %.1f MB' % (k, v / MB) for k, v in value.items())
+			else:
+				value = '%.1f MB' % (value / MB)
+			lines.append('  %-26s %s' % (name, value))
+	return '\n'.join(lines)
+
+
+def run_report(replay_buffer, agent):
+	"""Current replay and network footprint at the start of a run"""
+	return {
+		'replay': replay_report(replay_buffer),
+		'networks': network_report(agent),
+		'networks_projected': network_report(agent, projected=True),
+		'rss_mb': rss_mb()
+	}
+
+
+def dry_run(args, env, capacity):
+	"""Prints the projected footprint of a run with these args, without allocating the replay buffer"""
+	cropped_obs_shape = (3*args.frame_stack, args.image_crop_size, args.image_crop_size)
+	agent = make_agent(
+		obs_shape=cropped_obs_shape,
+		action_shape=env.action_space.shape,
+		args=args
+	)
+	replay = projected_replay_report(env.observation_space.shape, env.action_space.shape, capacity, env._max_episode_steps)
+	networks = network_report(agent, projected=True)
+	report = {
+		'replay': replay,
+		'networks': networks,
+		'summary': {
+			'replay': sum(replay.values()),
+			'networks': sum(networks['total'].values()),
+			'process_baseline': rss_mb() * MB
+		}
+	}
+	report['summary']['total'] = sum(report['summary'].values())
+	print(format_report(report))
+	return report
+
+
+def save_report(report, path):
+	with open(path, 'w') as f:
+		json.dump(report, f, indent=4)
@@ -0,0 +1,113 @@
+import torch
+import profiling
+
+
+QUANTILES = (0., 0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99, 1.)
+
+
+def _summarize(flat, lengths, sketch_idxs, num_bins, quantiles):
+	"""Per-tensor sum, sum of squares, min and max of the concatenated tensors in flat,
+	quantiles of a fixed sample of its entries and a histogram over [min, max], as one tensor"""
+	sums = torch.segment_reduce(flat, 'sum', lengths=lengths)
+	sumsqs = torch.segment_reduce(flat * flat, 'sum', lengths=lengths)
+	mins = torch.segment_reduce(flat, 'min', lengths=lengths)
+	maxs = torch.segment_reduce(flat, 'max', lengths=lengths)
+	sketch = torch.quantile(flat[sketch_idxs], quantiles)
+	low, high = mins.min(), maxs.max()
+	bins = ((flat - low) / (high - low).clamp(min=1e-12) * num_bins).long().clamp(0, num_bins - 1)
+	counts = torch.bincount(bins, minlength=num_bins).float()
+	return torch.cat([sums, sumsqs, mins, maxs, sketch, low.view(1), high.view(1), counts])
+
+
+def histogram(values, num_bins=32):
+	"""Histogram of a tensor over its own range, as (counts, low, high)"""
+	values = values.detach().reshape(-1).float()
+	lengths = torch.tensor([values.numel()], device=values.device)
+	idxs = torch.arange(min(values.numel(), 4096), device=values.device)
+	packed = _summarize(values, lengths, idxs, num_bins, torch.tensor(QUANTILES, device=values.device)).cpu()
+	return packed[-num_bins:].tolist(), packed[-num_bins-2].item(), packed[-num_bins-1].item()
+
+
+class ParamStatsSampler(object):
+	"""Statistics of the parameters and gradients of a set of networks, sampled every freq steps.
+
+	All parameters (and all gradients) of a network are concatenated into one
+	vector, reduced per tensor with segment reductions and summarized by
+	quantiles of a fixed random subset of entries and a histogram. The results
+	of all networks are packed into a single tensor, so a sample costs a
+	handful of kernels per network and one device-to-host copy.
+	"""
+	def __init__(self, modules, freq, num_bins=32, sketch_size=4096, quantiles=QUANTILES):
+		self.modules = modules
+		self.freq = freq
+		self.num_bins = num_bins
+		self.sketch_size = sketch_size
+		self.quantiles = quantiles
+		self._next_step = 0
+		self._layouts = {}
+		for name, module in modules.items():
+			names, params = zip(*module.named_parameters())
+			device = params[0].device
+			numel = sum(p.numel() for p in params)
+			self._layouts[name] = {
+				'names': list(names),
+				'params': list(params),
+				'sketch_idxs': torch.randint(0, numel, (min(numel, sketch_size),), device=device),
+				'quantiles': torch.tensor(quantiles, device=device)
+			}
+
+	def instrument(self, agent):
+		"""Samples after every agent update that reaches the next multiple of freq"""
+		update = agent.update
+		def update_and_sample(replay_buffer, L, step):
+			update(replay_buffer, L, step)
+			if L is not None and step >= self._next_step:
+				with profiling.phase('param_stats'):
+					L.log_param_stats(self.sample(), step)
+				self._next_step = step - step % self.freq + self.freq
+		agent.update = update_and_sample
+
+	@torch.no_grad()
+	def sample(self):
+		"""{network: {'param' | 'grad': stats}}, gradients only for the parameters that have one"""
+		packs, layout = [], []
+		for name, spec in self._layouts.items():
+			for kind in ['param', 'grad']:
+				if kind == 'param':
+					tensors, names = spec['params'], spec['names']
+					sketch_idxs = spec['sketch_idxs']
+				else:
+					have_grad = [(n, p.grad) for n, p in zip(spec['names'], spec['params']) if p.grad is not None]
+					if len(have_grad) == 0:
+						continue
+					names, tensors = [list(x) for x in zip(*have_grad)]
+					numel = sum(t.numel() for t in tensors)
+					sketch_idxs = spec['sketch_idxs'] % numel
+				flat = torch.cat([t.reshape(-1) for t in tensors]).float()
+				lengths = torch.tensor([t.numel() for t in tensors], device=flat.device)
+				packs.append(_summarize(flat, lengths, sketch_idxs, self.num_bins, spec['quantiles']))
+				layout.append((name, kind, names, [t.numel() for t in tensors]))
+		packed = torch.cat(packs).cpu().tolist()
+
+		stats, offset = {}, 0
+		n_q, n_b = len(self.quantiles), self.num_bins
+		for name, kind, names, numels in layout:
+			n = len(names)
+			sums, sumsqs, mins, maxs = [packed[offset + i*n:offset + (i+1)*n] for i in range(4)]
+			offset += 4*n
+			sketch = packed[offset:offset + n_q]
+			low, high = packed[offset + n_q:offset + n_q + 2]
+			counts = packed[offset + n_q + 2:offset + n_q + 2 + n_b]
+			offset += n_q + 2 + n_b
+			stats.setdefault(name, {})[kind] = {
+				'names': names,
+				'norm': [s ** 0.5 for s in sumsqs],
+				'mean': [s / k for s, k in zip(sums, numels)],
+				'std': [max(0., q / k - (s / k) ** 2) ** 0.5 for s, q, k in zip(sums, sumsqs, numels)],
+				'min': mins,
+				'max': maxs,
+				'global_norm': sum(sumsqs) ** 0.5,
+				'quantiles': dict(zip([str(q) for q in self.quantiles], sketch)),
+				'histogram': {'counts': counts, 'low': low, 'high': high}
+			}
+		return stats
@@ -0,0 +1,201 @@
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+import torch
+import augmentations
+
+
+class _NullPhase(object):
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *args):
+		return False
+
+
+_NULL_PHASE = _NullPhase()
+
+
+class PhaseTimer(object):
+	"""Accumulates wall time per phase of the training loop.
+
+	Phases may nest; each phase is charged its own (exclusive) time, so the
+	totals of all phases add up to the instrumented time. While a trace window
+	is open, every phase is also recorded as a Chrome trace event, or as a
+	torch.profiler range when tracing with torch.profiler. With track_memory,
+	the peak CUDA allocator usage within each phase (children included) is
+	recorded as well. Phases may run on several threads (the env-step thread
+	of --overlap_env_step); the totals are updated and logged under a lock,
+	but the allocator peak is process-wide, so track_memory must stay off then.
+	"""
+	def __init__(self):
+		self.enabled = False
+		self.sync_cuda = False
+		self.track_memory = False
+		self._totals = defaultdict(float)
+		self._peaks = defaultdict(int)
+		self._counts = defaultdict(int)
+		self._local = threading.local()
+		self._lock = threading.Lock()
+		self._trace_range = None
+		self._trace_format = 'chrome'
+		self._trace_path = None
+		self._events = None
+		self._profiler = None
+
+	def configure(self, enabled=True, sync_cuda=False, track_memory=False, trace_range=None, trace_format='chrome', trace_path=None):
+		self.enabled = enabled
+		self.sync_cuda = sync_cuda and torch.cuda.is_available()
+		self.track_memory = track_memory and torch.cuda.is_available()
+		self._trace_range = trace_range
+		self._trace_format = trace_format
+		self._trace_path = trace_path
+
+	def phase(self, name):
+		if not self.enabled:
+			return _NULL_PHASE
+		return self._phase(name)
+
+	@contextmanager
+	def _phase(self, name):
+		stack = getattr(self._local, 'stack', None)
+		if stack is None:
+			stack = self._local.stack = []
+		if self._profiler is not None:
+			record = torch.profiler.record_function(name)
+			record.__enter__()
+		if self.track_memory:
+			# the allocator keeps a single peak, so hand the peak so far to the enclosing phase
+			if len(stack) > 0:
+				stack[-1][1] = max(stack[-1][1], torch.cuda.max_memory_allocated())
+			torch.cuda.reset_peak_memory_stats()
+		stack.append([0., 0])
+		start = time.perf_counter()
+		try:
+			yield
+		finally:
+			if self.sync_cuda:
+				torch.cuda.synchronize()
+			end = time.perf_counter()
+			elapsed = end - start
+			children, peak = stack.pop()
+			if self.track_memory:
+				peak = max(peak, torch.cuda.max_memory_allocated())
+				torch.cuda.reset_peak_memory_stats()
+			if len(stack) > 0:
+				stack[-1][0] += elapsed
+				stack[-1][1] = max(stack[-1][1], peak)
+			with self._lock:
+				self._totals[name] += elapsed - children
+				self._counts[name] += 1
+				if self.track_memory:
+					self._peaks[name] = max(self._peaks[name], peak)
+				if self._events is not None:
+					self._events.append({
+						'name': name, 'ph': 'X', 'pid': os.getpid(), 'tid': threading.get_ident(),
+						'ts': start * 1e6, 'dur': elapsed * 1e6
+					})
+			if self._profiler is not None:
+				record.__exit__(None, None, None)
+
+	def step(self, step):
+		"""Opens or closes the trace window at the configured steps"""
+		if not self.enabled or self._trace_range is None:
+			return
+		start, end = self._trace_range
+		if step == start:
+			if self._trace_format == 'torch':
+				activities = [torch.profiler.ProfilerActivity.CPU]
+				if torch.cuda.is_available():
+					activities.append(torch.profiler.ProfilerActivity.CUDA)
+				self._profiler = torch.profiler.profile(activities=activities)
+				self._profiler.__enter__()
+			else:
+				self._events = []
+		elif step == end:
+			self.close_trace()
+
+	def close_trace(self):
+		if self._profiler is not None:
+			self._profiler.__exit__(None, None, None)
+			self._profiler.export_chrome_trace(self._trace_path)
+			self._profiler = None
+			print('Saved trace to', self._trace_path)
+		elif self._events is not None:
+			with self._lock:
+				events, self._events = self._events, None
+			with open(self._trace_path, 'w') as f:
+				json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+			print('Saved trace to', self._trace_path)
+
+	def log(self, L, step):
+		"""Logs the time spent in each phase since the last call as train/time_<phase>, and its peak memory as train/peak_mb_<phase>"""
+		if not self.enabled:
+			return
+		with self._lock:
+			totals, peaks = dict(self._totals), dict(self._peaks)
+			self._totals.clear()
+			self._counts.clear()
+			self._peaks.clear()
+		for name, total in totals.items():
+			L.log(f'train/time_{name}', total, step)
+		for name, peak in peaks.items():
+			L.log(f'train/peak_mb_{name}', peak / 2**20, step)
+
+
+timer = PhaseTimer()
+
+
+def phase(name):
+	return timer.phase(name)
+
+
+def _timed(name, fn):
+	def timed_fn(*args, **kwargs):
+		with timer.phase(name):
+			return fn(*args, **kwargs)
+	return timed_fn
+
+
+def instrument(agent, replay_buffer):
+	"""Wraps the update phases of an agent, the sampling methods of its replay buffer and the augmentations"""
+	# a data-parallel learner forwards to the agent it wraps
+	agent = getattr(agent, 'agent', agent)
+	phases = {
+		'update': 'update',
+		'update_critic': 'critic_update',
+		'update_actor_and_alpha': 'actor_update',
+		'soft_update_critic_target': 'target_ema',
+		'update_soda': 'aux_update',
+		'aug_func': 'augmentation'
+	}
+	for attr, name in phases.items():
+		fn = getattr(agent, attr, None)
+		if callable(fn):
+			setattr(agent, attr, _timed(name, fn))
+	for attr in ['sample', 'sample_sac', 'sample_drq', 'sample_svea', 'sample_soda', '_gather']:
+		fn = getattr(replay_buffer, attr, None)
+		if callable(fn):
+			setattr(replay_buffer, attr, _timed('sample', fn))
+	if not getattr(augmentations, '_instrumented', False):
+		for attr in ['random_crop', 'random_shift', 'random_overlay', 'random_conv']:
+			setattr(augmentations, attr, _timed('augmentation', getattr(augmentations, attr)))
+		augmentations._instrumented = True
+
+
+def measure_overhead(n=100000):
+	"""Seconds spent per phase by the timer itself, measured on empty phases"""
+	enabled = timer.enabled
+	timer.enabled = True
+	start = time.perf_counter()
+	for _ in range(n):
+		with timer.phase('_overhead'):
+			pass
+	overhead = (time.perf_counter() - start) / n
+	timer.enabled = enabled
+	timer._totals.pop('_overhead', None)
+	timer._counts.pop('_overhead', None)
+	return overhead
@@ -0,0 +1,135 @@
+import numpy as np
+import torch
+import utils
+
+
+class SharedReplayBuffer(utils.ReplayBuffer):
+	"""Replay buffer in shared memory, written by one process and sampled by many.
+
+	Frames are stored once in a ring of (3, H, W) uint8 frames and every
+	transition keeps the ring positions of the frames in its obs and next_obs
+	stacks. Consecutive LazyFrames share frame objects, so frames are
+	deduplicated by identity and a step normally adds a single frame. A
+	transition is valid while all of its frames are still in the ring; the
+	oldest valid transition is tracked as frames are overwritten.
+
+	The buffer can be passed to processes started with torch.multiprocessing.
+	Only the process that created it may call add(), and sampling must not
+	overlap with add() (the data-parallel learner runs them in lockstep).
+	"""
+	def __init__(self, obs_shape, action_shape, capacity, batch_size, args, frame_capacity=None):
+		self.capacity = capacity
+		self.batch_size = batch_size
+		self.args = args
+		self.device = utils.get_device(args)
+		self.frame_stack = obs_shape[0] // 3
+		self.frame_capacity = frame_capacity or capacity + capacity // 8 + 2*self.frame_stack
+
+		self._frames = torch.zeros((self.frame_capacity, 3, *obs_shape[1:]), dtype=torch.uint8).share_memory_()
+		self._obs_frames = torch.zeros((capacity, self.frame_stack), dtype=torch.int64).share_memory_()
+		self._next_obs_frames = torch.zeros((capacity, self.frame_stack), dtype=torch.int64).share_memory_()
+		self._actions = torch.zeros((capacity, *action_shape), dtype=torch.float32).share_memory_()
+		self._rewards = torch.zeros((capacity, 1), dtype=torch.float32).share_memory_()
+		self._not_dones = torch.zeros((capacity, 1), dtype=torch.float32).share_memory_()
+		# transitions written, frames written, oldest valid transition
+		self._counters = torch.zeros(3, dtype=torch.int64).share_memory_()
+		self._init_views()
+		self._recent = {}
+
+	@classmethod
+	def transition_bytes(cls, obs_shape, action_shape):
+		c,h,w = obs_shape
+		# 9/8 ring frames and the frame positions of both stacks per transition
+		return 3*h*w * 9 // 8 + 2*(c // 3)*8 + 4*(int(np.prod(action_shape)) + 2)
+
+	def _init_views(self):
+		self.frames = self._frames.numpy()
+		self.obs_frames = self._obs_frames.numpy()
+		self.next_obs_frames = self._next_obs_frames.numpy()
+		self.actions = self._actions.numpy()
+		self.rewards = self._rewards.numpy()
+		self.not_dones = self._not_dones.numpy()
+		self.counters = self._counters.numpy()
+
+	def __getstate__(self):
+		state = self.__dict__.copy()
+		for key in ['frames', 'obs_frames', 'next_obs_frames', 'actions', 'rewards', 'not_dones', 'counters', '_recent']:
+			del state[key]
+		return state
+
+	def __setstate__(self, state):
+		self.__dict__.update(state)
+		self._init_views()
+		self._recent = {}
+
+	def __len__(self):
+		num_transitions, _, oldest = self.counters
+		return int(num_transitions - max(oldest, num_transitions - self.capacity))
+
+	@property
+	def idx(self):
+		return int(self.counters[0] % self.capacity)
+
+	@property
+	def num_added(self):
+		return int(self.counters[0])
+
+	@property
+	def full(self):
+		return bool(self.counters[0] >= self.capacity)
+
+	def _store_frames(self, obs):
+		"""Writes the frames of obs that are not stored yet, returns their absolute frame indices"""
+		frames = getattr(obs, 'frames', None)
+		if frames is None:
+			frames = list(np.asarray(obs).reshape(self.frame_stack, 3, *self.frames.shape[2:]))
+		idxs, recent = [], {}
+		for frame in frames:
+			key = id(frame)
+			if key in self._recent:
+				recent[key] = self._recent[key]
+			elif key not in recent:
+				num_frames = int(self.counters[1])
+				self._invalidate(num_frames + 1 - self.frame_capacity)
+				self.frames[num_frames % self.frame_capacity] = frame
+				self.counters[1] = num_frames + 1
+				recent[key] = (frame, num_frames)
+			idxs.append(recent[key][1])
+		# keep references to the frames so that their ids are not reused
+		self._recent = recent
+		return idxs
+
+	def _invalidate(self, first_frame):
+		"""Advances the oldest valid transition past those using frames before first_frame"""
+		num_transitions, oldest = int(self.counters[0]), int(self.counters[2])
+		oldest = max(oldest, num_transitions - self.capacity)
+		while oldest < num_transitions and self.obs_frames[oldest % self.capacity].min() < first_frame:
+			oldest += 1
+		self.counters[2] = oldest
+
+	def add(self, obs, action, reward, next_obs, done):
+		obs_frames = self._store_frames(obs)
+		next_obs_frames = self._store_frames(next_obs)
+		num_transitions = int(self.counters[0])
+		i = num_transitions % self.capacity
+		self.obs_frames[i] = obs_frames
+		self.next_obs_frames[i] = next_obs_frames
+		np.copyto(self.actions[i], action)
+		np.copyto(self.rewards[i], reward)
+		np.copyto(self.not_dones[i], not done)
+		self.counters[2] = max(int(self.counters[2]), num_transitions + 1 - self.capacity)
+		self.counters[0] = num_transitions + 1
+
+	def _get_idxs(self, n=None):
+		if n is None:
+			n = self.batch_size
+		num_transitions, _, oldest = self.counters
+		low = max(oldest, num_transitions - self.capacity)
+		return np.random.randint(low, num_transitions, size=n) % self.capacity
+
+	def _encode_obses(self, idxs):
+		n = len(idxs)
+		shape = (n, 3*self.frame_stack, *self.frames.shape[2:])
+		obses = self.frames[self.obs_frames[idxs] % self.frame_capacity].reshape(shape)
+		next_obses = self.frames[self.next_obs_frames[idxs] % self.frame_capacity].reshape(shape)
+		return obses, next_obses
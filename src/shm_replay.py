@@ -0,0 +1,170 @@
+import multiprocessing as mp
+import time
+from multiprocessing import shared_memory
+import numpy as np
+import torch
+import utils
+
+
+class ShmReplayBuffer(utils.ReplayBuffer):
+	"""Replay buffer in one multiprocessing.shared_memory block, added to and sampled by many processes.
+
+	A slot holds the frame_stack frames of obs and the new frame of next_obs
+	(next_obs is obs shifted by one frame), the action, the reward and the
+	done flag. The header holds the write cursor (transitions reserved) and
+	the size counter (transitions committed).
+
+	Writers reserve a transition number t by incrementing the cursor, the
+	only step taken under a lock (Python has no atomic fetch-and-add across
+	processes), and then write slot t % capacity without it. Every slot has
+	a sequence number, seqlock style: odd while a writer is in the slot,
+	2*(t+1) once transition t is committed. A writer waits until the slot
+	holds transition t - capacity, so writers a lap apart take turns.
+	Samplers never block writers: they read the sequence numbers, copy the
+	rows and read the sequence numbers again, and draw again for the rows
+	that were empty, being written or overwritten in between. This relies on
+	aligned 8-byte stores being atomic and stores (loads) not being reordered
+	with other stores (loads), as on x86.
+
+	The buffer can be passed to processes started with multiprocessing or
+	torch.multiprocessing. The process that created it removes the shared
+	memory in close().
+	"""
+	def __init__(self, obs_shape, action_shape, capacity, batch_size, args):
+		self.capacity = capacity
+		self.batch_size = batch_size
+		self.args = args
+		self.device = utils.get_device(args)
+		self.frame_stack = obs_shape[0] // 3
+		self.layout = self._layout(obs_shape, action_shape, capacity)
+		nbytes = max(offset + np.dtype(dtype).itemsize * int(np.prod(shape)) for offset, dtype, shape in self.layout.values())
+		self._shm = shared_memory.SharedMemory(create=True, size=nbytes)
+		self._owner = True
+		self._lock = mp.Lock()
+		self._init_views()
+		self.header[:] = 0
+		self.seqs[:] = 0
+		self.retries = 0
+
+	@classmethod
+	def transition_bytes(cls, obs_shape, action_shape):
+		c,h,w = obs_shape
+		return (c + 3)*h*w + 8 + 4*(int(np.prod(action_shape)) + 2)
+
+	def _layout(self, obs_shape, action_shape, capacity):
+		"""Offset, dtype and shape of each array in the block, 64-byte aligned"""
+		arrays = [
+			('header', np.int64, (2,)),
+			('seqs', np.int64, (capacity,)),
+			('frames', np.uint8, (capacity, self.frame_stack + 1, 3, *obs_shape[1:])),
+			('actions', np.float32, (capacity, *action_shape)),
+			('rewards', np.float32, (capacity, 1)),
+			('not_dones', np.float32, (capacity, 1))
+		]
+		layout, offset = {}, 0
+		for name, dtype, shape in arrays:
+			layout[name] = (offset, dtype, shape)
+			offset += -(-np.dtype(dtype).itemsize * int(np.prod(shape)) // 64) * 64
+		return layout
+
+	def _init_views(self):
+		for name, (offset, dtype, shape) in self.layout.items():
+			setattr(self, name, np.ndarray(shape, dtype=dtype, buffer=self._shm.buf, offset=offset))
+
+	def __getstate__(self):
+		state = self.__dict__.copy()
+		for key in list(self.layout) + ['_shm']:
+			del state[key]
+		state['_name'] = self._shm.name
+		state['_owner'] = False
+		return state
+
+	def __setstate__(self, state):
+		name = state.pop('_name')
+		self.__dict__.update(state)
+		self._shm = shared_memory.SharedMemory(name=name)
+		self._init_views()
+
+	def close(self):
+		for name in self.layout:
+			delattr(self, name)
+		self._shm.close()
+		if self._owner:
+			self._shm.unlink()
+
+	def __len__(self):
+		return min(int(self.header[1]), self.capacity)
+
+	@property
+	def num_added(self):
+		return int(self.header[1])
+
+	@property
+	def full(self):
+		return int(self.header[1]) >= self.capacity
+
+	def add(self, obs, action, reward, next_obs, done):
+		obs, next_obs = np.asarray(obs), np.asarray(next_obs)
+		if not np.array_equal(obs[3:], next_obs[:-3]):
+			raise ValueError('next_obs must be obs shifted by one frame')
+		with self._lock:
+			t = int(self.header[0])
+			self.header[0] = t + 1
+		i = t % self.capacity
+		# wait for a writer that is still in the slot from the previous lap
+		previous = 2*(t - self.capacity + 1) if t >= self.capacity else 0
+		while self.seqs[i] != previous:
+			time.sleep(0)
+		self.seqs[i] = 2*t + 1
+		self.frames[i, :self.frame_stack] = obs.reshape(self.frame_stack, 3, *obs.shape[1:])
+		self.frames[i, self.frame_stack] = next_obs[-3:]
+		np.copyto(self.actions[i], action)
+		np.copyto(self.rewards[i], reward)
+		np.copyto(self.not_dones[i], not done)
+		self.seqs[i] = 2*t + 2
+		with self._lock:
+			self.header[1] += 1
+
+	def transition_ids(self, idxs):
+		return self.seqs[idxs] // 2 - 1
+
+	def _get_idxs(self, n=None):
+		if n is None:
+			n = self.batch_size
+		num_reserved = int(self.header[0])
+		return np.random.randint(max(0, num_reserved - self.capacity), num_reserved, size=n) % self.capacity
+
+	def _read(self, idxs):
+		"""Consistent copies of the rows of a sample of slots, the slots that fail the check are drawn again"""
+		idxs = np.array(idxs)
+		rows = [None] * 4
+		ids = np.empty(len(idxs), dtype=np.int64)
+		todo = np.arange(len(idxs))
+		while len(todo) > 0:
+			before = self.seqs[idxs[todo]]
+			copies = [column[idxs[todo]] for column in [self.frames, self.actions, self.rewards, self.not_dones]]
+			after = self.seqs[idxs[todo]]
+			ok = (before == after) & (before > 0) & (before % 2 == 0)
+			for j, copy in enumerate(copies):
+				if rows[j] is None:
+					rows[j] = np.empty((len(idxs), *copy.shape[1:]), dtype=copy.dtype)
+				rows[j][todo[ok]] = copy[ok]
+			ids[todo[ok]] = before[ok] // 2 - 1
+			todo = todo[~ok]
+			if len(todo) > 0:
+				self.retries += len(todo)
+				idxs[todo] = self._get_idxs(len(todo))
+		return rows, ids
+
+	def _gather(self, idxs):
+		"""Slots idxs as tensors on the device, with the ids of the transitions read, which differ from
+		transition_ids(idxs) where a slot was redrawn or overwritten during the read"""
+		(frames, actions, rewards, not_dones), ids = self._read(idxs)
+		frames = torch.as_tensor(frames).to(self.device)
+		shape = (len(frames), 3*self.frame_stack, *frames.shape[-2:])
+		obs = frames[:, :-1].reshape(shape)
+		next_obs = frames[:, 1:].reshape(shape)
+		actions = torch.as_tensor(actions).to(self.device)
+		rewards = torch.as_tensor(rewards).to(self.device)
+		not_dones = torch.as_tensor(not_dones).to(self.device)
+		return (obs, actions, rewards, next_obs, not_dones), ids
@@ -123,7 +123,7 @@ def main(args):
 
         #rint(torch.cuda.is_available())
         # Prepare agent
-        assert torch.cuda.is_available(), 'must have cuda enabled'
+        utils.setup_device(args)
         replay_buffer = utils.ReplayBuffer(
                 obs_shape=env.observation_space.shape,
                 action_shape=env.action_space.shape,
@@ -181,20 +181,20 @@ def main(args):
                         image=obs_[0,:3,:,:].detach().cpu()
                         image=image.permute(1,2,0).numpy()
                         import matplotlib.pyplot as plt
-                        plt.imshow(image/255)
+                        plt.imshow(image)
                         plt.show()
 
 
                         image=srm_out[0,:3,:,:].detach().cpu()
                         image=image.permute(1,2,0).numpy()
                         import matplotlib.pyplot as plt
-                        plt.imshow(image/255)
+                        plt.imshow(image)
                         plt.show()
 
                         srm_out=augmentations.mix_freq(obs_,args)
                         image=srm_out[0,:3,:,:].detach().cpu()
                         image=image.permute(1,2,0).numpy()
-                        plt.imshow(image/255)
+                        plt.imshow(image)
                         plt.show()
 
                 # Take step
@@ -1,177 +1,342 @@
 import torch
 import os
+import sys
 import numpy as np
 import gym
 import utils
 import time
+from concurrent.futures import ThreadPoolExecutor
+from copy import deepcopy
 from arguments import parse_args
-from env.wrappers import make_env
+from envs import make_env
 from algorithms.factory import make_agent
 from logger import Logger
 from video import VideoRecorder
+import evaluation
+import checkpoint
+import profiling
+import memory
+from param_stats import ParamStatsSampler
+from collectors import CollectorPool, ThroughputMeter
+from vec_env import make_vec_env
+from shared_replay import SharedReplayBuffer
+import distributed
 
 
 
 import os
 os.environ["PYOPENGL_PLATFORM"] = "egl"
 
-def evaluate(env, mode,agent, video, num_episodes, L, step, test_env=False):
-        episode_rewards = []
-        # aug_func1 = extract_low_freq(  
-        for i in range(num_episodes):
-                obs = env.reset()
-                # video.init(enabled=(i==0))
-                done = False
-                episode_reward = 0
-                while not done:
-                        with utils.eval_mode(agent):
-                                # obs = aug_func1(obs.clone())
-                                action = agent.select_action(obs)
-                        obs, reward, done, _ = env.step(action)
-                        # video.record(env)
-                        episode_reward += reward
-
-                if L is not None:
-                        _test_env = '_' + mode if test_env else ''
-                        # video.save(f'{step}{_test_env}.mp4')
-                        L.log(f'eval/episode_reward{_test_env}', episode_reward, step)
-                episode_rewards.append(episode_reward)
-        
+def log_eval(args, L, mode, episode_rewards, step):
+        _test_env = '_' + mode if mode != 'train' else ''
+        for episode_reward in episode_rewards:
+                L.log(f'eval/episode_reward{_test_env}', episode_reward, step)
+        L.log(f'eval/episodes{_test_env}', len(episode_rewards), step)
+        if len(episode_rewards) >= 2:
+                L.log(f'eval/ci{_test_env}', evaluation.confidence_half_width(episode_rewards, args.eval_ci, args.eval_confidence), step)
+
+
+def log_async_eval(args, L, results, step):
+        """Logs finished async evaluations, returns the mean train-mode return of the latest one (None if there is none)"""
+        score = None
+        for eval_step, episode, episode_rewards, duration in results:
+                L.log('eval/episode', episode, eval_step)
+                L.log('eval/duration', duration, eval_step)
+                L.log('eval/delay', step - eval_step, eval_step)
+                for mode, rewards in episode_rewards.items():
+                        log_eval(args, L, mode, rewards, eval_step)
+                L.dump_eval(eval_step)
+                score = np.mean(episode_rewards['train'])
+        return score
+
+
+def evaluate(args, envs, mode, agent, video, num_episodes, L, step, test_env=False):
+        episode_rewards = evaluation.evaluate_episodes(args, envs, agent, num_episodes)
+        if L is not None:
+                log_eval(args, L, mode, episode_rewards, step)
         return np.mean(episode_rewards)
 
 
 
-def main(args):
-        # Set seed
-        utils.set_seed_everywhere(args.seed)
-
-        # Initialize environments
-        gym.logger.set_level(40)
-        env = make_env(
-                domain_name=args.domain_name,
-                task_name=args.task_name,
-                seed=args.seed,
-                episode_length=args.episode_length,
-                action_repeat=args.action_repeat,
-                image_size=args.image_size,
-                mode='train'
-        )
-
-
-        test_env = make_env(
-                domain_name=args.domain_name,
-                task_name=args.task_name,
-                seed=args.seed+42,
-                episode_length=args.episode_length,
-                action_repeat=args.action_repeat,
-                image_size=args.image_size,
-                mode='color_easy',
-                intensity=args.distracting_cs_intensity
-        ) if args.eval_mode is not None else None
-        test_env2 = make_env(
-                domain_name=args.domain_name,
-                task_name=args.task_name,
-                seed=args.seed+84,
-                episode_length=args.episode_length,
-                action_repeat=args.action_repeat,
-                image_size=args.image_size,
-                mode='color_hard',
-                intensity=args.distracting_cs_intensity
-        ) if args.eval_mode is not None else None
-
-
-        test_env3 = make_env(
-                domain_name=args.domain_name,
-                task_name=args.task_name,
-                seed=args.seed+126,
-                episode_length=args.episode_length,
-                action_repeat=args.action_repeat,
-                image_size=args.image_size,
-                mode='video_easy',
-                intensity=args.distracting_cs_intensity
-        ) if args.eval_mode is not None else None
-
-        test_env4 = make_env(
-                domain_name=args.domain_name,
-                task_name=args.task_name,
-                seed=args.seed+168,
-                episode_length=args.episode_length,
-                action_repeat=args.action_repeat,
-                image_size=args.image_size,
-                mode='video_hard',
-                intensity=args.distracting_cs_intensity
-        ) if args.eval_mode is not None else None    
+def run_eval(args, evaluator, eval_envs, agent, video, L, step, episode):
+        """Evaluates (or, in async mode, submits) the agent.
+
+        Returns the time training was blocked and the mean train-mode return,
+        which ranks checkpoints (None in async mode, see log_async_eval).
+        """
+        eval_start_time = time.time()
+        score = None
+        if args.async_eval:
+                evaluator.submit(step, agent.actor, episode)
+        else:
+                L.log('eval/episode', episode, step)
+                if evaluator is not None:
+                        for mode, episode_rewards in evaluator.evaluate(agent.actor, args.eval_episodes).items():
+                                log_eval(args, L, mode, episode_rewards, step)
+                                if mode == 'train':
+                                        score = np.mean(episode_rewards)
+                else:
+                        for mode, envs in eval_envs.items():
+                                mean_reward = evaluate(args, envs, mode, agent, video, args.eval_episodes, L, step, test_env=mode != 'train')
+                                if mode == 'train':
+                                        score = mean_reward
+                L.dump(step)
+        eval_time = time.time() - eval_start_time
+        L.log('train/eval_time', eval_time, step)
+        return eval_time, score
+
+
+def train_with_collectors(args, env, agent, replay_buffer, evaluator, eval_envs, video, L, work_dir, checkpointer):
+        """Learner loop fed by collector processes, returns the time training was blocked on evaluation and the step counters"""
+        pool = CollectorPool(args, agent.actor, env.observation_space.shape, env.action_space.shape)
+        collect_meter, update_meter = ThroughputMeter(), ThroughputMeter()
+        env_steps, num_updates, episode = 0, 0, 0
+        next_eval, next_save = 0, args.save_freq
+        eval_blocked_time, score = 0, None
+        start_time = time.time()
+        while env_steps < args.train_steps or next_eval <= args.train_steps:
+                if checkpointer.preempted:
+                        print('Received SIGTERM, saving checkpoint at step', env_steps)
+                        checkpointer.save(agent, env_steps, counters={'episode': episode}, score=score, args=args)
+                        break
+
+                # Evaluate agent periodically
+                if args.async_eval:
+                        async_score = log_async_eval(args, L, evaluator.poll(), env_steps)
+                        score = async_score if async_score is not None else score
+                if env_steps >= next_eval and next_eval <= args.train_steps:
+                        print('Evaluating:', work_dir)
+                        eval_time, eval_score = run_eval(args, evaluator, eval_envs, agent, video, L, next_eval, episode)
+                        eval_blocked_time += eval_time
+                        score = eval_score if eval_score is not None else score
+                        next_eval += args.eval_freq
+
+                # Save agent periodically
+                if env_steps >= next_save:
+                        checkpointer.save(agent, next_save, counters={'episode': episode}, score=score, args=args)
+                        next_save += args.save_freq
+
+                # Move collected transitions into the replay buffer
+                n = pool.drain(replay_buffer)
+                env_steps += n
+                collect_meter.update(n)
+                episode_rewards = pool.finished_episodes()
+                for episode_reward in episode_rewards:
+                        episode += 1
+                        L.log('train/episode_reward', episode_reward, env_steps)
+                if len(episode_rewards) > 0:
+                        L.log('train/episode', episode, env_steps)
+                        L.log('train/duration', time.time() - start_time, env_steps)
+                        L.log('train/collector_sps', collect_meter.rate(), env_steps)
+                        L.log('train/learner_ups', update_meter.rate(), env_steps)
+                        start_time = time.time()
+                        profiling.timer.log(L, env_steps)
+                        memory.log(L, env_steps)
+                        L.dump(env_steps)
+
+                # Run training updates at the configured update-to-data ratio
+                target_updates = int((env_steps - args.init_steps) * args.utd_ratio) if env_steps >= args.init_steps else 0
+                todo = min(target_updates - num_updates, args.max_updates_per_iter)
+                if todo > 0:
+                        steps = range(args.init_steps + num_updates, args.init_steps + num_updates + todo)
+                        run_updates(args, agent, replay_buffer, L, steps)
+                        if (num_updates + todo) // args.collector_sync_freq > num_updates // args.collector_sync_freq:
+                                pool.sync(agent.actor)
+                        num_updates += todo
+                update_meter.update(max(todo, 0))
+                if n == 0 and todo <= 0:
+                        time.sleep(0.001)
+
+        collected_steps = pool.total_steps
+        pool.close()
+        print('Collected %d steps, ran %d updates' % (env_steps, num_updates))
+        counters = {'env_steps': env_steps, 'collected_steps': collected_steps, 'num_updates': num_updates, 'episode': episode}
+        return eval_blocked_time, counters
+
+
+def train_vectorized(args, env, agent, replay_buffer, evaluator, eval_envs, video, L, work_dir, checkpointer):
+        """Collect/update loop over args.num_envs subprocess environments, returns the time training was blocked on evaluation.
+
+        The envs return stacked observations; replay gets LazyFrames over
+        per-env frame lists instead, so consecutive transitions share frames
+        and each step stores one new frame, as in the serial loop.
+        """
+        vec_env = make_vec_env(args, args.num_envs)
+        n = vec_env.num_envs
+        obs = vec_env.reset()
+        frames = [utils.split_frames(obs[i], args.frame_stack) for i in range(n)]
+        episode_reward, episode_step = np.zeros(n), np.zeros(n, dtype=np.int64)
+        episode_start = np.full(n, time.time())
+        step, episode, num_updates = 0, 0, 0
+        next_eval, next_save = 0, args.save_freq
+        eval_blocked_time, score = 0, None
+        while step < args.train_steps or next_eval <= args.train_steps:
+                if checkpointer.preempted:
+                        print('Received SIGTERM, saving checkpoint at step', step)
+                        checkpointer.save(agent, step, counters={'episode': episode}, score=score, args=args)
+                        break
+
+                # Evaluate agent periodically
+                if args.async_eval:
+                        async_score = log_async_eval(args, L, evaluator.poll(), step)
+                        score = async_score if async_score is not None else score
+                if step >= next_eval and next_eval <= args.train_steps:
+                        print('Evaluating:', work_dir)
+                        eval_time, eval_score = run_eval(args, evaluator, eval_envs, agent, video, L, next_eval, episode)
+                        eval_blocked_time += eval_time
+                        score = eval_score if eval_score is not None else score
+                        next_eval += args.eval_freq
+                        if step >= args.train_steps:
+                                continue
+
+                # Save agent periodically
+                if step >= next_save:
+                        checkpointer.save(agent, next_save, counters={'episode': episode}, score=score, args=args)
+                        next_save += args.save_freq
+
+                # Sample actions for data collection
+                if step < args.init_steps:
+                        action = vec_env.sample_actions()
+                else:
+                        with utils.eval_mode(agent):
+                                action = agent.sample_actions(obs)
 
+                # Run training updates
+                if step >= args.init_steps:
+                        target_updates = int((step - args.init_steps + n) * args.utd_ratio)
+                        if num_updates == 0:
+                                target_updates += args.init_steps
+                        if num_updates < target_updates:
+                                run_updates(args, agent, replay_buffer, L, [step] * (target_updates - num_updates))
+                                num_updates = target_updates
 
+                # Take step
+                next_obs, reward, done, _ = vec_env.step(action)
+                for i in range(n):
+                        done_bool = 0 if episode_step[i] + 1 == vec_env._max_episode_steps else float(done[i])
+                        next_frames = frames[i][1:] + [next_obs[i, -3:].copy()]
+                        replay_buffer.add(utils.LazyFrames(frames[i]), action[i], reward[i], utils.LazyFrames(next_frames), done_bool)
+                        frames[i] = next_frames
+                episode_reward += reward
+                episode_step += 1
+                step += n
+                obs = next_obs
 
-        # Create working directory
-        work_dir = os.path.join(args.log_dir, args.domain_name+'_'+args.task_name, args.algorithm, str(args.seed)+'_'+args.tag)
-        print('Working directory:', work_dir)
-        if os.path.exists(work_dir):
-            delete_option = input('working dir already exists, delete it? y or n :')
-            if 'y' == delete_option:
-                import shutil
-                shutil.rmtree(work_dir)
-            else:
-                assert os.path.exists(os.path.join(work_dir, 'train.log')), 'specified working directory already exists'
-        if not os.path.exists(work_dir):
-                utils.make_dir(work_dir)
-        model_dir = utils.make_dir(os.path.join(work_dir, 'model'))
-        video_dir = utils.make_dir(os.path.join(work_dir, 'video'))
-        video = VideoRecorder(video_dir if args.save_video else None, height=448, width=448)
-        # utils.write_info(args, os.path.join(work_dir, 'info.log'))
+                # Per-environment episode bookkeeping
+                if done.any():
+                        idxs = np.flatnonzero(done)
+                        for i in idxs:
+                                episode += 1
+                                L.log('train/episode_reward', episode_reward[i], step)
+                                L.log('train/duration', time.time() - episode_start[i], step)
+                                episode_reward[i], episode_step[i], episode_start[i] = 0, 0, time.time()
+                        L.log('train/episode', episode, step)
+                        profiling.timer.log(L, step)
+                        memory.log(L, step)
+                        L.dump(step)
+                        obs = next_obs.copy()
+                        obs[idxs] = vec_env.reset(idxs)[idxs]
+                        for i in idxs:
+                                frames[i] = utils.split_frames(obs[i], args.frame_stack)
+
+        vec_env.close()
+        return eval_blocked_time
+
+
+def env_step(env, action, acting_actor=None, agent=None):
+        """Steps the environment and, given an acting actor, already samples the next action.
+
+        Used by the overlapped loop (--overlap_env_step), where this runs on a
+        worker thread while the learner updates; MuJoCo and torch both release
+        the GIL. Overlapping env.step alone is exact: the update does not read
+        the pending transition in the serial loop either. With --policy_lag the
+        next action is also sampled here, from a copy of the actor that is
+        synced after every update, so it comes from the weights one update
+        behind the serial loop.
+        """
+        start_time = time.time()
+        with profiling.phase('env_step'):
+                next_obs, reward, done, _ = env.step(action)
+        next_action = None
+        if acting_actor is not None and not done:
+                with torch.no_grad():
+                        _, pi, _, _ = acting_actor(agent._obs_to_input(next_obs), compute_log_pi=False)
+                next_action = pi.cpu().data.numpy().flatten()
+        return next_obs, reward, done, time.time() - start_time, next_action
+
+
+def run_updates(args, agent, replay_buffer, L, steps):
+        """Runs one update per entry of steps, gathering the batches of up to --update_chunk updates at once"""
+        steps = list(steps)
+        for i in range(0, len(steps), args.update_chunk):
+                chunk = steps[i:i + args.update_chunk]
+                batches = replay_buffer.prefetch(len(chunk)) if len(chunk) > 1 else replay_buffer
+                for step in chunk:
+                        agent.update(batches, L, step)
+
+
+def warmup_replay(env, agent, replay_buffer, num_steps):
+        """Refills an empty replay buffer with the current policy after resuming, without counting steps"""
+        done = True
+        for _ in range(num_steps):
+                if done:
+                        obs, episode_step = env.reset(), 0
+                with utils.eval_mode(agent):
+                        action = agent.sample_action(obs)
+                next_obs, reward, done, _ = env.step(action)
+                done_bool = 0 if episode_step + 1 == env._max_episode_steps else float(done)
+                replay_buffer.add(obs, action, reward, next_obs, done_bool)
+                obs = next_obs
+                episode_step += 1
 
-        #rint(torch.cuda.is_available())
-        # Prepare agent
-        assert torch.cuda.is_available(), 'must have cuda enabled'
-        replay_buffer = utils.ReplayBuffer(
-                obs_shape=env.observation_space.shape,
-                action_shape=env.action_space.shape,
-                capacity=args.train_steps,
-                batch_size=args.batch_size,
-                args = args
-        )
-        cropped_obs_shape = (3*args.frame_stack, args.image_crop_size, args.image_crop_size)
-        print('Observations:', env.observation_space.shape)
-        print('Cropped observations:', cropped_obs_shape)
-        agent = make_agent(
-                obs_shape=cropped_obs_shape,
-                action_shape=env.action_space.shape,
-                args=args
-        )
 
+def train_serial(args, env, agent, replay_buffer, evaluator, eval_envs, video, L, work_dir, checkpointer, resume_state=None):
+        """Single-threaded collect/update loop, returns the time training was blocked on evaluation"""
         start_step, episode, episode_reward, done = 0, 0, 0, True
-        L = Logger(work_dir)
+        resumed = resume_state is not None
+        if resumed:
+                start_step, episode = resume_state['counters']['step'], resume_state['counters']['episode']
+                warmup_replay(env, agent, replay_buffer, args.init_steps)
+                checkpoint.set_rng_state(resume_state['rng'])
+                print('Resuming from step', start_step)
+        eval_blocked_time, score = 0, None
+        executor = ThreadPoolExecutor(max_workers=1) if args.overlap_env_step else None
+        acting_actor = deepcopy(agent.actor) if args.overlap_env_step and args.policy_lag else None
+        next_action = None
         start_time = time.time()
         for step in range(start_step, args.train_steps+1):
+                profiling.timer.step(step)
+                if checkpointer.preempted:
+                        print('Received SIGTERM, saving checkpoint at step', step)
+                        checkpointer.save(agent, step, counters={'step': step, 'episode': episode}, score=score, args=args)
+                        break
+
                 if done:
                         if step > start_step:
-                                L.log('train/duration', time.time() - start_time, step)
-                                start_time = time.time()
-                                L.dump(step)
+                                with profiling.phase('logging'):
+                                        L.log('train/duration', time.time() - start_time, step)
+                                        L.log('train/sps', episode_step / (time.time() - start_time), step)
+                                        profiling.timer.log(L, step)
+                                        memory.log(L, step)
+                                        start_time = time.time()
+                                        L.dump(step)
 
                         # Evaluate agent periodically
-                        if step % args.eval_freq == 0 :
+                        if args.async_eval:
+                                async_score = log_async_eval(args, L, evaluator.poll(), step)
+                                score = async_score if async_score is not None else score
+                        if step % args.eval_freq == 0 and not (resumed and step == start_step):
                                 print('Evaluating:', work_dir)
-                                L.log('eval/episode', episode, step)
-                                mode='train'
-                                evaluate(env,mode, agent, video, args.eval_episodes, L, step)
-                                if test_env is not None:
-                                        mode='color_easy'
-                                        evaluate(test_env,mode, agent, video, args.eval_episodes, L, step, test_env=True)
-                                        mode='color_hard'
-                                        evaluate(test_env2,mode, agent, video, args.eval_episodes, L, step, test_env=True)
-                                        mode='video_easy'
-                                        evaluate(test_env3,mode, agent, video, args.eval_episodes, L, step, test_env=True)
-                                        mode='video_hard'
-                                        evaluate(test_env4,mode, agent, video, args.eval_episodes, L, step, test_env=True)
-                                L.dump(step)
+                                eval_time, eval_score = run_eval(args, evaluator, eval_envs, agent, video, L, step, episode)
+                                eval_blocked_time += eval_time
+                                score = eval_score if eval_score is not None else score
 
                         # Save agent periodically
                         if step > start_step and step % args.save_freq == 0:
-                              torch.save(agent, os.path.join(model_dir, f'{step}.pt'))
+                                checkpointer.save(agent, step, counters={'step': step, 'episode': episode}, score=score, args=args)
 
-                        L.log('train/episode_reward', episode_reward, step)
+                        if not (resumed and step == start_step):
+                                L.log('train/episode_reward', episode_reward, step)
 
                         obs = env.reset()
 
@@ -185,26 +350,199 @@ def main(args):
                 # Sample action for data collection
                 if step < args.init_steps:
                         action = env.action_space.sample()
+                elif next_action is not None:
+                        action, next_action = next_action, None
                 else:
-                        with utils.eval_mode(agent):
-
+                        with utils.eval_mode(agent), profiling.phase('act'):
                                 action = agent.sample_action(obs)
 
+                # Take step, on the worker thread while the update runs if overlapping
+                if executor is not None:
+                        future = executor.submit(env_step, env, action, acting_actor if step + 1 >= args.init_steps else None, agent)
+
                 # Run training update
+                update_start_time = time.time()
                 if step >= args.init_steps:
-                        num_updates = args.init_steps if step == args.init_steps else 1
-                        for _ in range(num_updates):
-                                agent.update(replay_buffer, L, step)
-
-                # Take step
-                next_obs, reward, done, _ = env.step(action)
+                        if step == args.init_steps:
+                                num_updates = args.init_steps
+                        else:
+                                num_updates = int((step - args.init_steps + 1) * args.utd_ratio) - int((step - args.init_steps) * args.utd_ratio)
+                        run_updates(args, agent, replay_buffer, L, [step] * num_updates)
+                L.log('train/update_time', time.time() - update_start_time, step)
+
+                if executor is not None:
+                        wait_start_time = time.time()
+                        next_obs, reward, done, env_time, next_action = future.result()
+                        L.log('train/wait_time', time.time() - wait_start_time, step)
+                        if acting_actor is not None and step >= args.init_steps:
+                                acting_actor.load_state_dict(agent.actor.state_dict())
+                else:
+                        next_obs, reward, done, env_time, _ = env_step(env, action)
+                L.log('train/env_time', env_time, step)
                 done_bool = 0 if episode_step + 1 == env._max_episode_steps else float(done)
-                replay_buffer.add(obs, action, reward, next_obs, done_bool)
+                with profiling.phase('replay_add'):
+                        replay_buffer.add(obs, action, reward, next_obs, done_bool)
                 episode_reward += reward
                 obs = next_obs
 
                 episode_step += 1
 
+        if executor is not None:
+                executor.shutdown()
+        return eval_blocked_time
+
+
+def replay_capacity(args, env, buffer_cls):
+        """One transition per training step, or as many as fit in --replay_budget"""
+        if args.replay_budget is None:
+                return args.train_steps
+        capacity = buffer_cls.capacity_for_budget(args.replay_budget, env.observation_space.shape, env.action_space.shape, args.train_steps)
+        print('Replay capacity: %d transitions (%.1f GB budget)' % (capacity, args.replay_budget / 2**30))
+        return capacity
+
+
+def main(args):
+        # Set seed
+        utils.set_seed_everywhere(args.seed)
+
+        # Initialize environments
+        gym.logger.set_level(40)
+        env = make_env(
+                domain_name=args.domain_name,
+                task_name=args.task_name,
+                seed=args.seed,
+                episode_length=args.episode_length,
+                action_repeat=args.action_repeat,
+                image_size=args.image_size,
+                mode='train'
+        )
+        if args.dry_run:
+                utils.setup_device(args)
+                memory.dry_run(args, env, replay_capacity(args, env, utils.ReplayBuffer))
+                return
+
+
+        if args.parallel_eval or args.async_eval:
+                eval_envs = None
+        else:
+                eval_envs = evaluation.make_eval_envs(args, train_env=env)
+
+
+
+        # Create working directory
+        work_dir = os.path.join(args.log_dir, args.domain_name+'_'+args.task_name, args.algorithm, str(args.seed)+'_'+args.tag)
+        print('Working directory:', work_dir)
+        if os.path.exists(work_dir) and not args.resume:
+            if args.overwrite:
+                delete_option = 'y'
+            elif sys.stdin.isatty():
+                delete_option = input('working dir already exists, delete it? y or n :')
+            else:
+                delete_option = 'n'
+            if 'y' == delete_option:
+                import shutil
+                shutil.rmtree(work_dir)
+            else:
+                assert os.path.exists(os.path.join(work_dir, 'train.log')), 'specified working directory already exists'
+        if not os.path.exists(work_dir):
+                utils.make_dir(work_dir)
+        model_dir = utils.make_dir(os.path.join(work_dir, 'model'))
+        video_dir = utils.make_dir(os.path.join(work_dir, 'video'))
+        video = VideoRecorder(video_dir if args.save_video else None, height=args.video_size, width=args.video_size, stride=args.video_stride)
+        # utils.write_info(args, os.path.join(work_dir, 'info.log'))
+
+        #rint(torch.cuda.is_available())
+        # Prepare agent
+        utils.setup_device(args)
+        cropped_obs_shape = (3*args.frame_stack, args.image_crop_size, args.image_crop_size)
+        print('Observations:', env.observation_space.shape)
+        print('Cropped observations:', cropped_obs_shape)
+        if args.num_learners > 1:
+                assert args.num_collectors == 0 and args.num_envs == 1, 'data-parallel learning is only supported by the serial loop'
+                learner_args = distributed.shard_args(args, args.num_learners)
+                replay_buffer = SharedReplayBuffer(
+                        obs_shape=env.observation_space.shape,
+                        action_shape=env.action_space.shape,
+                        capacity=replay_capacity(args, env, SharedReplayBuffer),
+                        batch_size=learner_args.batch_size,
+                        args=learner_args
+                )
+                agent = distributed.DataParallelLearner(learner_args, cropped_obs_shape, env.action_space.shape, replay_buffer)
+        else:
+                replay_buffer = utils.ReplayBuffer(
+                        obs_shape=env.observation_space.shape,
+                        action_shape=env.action_space.shape,
+                        capacity=replay_capacity(args, env, utils.ReplayBuffer),
+                        batch_size=args.batch_size,
+                        args = args
+                )
+                agent = make_agent(
+                        obs_shape=cropped_obs_shape,
+                        action_shape=env.action_space.shape,
+                        args=args
+                )
+
+        if args.async_eval:
+                evaluator = evaluation.AsyncEvaluator(
+                        args, agent.actor, args.eval_episodes,
+                        max_pending=args.eval_max_pending,
+                        policy=args.eval_queue_policy
+                )
+        elif args.parallel_eval:
+                evaluator = evaluation.ParallelEvaluator(args, agent.actor)
+        else:
+                evaluator = None
+
+        checkpointer = checkpoint.Checkpointer(model_dir, keep=args.keep_checkpoints)
+        checkpointer.install_sigterm_handler()
+        resume_state = None
+        if args.resume:
+                assert args.num_collectors == 0 and args.num_envs == 1, 'resuming is only supported by the serial loop'
+                path = checkpointer.latest()
+                if path is not None:
+                        print('Loading checkpoint', path)
+                        resume_state = checkpoint.load_checkpoint(path, map_location=agent.device)
+                        agent.load_state_dict(resume_state['agent'])
+
+        L = Logger(work_dir, log_format=args.log_format, async_write=not args.sync_log)
+        if args.track_memory and args.overlap_env_step:
+                # the CUDA allocator keeps one peak per process, which two threads of phases would reset under each other
+                print('Warning: --track_memory is not supported with --overlap_env_step, per-phase peaks are disabled')
+        profiling.timer.configure(
+                enabled=not args.no_phase_timers,
+                sync_cuda=args.profile_sync,
+                track_memory=args.track_memory and not args.overlap_env_step,
+                trace_range=args.trace_steps,
+                trace_format=args.trace_format,
+                trace_path=os.path.join(work_dir, 'trace.json')
+        )
+        profiling.instrument(agent, replay_buffer)
+        if args.param_stats_freq > 0:
+                ParamStatsSampler({'actor': agent.actor, 'critic': agent.critic}, args.param_stats_freq).instrument(agent)
+        memory_report = memory.run_report(replay_buffer, agent)
+        memory.save_report(memory_report, os.path.join(work_dir, 'memory.json'))
+        print(memory.format_report(memory_report))
+        if not args.no_phase_timers:
+                print('Phase timer overhead: %.2f us per phase' % (profiling.measure_overhead() * 1e6))
+        if args.num_collectors > 0:
+                eval_blocked_time, _ = train_with_collectors(args, env, agent, replay_buffer, evaluator, eval_envs, video, L, work_dir, checkpointer)
+        elif args.num_envs > 1:
+                eval_blocked_time = train_vectorized(args, env, agent, replay_buffer, evaluator, eval_envs, video, L, work_dir, checkpointer)
+        else:
+                eval_blocked_time = train_serial(args, env, agent, replay_buffer, evaluator, eval_envs, video, L, work_dir, checkpointer, resume_state)
+
+        if args.async_eval:
+                log_async_eval(args, L, evaluator.close(), args.train_steps)
+                print('Dropped eval snapshots:', evaluator.dropped)
+        elif evaluator is not None:
+                evaluator.close()
+        print('Training blocked on evaluation for %.1f s' % eval_blocked_time)
+        profiling.timer.close_trace()
+        checkpointer.close()
+        if args.num_learners > 1:
+                agent.close()
+        video.close()
+        L.close()
         print('Completed training for', work_dir)
 
 
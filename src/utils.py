@@ -4,9 +4,11 @@ import os
 import glob
 import json
 import random
+import sys
 import augmentations
 import subprocess
 from datetime import datetime
+from functools import partial
 
 
 class eval_mode(object):
@@ -44,6 +46,39 @@ def set_seed_everywhere(seed):
 	random.seed(seed)
 
 
+def get_device(args=None):
+	"""Device selected by --device, 'auto' picks cuda:<gpu> when available and cpu otherwise"""
+	device = getattr(args, 'device', 'auto')
+	if device == 'auto':
+		device = 'cuda' if torch.cuda.is_available() else 'cpu'
+	if device == 'cuda':
+		return torch.device('cuda:{}'.format(getattr(args, 'gpu', 0)))
+	return torch.device(device)
+
+
+def use_channels_last(args):
+	"""Whether to run the shared encoder in NHWC layout, by default only on cpu"""
+	mode = getattr(args, 'channels_last', 'auto')
+	return mode == 'on' or (mode == 'auto' and get_device(args).type == 'cpu')
+
+
+def setup_device(args):
+	"""Resolves the device and configures the CPU backend threads, returns the device"""
+	device = get_device(args)
+	if device.type == 'cpu':
+		if args.cpu_threads > 0:
+			torch.set_num_threads(args.cpu_threads)
+		if args.cpu_interop_threads > 0:
+			try:
+				torch.set_num_interop_threads(args.cpu_interop_threads)
+			except RuntimeError:
+				# can only be set once, before any inter-op parallel work has started
+				print('Warning: could not set inter-op threads')
+		torch.backends.mkldnn.enabled = True
+	print(f'Device: {device} (intra-op threads: {torch.get_num_threads()}, inter-op threads: {torch.get_num_interop_threads()})')
+	return device
+
+
 def write_info(args, fp):
 	data = {
 		'timestamp': str(datetime.now()),
@@ -88,34 +123,82 @@ def prefill_memory(obses, capacity, obs_shape):
 	return obses
 
 
+def lazy_frames_overhead(frame_stack):
+	"""Bytes of the Python objects around one stored transition: a frame header and two LazyFrames in a tuple"""
+	frame = np.empty((3, 1, 1), dtype=np.uint8)
+	obs, next_obs = LazyFrames([frame] * frame_stack), LazyFrames([frame] * frame_stack)
+	nbytes = sys.getsizeof((obs, next_obs)) + sys.getsizeof(frame) - frame.nbytes
+	for lazy in (obs, next_obs):
+		nbytes += sys.getsizeof(lazy) + sys.getsizeof(lazy.__dict__) + sys.getsizeof(lazy.frames)
+	return nbytes
+
+
 class ReplayBuffer(object):
-	"""Buffer to store environment transitions"""
-	def __init__(self, obs_shape, action_shape, capacity, batch_size, args, prefill=True):
+	"""Buffer to store environment transitions.
+
+	Storage grows in chunks of chunk_size transitions as they are added, and
+	once capacity transitions are stored the oldest ones are overwritten
+	first. Use capacity_for_budget to derive the capacity from a byte budget.
+	"""
+	chunk_size = 65536
+
+	def __init__(self, obs_shape, action_shape, capacity, batch_size, args, prefill=False):
 		self.capacity = capacity
 		self.batch_size = batch_size
 
 		self._obses = []
 		if prefill:
 			self._obses = prefill_memory(self._obses, capacity, obs_shape)
-		self.actions = np.empty((capacity, *action_shape), dtype=np.float32)
-		self.rewards = np.empty((capacity, 1), dtype=np.float32)
-		self.not_dones = np.empty((capacity, 1), dtype=np.float32)
+		size = capacity if prefill else min(capacity, self.chunk_size)
+		self.actions = np.empty((size, *action_shape), dtype=np.float32)
+		self.rewards = np.empty((size, 1), dtype=np.float32)
+		self.not_dones = np.empty((size, 1), dtype=np.float32)
 
 		self.idx = 0
 		self.full = False
+		self.num_added = 0
 		self.args=args
+		self.device = get_device(args)
+
+	@classmethod
+	def transition_bytes(cls, obs_shape, action_shape):
+		"""Bytes one transition adds once the buffer is full: one new frame, its objects and a row of each column"""
+		c,h,w = obs_shape
+		return 3*h*w + lazy_frames_overhead(c // 3) + 4*(int(np.prod(action_shape)) + 2)
+
+	@classmethod
+	def capacity_for_budget(cls, budget, obs_shape, action_shape, max_capacity):
+		return max(1, min(max_capacity, int(budget // cls.transition_bytes(obs_shape, action_shape))))
+
+	def _grow(self):
+		"""Extends the storage by one chunk, up to capacity"""
+		size = min(self.capacity, len(self.actions) + self.chunk_size)
+		for name in ['actions', 'rewards', 'not_dones']:
+			column = getattr(self, name)
+			grown = np.empty((size, *column.shape[1:]), dtype=column.dtype)
+			grown[:len(column)] = column
+			setattr(self, name, grown)
+
 	def add(self, obs, action, reward, next_obs, done):
 		obses = (obs, next_obs)
 		if self.idx >= len(self._obses):
 			self._obses.append(obses)
 		else:
 			self._obses[self.idx] = (obses)
+		if self.idx >= len(self.actions):
+			self._grow()
 		np.copyto(self.actions[self.idx], action)
 		np.copyto(self.rewards[self.idx], reward)
 		np.copyto(self.not_dones[self.idx], not done)
 
 		self.idx = (self.idx + 1) % self.capacity
 		self.full = self.full or self.idx == 0
+		self.num_added += 1
+
+	def transition_ids(self, idxs):
+		"""Number of transitions added before the ones in slots idxs, which tells apart the transitions that share a slot"""
+		idxs = np.asarray(idxs)
+		return self.num_added - self.idx + idxs - np.where(idxs >= self.idx, self.capacity, 0)
 
 	def _get_idxs(self, n=None):
 		if n is None:
@@ -132,79 +215,122 @@ class ReplayBuffer(object):
 			next_obses.append(np.array(next_obs, copy=False))
 		return np.array(obses), np.array(next_obses)
 
-	def sample_soda(self, n=None):
-		idxs = self._get_idxs(n)
-		obs, _ = self._encode_obses(idxs)
-		return torch.as_tensor(obs).to(torch.device("cuda:{}".format(self.args.gpu))).float()
-
-	def sample_drq(self, n=None, pad=4):
-		idxs = self._get_idxs(n)
-
+	def _gather(self, idxs):
+		"""Transitions idxs as tensors on the device, observations as uint8, and the ids of the transitions read"""
 		obs, next_obs = self._encode_obses(idxs)
-		obs = torch.as_tensor(obs).to(torch.device("cuda:{}".format(self.args.gpu))).float()
-		next_obs = torch.as_tensor(next_obs).to(torch.device("cuda:{}".format(self.args.gpu))).float()
-		actions = torch.as_tensor(self.actions[idxs]).to(torch.device("cuda:{}".format(self.args.gpu)))
-		rewards = torch.as_tensor(self.rewards[idxs]).to(torch.device("cuda:{}".format(self.args.gpu)))
-		not_dones = torch.as_tensor(self.not_dones[idxs]).to(torch.device("cuda:{}".format(self.args.gpu)))
-
-		obs = augmentations.random_shift(obs, self.args,pad)
-		next_obs = augmentations.random_shift(next_obs,self.args, pad)
-
+		obs = torch.as_tensor(obs).to(self.device)
+		next_obs = torch.as_tensor(next_obs).to(self.device)
+		actions = torch.as_tensor(self.actions[idxs]).to(self.device)
+		rewards = torch.as_tensor(self.rewards[idxs]).to(self.device)
+		not_dones = torch.as_tensor(self.not_dones[idxs]).to(self.device)
+		return (obs, actions, rewards, next_obs, not_dones), self.transition_ids(idxs)
+
+	def _take(self, n=None):
+		"""A batch of transitions on the device, observations still uint8"""
+		batch, self.last_ids = self._gather(self._get_idxs(n))
+		return batch
+
+	def prefetch(self, num_batches):
+		"""Batches for num_batches updates, gathered and moved to the device at once"""
+		return PrefetchedBatches(self, num_batches)
+
+	def _normalize(self, batch):
+		"""Converts the observations of a batch to float in [0,1], on the device"""
+		obs, actions, rewards, next_obs, not_dones = batch
+		return augmentations.to_unit_range(obs), actions, rewards, augmentations.to_unit_range(next_obs), not_dones
+
+	def _augment(self, batch, obs_aug=None, next_obs_aug=None):
+		obs, actions, rewards, next_obs, not_dones = batch
+		if obs_aug is not None:
+			obs = obs_aug(obs, self.args)
+		if next_obs_aug is not None:
+			next_obs = next_obs_aug(next_obs, self.args)
 		return obs, actions, rewards, next_obs, not_dones
 
-	def sample_svea(self, n=None, pad=4):
-		idxs = self._get_idxs(n)
+	def sample_batch(self, n=None, obs_aug=None, next_obs_aug=None):
+		"""The sampling pipeline: take a uint8 batch to the device, normalize it once, then augment obs and next_obs"""
+		return self._augment(self._normalize(self._take(n)), obs_aug, next_obs_aug)
 
-		obs, next_obs = self._encode_obses(idxs)
-		obs = torch.as_tensor(obs).to(torch.device("cuda:{}".format(self.args.gpu))).float()
-		next_obs = torch.as_tensor(next_obs).to(torch.device("cuda:{}".format(self.args.gpu))).float()
-		actions = torch.as_tensor(self.actions[idxs]).to(torch.device("cuda:{}".format(self.args.gpu)))
-		rewards = torch.as_tensor(self.rewards[idxs]).to(torch.device("cuda:{}".format(self.args.gpu)))
-		not_dones = torch.as_tensor(self.not_dones[idxs]).to(torch.device("cuda:{}".format(self.args.gpu)))
+	def sample_soda(self, n=None):
+		obs, _, _, _, _ = self._take(n)
+		return augmentations.to_unit_range(obs)
 
-		obs = augmentations.random_shift(obs, self.args,pad)
+	def sample_drq(self, n=None, pad=4):
+		shift = partial(augmentations.random_shift, pad=pad)
+		return self.sample_batch(n, shift, shift)
 
-		return obs, actions, rewards, next_obs, not_dones
+	def sample_svea(self, n=None, pad=4):
+		return self.sample_batch(n, partial(augmentations.random_shift, pad=pad))
 
 	def sample(self, n=None):
-		idxs = self._get_idxs(n)
-
-		obs, next_obs = self._encode_obses(idxs)
-		obs = torch.as_tensor(obs).to(torch.device("cuda:{}".format(self.args.gpu))).float()
-		next_obs = torch.as_tensor(next_obs).to(torch.device("cuda:{}".format(self.args.gpu))).float()
-		actions = torch.as_tensor(self.actions[idxs]).to(torch.device("cuda:{}".format(self.args.gpu)))
-		rewards = torch.as_tensor(self.rewards[idxs]).to(torch.device("cuda:{}".format(self.args.gpu)))
-		not_dones = torch.as_tensor(self.not_dones[idxs]).to(torch.device("cuda:{}".format(self.args.gpu)))
-
-		obs = augmentations.random_crop(obs,self.args)
-		next_obs = augmentations.random_crop(next_obs,self.args)
-
-		return obs, actions, rewards, next_obs, not_dones
+		return self.sample_batch(n, augmentations.random_crop, augmentations.random_crop)
 
 	def sample_sac(self, n=None):
-		idxs = self._get_idxs(n)
-
-		obs, next_obs = self._encode_obses(idxs)
-		obs = torch.as_tensor(obs).to(torch.device("cuda:{}".format(self.args.gpu))).float()
-		next_obs = torch.as_tensor(next_obs).to(torch.device("cuda:{}".format(self.args.gpu))).float()
-		actions = torch.as_tensor(self.actions[idxs]).to(torch.device("cuda:{}".format(self.args.gpu)))
-		rewards = torch.as_tensor(self.rewards[idxs]).to(torch.device("cuda:{}".format(self.args.gpu)))
-		not_dones = torch.as_tensor(self.not_dones[idxs]).to(torch.device("cuda:{}".format(self.args.gpu)))
-
+		return self.sample_batch(n)
+
+
+class PrefetchedBatches(ReplayBuffer):
+	"""Serves the sample methods of a replay buffer from one gather of num_batches batches.
+
+	Updates take consecutive slices of the gathered transitions, which stay on
+	the device; when an update samples more than one batch (e.g. the mixing
+	augmentations, or SODA's auxiliary batch) and the gather runs out, the
+	next one is drawn the same way.
+	"""
+	def __init__(self, replay_buffer, num_batches):
+		self.replay_buffer = replay_buffer
+		self.num_batches = num_batches
+		self.batch_size = replay_buffer.batch_size
+		self.args = replay_buffer.args
+		self.device = replay_buffer.device
+		self._batches = None
+		self._pos = 0
+
+	def _take(self, n=None):
+		if n is None:
+			n = self.batch_size
+		if self._batches is None or self._pos + n > len(self._batches[0]):
+			size = max(n, self.num_batches * self.batch_size)
+			self._batches, self._ids = self.replay_buffer._gather(self.replay_buffer._get_idxs(size))
+			self._pos = 0
+		obs, actions, rewards, next_obs, not_dones = [x[self._pos:self._pos + n] for x in self._batches]
+		self.last_ids = self._ids[self._pos:self._pos + n]
+		self._pos += n
 		return obs, actions, rewards, next_obs, not_dones
 
 
 class LazyFrames(object):
-	def __init__(self, frames, extremely_lazy=True):
+	"""Stack of frames that is only concatenated when read.
+
+	Observations produced through a FrameStackRing are read from the ring for
+	as long as they are its current stack: in place by tensor() when acting,
+	as a copy by np.asarray; once the ring has moved on (e.g. when sampled
+	from replay) their frames are concatenated.
+	"""
+	def __init__(self, frames, extremely_lazy=True, ring=None):
 		self._frames = frames
 		self._extremely_lazy = extremely_lazy
 		self._out = None
+		self._ring = ring
+		self._version = ring.version if ring is not None else None
+
+	def __getstate__(self):
+		state = self.__dict__.copy()
+		state['_ring'] = None
+		return state
 
 	@property
 	def frames(self):
 		return self._frames
 
 	def _force(self):
+		if self._ring is not None:
+			if self._ring.version == self._version:
+				# the env thread may push meanwhile (--overlap_env_step), so copy and check again
+				out = self._ring.stack.copy()
+				if self._ring.version == self._version:
+					return out
+			self._ring = None
 		if self._extremely_lazy:
 			return np.concatenate(self._frames, axis=0)
 		if self._out is None:
@@ -212,6 +338,16 @@ class LazyFrames(object):
 			self._frames = None
 		return self._out
 
+	def tensor(self, device):
+		"""The stack as a uint8 tensor on device, read in place from the ring while it is the ring's current stack.
+		On the cpu that tensor is the ring's memory, so it must be used before the env steps again."""
+		ring = self._ring
+		if ring is not None and ring.version == self._version:
+			out = ring.tensor().to(device)
+			if ring.version == self._version:
+				return out
+		return torch.as_tensor(np.asarray(self), device=device)
+
 	def __array__(self, dtype=None):
 		out = self._force()
 		if dtype is not None:
@@ -227,13 +363,71 @@ class LazyFrames(object):
 		return self._force()[i]
 
 	def count(self):
-		if self.extremely_lazy:
+		if self._frames is not None:
 			return len(self._frames)
-		frames = self._force()
-		return frames.shape[0]//3
+		return self._out.shape[0]//3
 
 	def frame(self, i):
-		return self._force()[i*3:(i+1)*3]
+		if self._frames is not None:
+			return self._frames[i]
+		return self._out[i*3:(i+1)*3]
+
+
+def split_frames(obs, frame_stack):
+	"""Copies of the frames of a stacked observation, a stack of one repeated frame (after a reset) shares a single copy"""
+	frames = list(obs.reshape(frame_stack, 3, *obs.shape[1:]))
+	if all(np.array_equal(frame, frames[-1]) for frame in frames[:-1]):
+		return [frames[-1].copy()] * frame_stack
+	return [frame.copy() for frame in frames]
+
+
+class FrameStackRing(object):
+	"""The last frame_stack frames of an episode in one preallocated array.
+
+	Every frame is written twice, at slot p and p + frame_stack of a buffer of
+	2 * frame_stack frames, so the current stack is always the contiguous
+	slice that ends at the second copy of the newest frame. Pushing a frame
+	copies it twice and allocates nothing; the stack is a view that is valid
+	until the next push starts (version counts the pushes and is bumped before
+	a push writes). LazyFrames read it seqlock style: read the view, then
+	check that the version has not moved, and otherwise concatenate their
+	frames.
+	"""
+	def __init__(self, frame_shape, frame_stack):
+		self.frame_stack = frame_stack
+		self._buffer = np.zeros((2*frame_stack, *frame_shape), dtype=np.uint8)
+		self._views = [
+			self._buffer[p + 1:p + 1 + frame_stack].reshape(-1, *frame_shape[1:]) for p in range(frame_stack)
+		]
+		self._tensors = [torch.from_numpy(view) for view in self._views]
+		self._frames = []
+		self._pos = 0
+		self.version = 0
+		self.stack = self._views[self._pos]
+
+	def reset(self, frame):
+		self._frames = []
+		for _ in range(self.frame_stack):
+			self.push(frame)
+		return self.lazy_frames()
+
+	def push(self, frame):
+		# invalidate the current stack before any of it is overwritten
+		self.version += 1
+		self._pos = (self._pos + 1) % self.frame_stack
+		self._buffer[self._pos] = frame
+		self._buffer[self._pos + self.frame_stack] = frame
+		self._frames = (self._frames + [frame])[-self.frame_stack:]
+		self.stack = self._views[self._pos]
+		return self.lazy_frames()
+
+	def lazy_frames(self):
+		"""The current stack as LazyFrames, which keep the pushed frames for replay"""
+		return LazyFrames(self._frames, ring=self)
+
+	def tensor(self):
+		"""The current stack as a uint8 tensor sharing memory with the ring, only valid until the next push"""
+		return self._tensors[self._pos]
 
 
 def count_parameters(net, as_int=False):
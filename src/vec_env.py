@@ -0,0 +1,92 @@
+import numpy as np
+import torch
+import torch.multiprocessing as mp
+from envs import make_env
+
+
+def _vec_env_worker(env_kwargs, index, obs_buf, conn):
+	torch.set_num_threads(1)
+	env = make_env(**env_kwargs)
+	conn.send((env.observation_space, env.action_space, env._max_episode_steps))
+	out = obs_buf[index].numpy()
+	while True:
+		cmd, data = conn.recv()
+		if cmd == 'step':
+			obs, reward, done, _ = env.step(data)
+			out[:] = np.asarray(obs)
+			conn.send((reward, done))
+		elif cmd == 'reset':
+			out[:] = np.asarray(env.reset())
+			conn.send(None)
+		elif cmd == 'sample':
+			conn.send(env.action_space.sample())
+		elif cmd == 'close':
+			break
+	conn.close()
+
+
+class SubprocVecEnv(object):
+	"""Runs N environments in worker processes.
+
+	Observations are written by the workers into one shared (N, C, H, W)
+	uint8 array instead of being pickled, so only actions, rewards and done
+	flags go through the pipes. Environments are not reset automatically:
+	after a step that ends an episode, call reset(idxs) for those envs.
+	"""
+	def __init__(self, env_kwargs_list, obs_shape):
+		ctx = mp.get_context('spawn')
+		self.num_envs = len(env_kwargs_list)
+		self._obs = torch.zeros((self.num_envs, *obs_shape), dtype=torch.uint8).share_memory_()
+		self._conns, self._procs = [], []
+		for i, env_kwargs in enumerate(env_kwargs_list):
+			conn, child_conn = ctx.Pipe()
+			proc = ctx.Process(target=_vec_env_worker, args=(env_kwargs, i, self._obs, child_conn), daemon=True)
+			proc.start()
+			self._conns.append(conn)
+			self._procs.append(proc)
+		self.observation_space, self.action_space, self._max_episode_steps = self._conns[0].recv()
+		for conn in self._conns[1:]:
+			conn.recv()
+
+	def reset(self, idxs=None):
+		"""Resets the given envs (all by default), returns a copy of all current observations"""
+		idxs = range(self.num_envs) if idxs is None else idxs
+		for i in idxs:
+			self._conns[i].send(('reset', None))
+		for i in idxs:
+			self._conns[i].recv()
+		return self._obs.numpy().copy()
+
+	def step(self, actions):
+		for conn, action in zip(self._conns, actions):
+			conn.send(('step', action))
+		results = [conn.recv() for conn in self._conns]
+		rewards = np.array([r for r, _ in results], dtype=np.float32)
+		dones = np.array([d for _, d in results], dtype=bool)
+		return self._obs.numpy().copy(), rewards, dones, {}
+
+	def sample_actions(self):
+		for conn in self._conns:
+			conn.send(('sample', None))
+		return np.stack([conn.recv() for conn in self._conns])
+
+	def close(self):
+		for conn, proc in zip(self._conns, self._procs):
+			if proc.is_alive():
+				conn.send(('close', None))
+			proc.join()
+
+
+def make_vec_env(args, num_envs, mode='train'):
+	"""Creates num_envs copies of the training environment, env i seeded with args.seed + i"""
+	return SubprocVecEnv([
+		dict(
+			domain_name=args.domain_name,
+			task_name=args.task_name,
+			seed=args.seed + i,
+			episode_length=args.episode_length,
+			action_repeat=args.action_repeat,
+			image_size=args.image_size,
+			mode=mode
+		) for i in range(num_envs)
+	], obs_shape=(3*args.frame_stack, args.image_size, args.image_size))
@@ -1,22 +1,91 @@
 import imageio
 import os
+import queue
+import threading
 
 
 class VideoRecorder(object):
-    def __init__(self, dir_name, height=448, width=448, camera_id=0, fps=25):
+    """Streams rendered frames to an encoder thread.
+
+    Frames go through a bounded queue to a background thread that appends
+    them to the video file as they arrive, so memory use does not grow with
+    episode length and save() does not block on encoding. Only every
+    `stride`-th frame is captured; the output frame rate is scaled to match.
+    An encoding error drops the rest of that recording and is raised from
+    the next save, wait or close.
+    """
+    def __init__(self, dir_name, height=448, width=448, camera_id=0, fps=25, stride=1, max_queue=64):
         self.dir_name = dir_name
         self.height = height
         self.width = width
         self.camera_id = camera_id
         self.fps = fps
-        self.frames = []
+        self.stride = max(stride, 1)
+        self.enabled = False
+        self._count = 0
+        self._episode = 0
+        self._queue = None
+        self._thread = None
+        self._error = None
+        if self.dir_name is not None:
+            self._queue = queue.Queue(maxsize=max_queue)
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        writer, tmp_path = None, None
+        while True:
+            cmd, data = self._queue.get()
+            try:
+                if cmd == 'frame':
+                    if writer is not None:
+                        writer.append_data(data)
+                elif cmd == 'open':
+                    self._discard(writer, tmp_path)
+                    writer, tmp_path = None, data
+                    writer = imageio.get_writer(tmp_path, fps=max(self.fps / self.stride, 1))
+                elif cmd == 'save':
+                    if writer is not None:
+                        writer.close()
+                        writer = None
+                        os.replace(tmp_path, data)
+                elif cmd == 'close':
+                    self._discard(writer, tmp_path)
+                    return
+            except Exception as e:
+                # keep draining so that record() never blocks, drop the rest of this recording
+                self._error = self._error or e
+                self._discard(writer, tmp_path)
+                writer = None
+            finally:
+                self._queue.task_done()
+
+    def _discard(self, writer, tmp_path):
+        try:
+            if writer is not None:
+                writer.close()
+            if tmp_path is not None and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        except Exception as e:
+            self._error = self._error or e
+
+    def _raise_error(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise RuntimeError('recording a video failed') from error
 
     def init(self, enabled=True):
-        self.frames = []
         self.enabled = self.dir_name is not None and enabled
+        self._count = 0
+        if self.enabled:
+            self._episode += 1
+            self._queue.put(('open', os.path.join(self.dir_name, f'.recording_{os.getpid()}_{self._episode}.mp4')))
 
     def record(self, env, mode=None):
         if self.enabled:
+            self._count += 1
+            if (self._count - 1) % self.stride != 0:
+                return
             frame = env.render(
                 mode='rgb_array',
                 height=self.height,
@@ -28,9 +97,22 @@ class VideoRecorder(object):
                 while 'video' not in _env.__class__.__name__.lower():
                     _env = _env.env
                 frame = _env.apply_to(frame)
-            self.frames.append(frame)
+            self._queue.put(('frame', frame))
 
     def save(self, file_name):
+        self._raise_error()
         if self.enabled:
-            path = os.path.join(self.dir_name, file_name)
-            imageio.mimsave(path, self.frames, fps=self.fps)
+            self._queue.put(('save', os.path.join(self.dir_name, file_name)))
+            self.enabled = False
+
+    def wait(self):
+        """Blocks until all queued frames are encoded and saved"""
+        if self._queue is not None:
+            self._queue.join()
+        self._raise_error()
+
+    def close(self):
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(('close', None))
+            self._thread.join()
+        self._raise_error()